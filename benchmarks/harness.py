@@ -0,0 +1,170 @@
+"""
+A small asv-style runner: every benchmark gets a setup run once per
+size and a timed body run repeat times, and everything lands in a
+JSON file that can be diffed against an earlier run.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+from typing import Any, Callable, List, NamedTuple, Optional, TypedDict
+
+import music21
+
+
+class Size(NamedTuple):
+    measures: int
+    parts: int
+    voices: int
+
+    def __str__(self):
+        return f"{self.measures}x{self.parts}x{self.voices}"
+
+
+class Benchmark(NamedTuple):
+    """
+    :param name: Dotted name, used for filtering and in the results.
+    :param run: Timed body, called with whatever setup returned.
+    :param setup: Untimed preparation, called with the size.
+    :param calls: How many operations one run of the body performs,
+    so results can be compared per operation.
+    :param teardown: Called with the setup state after timing.
+    """
+
+    name: str
+    run: Callable[[Any], Any]
+    setup: Callable[[Size], Any]
+    calls: Callable[[Size], int] = lambda _: 1
+    teardown: Optional[Callable[[Any], None]] = None
+
+
+class Result(TypedDict, total=False):
+    name: str
+    size: str
+    measures: int
+    parts: int
+    voices: int
+    calls: int
+    times: List[float]
+    min: float
+    median: float
+    mean: float
+    stdev: float
+    error: str
+
+
+def parse_size(text: str) -> Size:
+    """
+    Parses a size written as measures[xparts[xvoices]].
+
+    :raises ValueError: Raised if the text is not of that form.
+    """
+    values = [int(v) for v in text.lower().split("x")]
+    if not 1 <= len(values) <= 3 or min(values) < 1:
+        raise ValueError(f"Invalid size {text}.")
+    values += [1] * (3 - len(values))
+    return Size(*values)
+
+
+def run_one(b: Benchmark, size: Size, repeat: int) -> Result:
+    """
+    Times a benchmark at one size. Errors are recorded, not raised,
+    so one broken benchmark (say, no synth) doesn't sink the run.
+    """
+    result = Result(
+        name=b.name,
+        size=str(size),
+        measures=size.measures,
+        parts=size.parts,
+        voices=size.voices,
+        calls=b.calls(size),
+    )
+    try:
+        state = b.setup(size)
+    except Exception as e:
+        result["error"] = f"setup: {type(e).__name__}: {e}"
+        return result
+
+    times = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            b.run(state)
+            times.append(time.perf_counter() - start)
+    except Exception as e:
+        traceback.print_exc()
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    finally:
+        if b.teardown is not None:
+            b.teardown(state)
+
+    result["times"] = times
+    result["min"] = min(times)
+    result["median"] = statistics.median(times)
+    result["mean"] = statistics.mean(times)
+    result["stdev"] = statistics.stdev(times) if len(times) > 1 else 0.0
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def machine() -> dict:
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "music21": music21.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "timestamp": time.time(),
+    }
+
+
+def run(
+    benchmarks: List[Benchmark],
+    sizes: List[Size],
+    repeat: int,
+    report: Callable[[Result], None] = lambda _: None,
+) -> List[Result]:
+    results = []
+    for b in benchmarks:
+        for size in sizes:
+            result = run_one(b, size, repeat)
+            report(result)
+            results.append(result)
+    return results
+
+
+def write(path: str, results: List[Result], repeat: int):
+    with open(path, "w") as f:
+        json.dump(
+            {"machine": machine(), "repeat": repeat, "results": results},
+            f,
+            indent=2,
+        )
+
+
+def format_result(r: Result) -> str:
+    label = f"{r['name']:<32} {r['size']:>12}"
+    if "error" in r:
+        return f"{label}  error: {r['error']}"
+    per_call = 1000 * r["median"] / max(r["calls"], 1)
+    return (
+        f"{label}  {r['median']:9.4f}s median  "
+        f"{r['min']:9.4f}s min  {per_call:9.3f}ms/call"
+    )
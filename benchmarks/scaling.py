@@ -0,0 +1,41 @@
+"""
+Times process.mutate on synthetic scores of growing length.
+Time per measure should stay roughly flat if the engine is linear.
+
+    python benchmarks/scaling.py 125 250 500 1000
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from benchmarks.scores import synthetic_score
+from cancer_music.processor import process
+
+
+def time_mutate(measures: int, parts: int, seed: int) -> float:
+    s = synthetic_score(measures, parts)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        process.mutate(s, seed=seed, msgCallback=lambda *_: None)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("measures", type=int, nargs="*", default=[125, 500])
+    parser.add_argument("--parts", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for measures in args.measures:
+        seconds = time_mutate(measures, args.parts, args.seed)
+        print(
+            f"{measures:6d} measures  {seconds:8.2f}s  "
+            f"{1000 * seconds / measures:6.2f}ms/measure"
+        )
+
+
+if __name__ == "__main__":
+    main()
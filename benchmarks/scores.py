@@ -0,0 +1,62 @@
+"""
+Synthetic scores for the benchmarks, so timings do not depend on
+which samples happen to be bundled.
+"""
+
+import random
+
+from music21 import instrument
+from music21.meter.base import TimeSignature
+from music21.note import Note, Rest
+from music21.stream.base import Measure, Part, Score, Voice
+
+PITCHES = ["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5"]
+DURATIONS = [0.5, 1.0, 1.0, 2.0]
+
+
+def fill(s, rng: random.Random, length: float = 4.0):
+    """
+    Fills a measure or voice with random notes and rests.
+    """
+    offset = 0.0
+    while offset < length:
+        ql = min(rng.choice(DURATIONS), length - offset)
+        if rng.random() < 0.1:
+            el = Rest(quarterLength=ql)
+        else:
+            el = Note(rng.choice(PITCHES), quarterLength=ql)
+        s.insert(offset, el)
+        offset += ql
+
+
+def synthetic_score(
+    measures: int, parts: int = 1, voices: int = 1, seed: int = 0
+) -> Score:
+    """
+    Builds a score in 4/4 with random quarter, half and eighth notes.
+
+    :param measures: Number of measures in every part.
+    :param parts: Number of parts.
+    :param voices: Voices per measure, 1 means no Voice objects.
+    :param seed: Seed for the note choices.
+    :returns: The score.
+    """
+    rng = random.Random(seed)
+    s = Score()
+    for i in range(parts):
+        p = Part(id=f"P{i}")
+        p.insert(0, instrument.Piano())
+        for k in range(measures):
+            m = Measure(number=k + 1)
+            if k == 0:
+                m.insert(0, TimeSignature("4/4"))
+            if voices > 1:
+                for _ in range(voices):
+                    v = Voice()
+                    fill(v, rng)
+                    m.insert(0, v)
+            else:
+                fill(m, rng)
+            p.append(m)
+        s.insert(0, p)
+    return s
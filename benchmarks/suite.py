@@ -0,0 +1,450 @@
+"""
+Benchmarks for the processor and API hot paths on synthetic scores
+of growing size. Sizes are measures x parts x voices.
+
+    PYTHONPATH=.:cancer_music python -m benchmarks.suite \\
+        --sizes 32 128x2 128x2x2 --filter mutate --output out.json
+
+Benchmarks that fail record an error in the results instead of
+stopping the run, e.g. the synth and API ones when fluidsynth is
+missing.
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import os
+import random
+import re
+import time
+
+from music21.midi.translate import streamToMidiFile
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+from benchmarks import harness
+from benchmarks.harness import Benchmark, Size
+from benchmarks.scores import synthetic_score
+from cancer_music.processor import (
+    compact,
+    dryrun,
+    process,
+    smf,
+    sweep,
+    utils,
+)
+from cancer_music.processor.checkpoint import Checkpoints
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+DEFAULT_SIZES = ["32", "128x2", "128x2x2", "512x2"]
+# measures each mutation is applied to per run
+MUTATION_SAMPLE = 32
+SEED = 1
+# General MIDI programs handed out to the parts in turn
+PROGRAMS = [0, 40, 73, 42, 56, 24]
+# the defaults of mutate
+PARAMS = Parameters(
+    how_many=4,
+    max_parts=4,
+    reproduction=0.1,
+    noop=0.2,
+    insertion=0.2,
+    transposition=0.1,
+    deletion=0.25,
+    translocation=0.05,
+    inversion=0.2,
+    start=0.1,
+)
+T_PARAMS = TherapyParameters(
+    therapy_mode=Therapy.OFF,
+    mutant_survival=0.0,
+    start=0.0,
+    adaptive_threshold=2,
+    adaptive_interval=8,
+)
+
+
+def quiet_mutate(s, seed=SEED, params=PARAMS):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return process.mutate(
+            s, params, T_PARAMS, seed=seed, msgCallback=lambda *_: None
+        )
+
+
+# a tumor with dozens of subclones, most of them playing measures
+# their parent played first
+OFFSPRING_PARAMS = Parameters(PARAMS, max_parts=32, reproduction=0.5)
+
+
+def mutate_offspring(s):
+    return quiet_mutate(s, params=OFFSPRING_PARAMS)
+
+
+def score(size: Size):
+    return synthetic_score(size.measures, size.parts, size.voices)
+
+
+def mutant(size: Size):
+    m, _ = quiet_mutate(score(size))
+    return m
+
+
+# mutate is first run with T_PARAMS, then rerun with a cure that
+# leaves the measures before it alone
+RESUMED_T_PARAMS = TherapyParameters(
+    T_PARAMS, therapy_mode=Therapy.CURE, start=0.75
+)
+
+
+def warm_checkpoints(size: Size) -> Checkpoints:
+    checkpoints = Checkpoints()
+    with contextlib.redirect_stdout(io.StringIO()):
+        process.mutate(
+            score(size),
+            PARAMS,
+            T_PARAMS,
+            seed=SEED,
+            msgCallback=lambda *_: None,
+            checkpoints=checkpoints,
+        )
+    return checkpoints
+
+
+def quiet_resume(warm: Checkpoints):
+    # every call resumes from the snapshots of the first run
+    checkpoints = copy.copy(warm)
+    checkpoints.snapshots = dict(warm.snapshots)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return process.mutate(
+            warm.ref,
+            PARAMS,
+            RESUMED_T_PARAMS,
+            seed=SEED,
+            msgCallback=lambda *_: None,
+            checkpoints=checkpoints,
+        )
+
+
+def prepare_dry(size: Size):
+    return dryrun.prepare(score(size))
+
+
+def quiet_simulate(dry, seed=SEED):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return dryrun.simulate(dry, PARAMS, T_PARAMS, seed)
+
+
+# the therapies compared by sweep.sweep, SWEEP_RUNS runs each
+SWEEP_VARIANTS = [
+    (PARAMS, TherapyParameters(T_PARAMS, therapy_mode=mode, start=0.5))
+    for mode in Therapy
+]
+SWEEP_RUNS = 2500
+
+
+def run_sweep(size: Size):
+    sweep.sweep(size.measures, size.parts, SWEEP_VARIANTS, SWEEP_RUNS, SEED)
+
+
+def sample(size: Size) -> int:
+    return min(size.measures, MUTATION_SAMPLE)
+
+
+def sampled_measures(size: Size):
+    p = score(size).parts[0]
+    measures = list(p.getElementsByClass("Measure"))
+    step = len(measures) / sample(size)
+    picks = [int(i * step) for i in range(sample(size))]
+    return p, measures, picks
+
+
+def compact_mutation(fn):
+    def setup(size: Size):
+        p, _, picks = sampled_measures(size)
+        parent = compact.ParentMeasures(p)
+        cms = []
+        for k in picks:
+            cm = parent.measure(k)
+            cm.placed = k
+            cms.append(cm)
+        return fn, parent, cms
+
+    return setup
+
+
+def run_compact_mutation(state):
+    fn, parent, cms = state
+    rng = random.Random(SEED)
+    for cm in cms:
+        fn(cm, rng, parent)
+
+
+def measures_of_first_part(size: Size):
+    return list(score(size).parts[0].getElementsByClass("Measure"))
+
+
+def copy_measures(measures):
+    for m in measures:
+        utils.copy_measure(m)
+
+
+def load_synth(size: Size):
+    # imported here so the rest of the suite runs without fluidsynth
+    from cancer_music.processor import synth
+
+    return synth, streamToMidiFile(mutant(size)), synth.load_synth()
+
+
+def instrument_score(size: Size):
+    s = score(size)
+    for i, p in enumerate(s.parts):
+        p.getInstrument().midiProgram = PROGRAMS[i % len(PROGRAMS)]
+    return s
+
+
+def load_synth_instruments(size: Size):
+    from cancer_music.processor import synth
+
+    mf = streamToMidiFile(instrument_score(size))
+    return synth, mf, synth.load_synth()
+
+
+def load_synth_per_part(size: Size):
+    from cancer_music.processor import synth
+
+    mfs = [streamToMidiFile(p) for p in instrument_score(size).parts]
+    return synth, mfs, synth.load_synth()
+
+
+def render_wav_per_part(state):
+    # the multi-pass alternative, one render per part to be mixed after
+    synth, mfs, fs = state
+    for mf in mfs:
+        synth.render_wav(mf, fs=fs)
+
+
+def render_wav(state):
+    synth, mf, fs = state
+    synth.render_wav(mf, fs=fs)
+
+
+def render_wav_cold(state):
+    # loads the soundfont for every render, as before synths were pooled
+    synth, mf, _ = state
+    synth.render_wav(mf)
+
+
+def load_reference(size: Size):
+    from cancer_music.processor import rerender, synth
+
+    ref = streamToMidiFile(mutant(size))
+    mf = streamToMidiFile(quiet_mutate(score(size), seed=SEED + 1)[0])
+    fs = synth.load_synth()
+    wav = io.BytesIO()
+    for _ in rerender.record(synth.render_chunks(ref, fs=fs), wav):
+        pass
+    return rerender, (mf, ref, wav.getvalue()), fs
+
+
+def render_wav_differential(state):
+    # a second mutant of the same score, spliced onto the first's audio
+    rerender, (mf, ref, wav), fs = state
+    for _ in rerender.render_chunks(mf, ref, io.BytesIO(wav), fs):
+        pass
+
+
+def delete_synth(state):
+    state[2].delete()
+
+
+PROCESS_FILE_QUERY = {
+    "how_many": PARAMS["how_many"],
+    "noop": PARAMS["noop"],
+    "insertion": PARAMS["insertion"],
+    "transposition": PARAMS["transposition"],
+    "deletion": PARAMS["deletion"],
+    "translocation": PARAMS["translocation"],
+    "inversion": PARAMS["inversion"],
+    "mode": T_PARAMS["therapy_mode"].value,
+    "start": T_PARAMS["start"],
+    "mutant_survival": T_PARAMS["mutant_survival"],
+    "maxParts": PARAMS["max_parts"],
+    "reproductionProbability": PARAMS["reproduction"],
+    "cancerStart": PARAMS["start"],
+    "adaptive_therapy_threshold": T_PARAMS["adaptive_threshold"],
+    "adaptive_therapy_interval": T_PARAMS["adaptive_interval"],
+}
+
+
+def start_client(size: Size):
+    from fastapi.testclient import TestClient
+
+    os.environ.setdefault("CANCER_MUSIC_WORKERS", "1")
+    import api.main as main
+
+    client = TestClient(main.app)
+    client.__enter__()
+    state = (client, GeneralObjectExporter().parse(score(size)))
+    try:
+        # the first request pays for the worker warm up and the
+        # render of the original, which later requests take from cache
+        post_score(state)
+    except BaseException:
+        client.__exit__(None, None, None)
+        raise
+    return state
+
+
+def post_score(state):
+    client, contents = state
+    # fresh seeds so the result cache never answers for us
+    query = dict(PROCESS_FILE_QUERY, seed=random.randrange(2**31))
+    res = client.post(
+        "/process_file",
+        params=query,
+        files={"file": ("bench.musicxml", contents)},
+    )
+    if res.status_code != 200:
+        raise RuntimeError(f"{res.status_code}: {res.text}")
+
+
+def stop_client(state):
+    state[0].__exit__(None, None, None)
+
+
+MUTATIONS = [
+    "noop",
+    "insertion",
+    "transposition",
+    "deletion",
+    "translocation",
+    "inversion",
+]
+
+BENCHMARKS = (
+    [
+        Benchmark("process.mutate", quiet_mutate, score),
+        Benchmark("process.mutate_resumed", quiet_resume, warm_checkpoints),
+        Benchmark("process.mutate_offspring", mutate_offspring, score),
+        Benchmark("dryrun.simulate", quiet_simulate, prepare_dry),
+        Benchmark(
+            "sweep.sweep",
+            run_sweep,
+            lambda size: size,
+            lambda _: len(SWEEP_VARIANTS) * SWEEP_RUNS,
+        ),
+    ]
+    + [
+        Benchmark(
+            f"compact.{name}",
+            run_compact_mutation,
+            compact_mutation(getattr(compact, name)),
+            sample,
+        )
+        for name in MUTATIONS
+    ]
+    + [
+        Benchmark(
+            "utils.copy_measure",
+            copy_measures,
+            measures_of_first_part,
+            lambda size: size.measures,
+        ),
+        Benchmark(
+            "utils.duplicate_part",
+            lambda p: utils.duplicate_part(p, 0),
+            lambda size: score(size).parts[0],
+        ),
+        Benchmark("export.midi", streamToMidiFile, mutant),
+        Benchmark("export.midi_direct", smf.to_midi_file, mutant),
+        Benchmark("export.wav", render_wav, load_synth, teardown=delete_synth),
+        Benchmark(
+            "export.wav_instruments",
+            render_wav,
+            load_synth_instruments,
+            teardown=delete_synth,
+        ),
+        Benchmark(
+            "export.wav_per_part",
+            render_wav_per_part,
+            load_synth_per_part,
+            teardown=delete_synth,
+        ),
+        Benchmark(
+            "export.wav_cold",
+            render_wav_cold,
+            load_synth,
+            teardown=delete_synth,
+        ),
+        Benchmark(
+            "export.wav_differential",
+            render_wav_differential,
+            load_reference,
+            teardown=delete_synth,
+        ),
+        Benchmark(
+            "export.musicxml",
+            lambda m: GeneralObjectExporter().parse(m),
+            mutant,
+        ),
+        Benchmark(
+            "api.process_file", post_score, start_client, teardown=stop_client
+        ),
+    ]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=harness.parse_size,
+        default=[harness.parse_size(s) for s in DEFAULT_SIZES],
+        help="measures[xparts[xvoices]] for each size to run",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--filter", default="", help="regex on the benchmark names"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="JSON file to write, defaults to benchmarks/results/",
+    )
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+
+    selected = [b for b in BENCHMARKS if re.search(args.filter, b.name)]
+    if args.list:
+        for b in selected:
+            print(b.name)
+        return
+
+    results = harness.run(
+        selected,
+        args.sizes,
+        args.repeat,
+        lambda r: print(harness.format_result(r), flush=True),
+    )
+
+    output = args.output
+    if output is None:
+        out_dir = os.path.join(os.path.dirname(__file__), "results")
+        os.makedirs(out_dir, exist_ok=True)
+        commit = (harness.git_commit() or "unknown")[:8]
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(out_dir, f"{commit}-{stamp}.json")
+    harness.write(output, results, args.repeat)
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
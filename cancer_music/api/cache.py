@@ -0,0 +1,191 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from enum import Enum
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import api.utils as utils
+
+
+def content_key(*parts: bytes) -> str:
+    """
+    Builds a cache key from a sequence of byte strings.
+
+    :param parts: Everything the cached value depends on.
+    :returns: Hex digest identifying the content.
+    """
+    h = hashlib.sha256()
+    for p in parts:
+        # length prefix so that ("ab", "c") and ("a", "bc") differ
+        h.update(len(p).to_bytes(8, "big"))
+        h.update(p)
+    return h.hexdigest()
+
+
+def canonical(value) -> bytes:
+    """
+    Serializes parameters deterministically so they can be hashed.
+
+    :param value: JSON-like structure, may contain enums.
+    :returns: Canonical JSON encoding of value.
+    """
+
+    def default(o):
+        if isinstance(o, Enum):
+            return o.value
+        raise TypeError(f"Cannot serialize {type(o).__name__}.")
+
+    return json.dumps(
+        value, sort_keys=True, separators=(",", ":"), default=default
+    ).encode()
+
+
+def file_identity(path: str) -> bytes:
+    """
+    Cheap identity of a file on disk, changes whenever it is replaced.
+
+    :param path: File to identify.
+    :returns: Bytes describing the file's path, size and mtime.
+    """
+    fp = os.path.abspath(path)
+    try:
+        st = os.stat(fp)
+    except FileNotFoundError:
+        return fp.encode()
+    return f"{fp}:{st.st_size}:{st.st_mtime_ns}".encode()
+
+
+class DiskCache:
+    """
+    Directory of cached files with a least-recently-used size bound
+    and an optional time to live. Entries are written atomically,
+    so concurrent workers never see a partially written file.
+    Last use is tracked through atime and creation through mtime.
+    """
+
+    def __init__(
+        self, directory: str, max_bytes: int, ttl: Optional[float] = None
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.counters = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+        utils.mkdir(directory)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def expired(self, mtime: float) -> bool:
+        return self.ttl is not None and time.time() - mtime > self.ttl
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """
+        Opens an entry for reading. The open file stays readable even
+        if the entry is evicted in the meantime.
+
+        :returns: The open file, or None if there is no live entry.
+        """
+        fp = self.path(key)
+        try:
+            f = open(fp, "rb")
+        except FileNotFoundError:
+            self.count("misses")
+            return None
+        st = os.fstat(f.fileno())
+        if self.expired(st.st_mtime):
+            f.close()
+            self.remove(fp)
+            self.count("misses")
+            return None
+        self.count("hits")
+        # bump the atime so eviction sees this as recently used
+        try:
+            os.utime(fp, (time.time(), st.st_mtime))
+        except FileNotFoundError:
+            pass
+        return f
+
+    def count(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        entries = self.entries()
+        with self.lock:
+            stats = dict(self.counters)
+        stats["disk_bytes"] = sum(size for _, _, size, _ in entries)
+        stats["disk_entries"] = len(entries)
+        return stats
+
+    def get(self, key: str) -> Optional[bytes]:
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def remove(self, fp: str):
+        try:
+            os.remove(fp)
+        except FileNotFoundError:
+            pass
+
+    def put(self, key: str, data: bytes):
+        self.put_chunks(key, [data])
+
+    def put_chunks(self, key: str, chunks: Iterable[bytes]):
+        """
+        Writes an entry piece by piece, so it never has to be held in
+        memory as a whole.
+        """
+        with self.writing(key) as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    @contextlib.contextmanager
+    def writing(self, key: str) -> Iterator[BinaryIO]:
+        """
+        Opens a seekable file for a new entry. The entry appears under
+        the key once the block is left, and not at all if it raises.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                yield f
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def entries(self):
+        """
+        Lists cache entries as (atime, mtime, size, path),
+        least recently used first.
+        """
+        found = []
+        for e in os.scandir(self.directory):
+            if not e.is_file() or e.name.startswith(".tmp-"):
+                continue
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                continue
+            found.append((st.st_atime, st.st_mtime, st.st_size, e.path))
+        found.sort()
+        return found
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, _, size, _ in entries)
+        for _, mtime, size, fp in entries:
+            if total <= self.max_bytes and not self.expired(mtime):
+                continue
+            self.remove(fp)
+            total -= size
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class QueueFull(Exception):
+    """
+    Raised when the runner has no room left for another job.
+    """
+
+
+class JobRunner:
+    """
+    Runs CPU-heavy work on a pool of warm worker processes.
+    At most workers + max_pending jobs are accepted at once,
+    anything beyond that is refused with QueueFull.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        initializer: Optional[Callable] = None,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        # spawn so workers don't inherit the server's threads and sockets
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+        )
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if not self.slots.acquire(blocking=False):
+            raise QueueFull("Server is busy. Please try again later.")
+        try:
+            fut = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        fut.add_done_callback(lambda _: self.slots.release())
+        return fut
+
+    async def run(self, fn: Callable, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def from_env() -> Tuple[int, int]:
+    """
+    Reads the pool size and queue bound from the environment.
+
+    :returns: Number of workers and number of jobs allowed to wait.
+    """
+    workers = int(os.environ.get("CANCER_MUSIC_WORKERS", os.cpu_count() or 1))
+    max_pending = int(os.environ.get("CANCER_MUSIC_MAX_PENDING", 2 * workers))
+    return workers, max_pending
+
+
+class Job:
+    """
+    An asynchronous mutation and the progress reported for it so far.
+    """
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.events: List[dict] = [{"status": "queued"}]
+        # key of the archive in the result cache
+        self.result: Optional[str] = None
+        self.finished: Optional[float] = None
+
+
+class JobStore:
+    """
+    Keeps track of asynchronous jobs. Workers report progress through
+    a managed queue, which a background thread folds into the jobs.
+    Finished jobs are forgotten after ttl seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.manager = multiprocessing.get_context("spawn").Manager()
+        self.queue = self.manager.Queue()
+        self.drainer = threading.Thread(target=self.drain, daemon=True)
+        self.drainer.start()
+
+    def create(self, name: str) -> Job:
+        job = Job(name)
+        with self.lock:
+            self.expire()
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, id: str) -> Optional[Job]:
+        with self.lock:
+            self.expire()
+            return self.jobs.get(id)
+
+    def remove(self, job: Job):
+        with self.lock:
+            self.jobs.pop(job.id, None)
+
+    def expire(self):
+        now = time.time()
+        old = [
+            k
+            for k, j in self.jobs.items()
+            if j.finished is not None and now - j.finished > self.ttl
+        ]
+        for k in old:
+            del self.jobs[k]
+
+    def report(self, id: str, event: dict):
+        # goes through the queue so it lands after the worker's own events
+        self.queue.put((id, event))
+
+    def finish(self, job: Job, result: str):
+        job.result = result
+        self.report(job.id, {"status": "done"})
+
+    def fail(self, job: Job, message: str):
+        self.report(job.id, {"status": "failed", "message": message})
+
+    def drain(self):
+        while True:
+            try:
+                item = self.queue.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            id, event = item
+            with self.lock:
+                job = self.jobs.get(id)
+            if job is None:
+                continue
+            job.events.append(event)
+            if event["status"] in ("done", "failed"):
+                job.finished = time.time()
+
+    def shutdown(self):
+        self.queue.put(None)
+        self.drainer.join()
+        self.manager.shutdown()
@@ -1,29 +1,43 @@
-import io
+import asyncio
 import json
-import math
 import os
 import time
-import warnings
-import wave
-import zipfile
-from typing import Annotated
-from zipfile import BadZipFile, ZipFile
-
-import fluidsynth
-import numpy as np
-from fastapi import Body, FastAPI, Response, UploadFile
+from concurrent.futures import Future
+from typing import Annotated, BinaryIO, List, Tuple
+from zipfile import BadZipFile
+
+from fastapi import (
+    Body,
+    Depends,
+    FastAPI,
+    Form,
+    HTTPException,
+    Response,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
-from music21 import converter
-from music21.midi.translate import streamToMidiFile
-from music21.musicxml.m21ToXml import GeneralObjectExporter
-from music21.stream.base import Score
 
+import api.cache as cache
+import api.jobs as jobs
+import api.metrics as metrics
+import api.pipeline as pipeline
+import api.samples as samples
 import api.utils as utils
-from cancer_music.processor.parameters import Parameters, Therapy, TherapyParameters
-from cancer_music.processor.process import mutate
-from cancer_music.processor.synth import PatchedSynth
+import api.zipstream as zipstream
+from cancer_music.processor import synth, timing
+from cancer_music.processor.encode import MEDIA_TYPES, AudioFormat, available
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
 
 app = FastAPI()
 
@@ -37,92 +51,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-default_file_loc = os.path.join(this_dir, "front", "src", "samples")
+default_file_loc = pipeline.default_file_loc
 default_files = [f for f in os.listdir(default_file_loc) if f.endswith(".mxl")]
 
+# finished /process_file archives, written to disk by the workers
+result_cache = pipeline.result_cache
+
+# how long finished jobs and their archives are kept around
+JOB_TTL_SECONDS = 60 * 60
+# how often the event stream checks a job for news
+EVENT_POLL_SECONDS = 0.1
+
+# send per-stage timings back in a Server-Timing header
+SERVER_TIMING = os.environ.get("CANCER_MUSIC_SERVER_TIMING", "") == "1"
+
+# most mutants a single /process_batch request may ask for
+MAX_BATCH = 64
+# message for archives evicted from result_cache before being sent
+EXPIRED = "The result expired before it was sent."
+
+runner: jobs.JobRunner
+job_store: jobs.JobStore
+# synths streamed playback renders on in this process, one per worker
+stream_synths: synth.SynthPool
+
+
+@app.on_event("startup")
+def start_runner():
+    global runner, job_store, stream_synths
+    job_store = jobs.JobStore(JOB_TTL_SECONDS)
+    workers, max_pending = jobs.from_env()
+    stream_synths = synth.SynthPool(workers)
+    runner = jobs.JobRunner(
+        workers, max_pending, initializer=pipeline.warm_worker
+    )
+    # parse the bundled samples in the background so startup stays fast
+    runner.executor.submit(pipeline.warm_templates)
+
+
+@app.on_event("shutdown")
+def stop_runner():
+    runner.shutdown()
+    job_store.shutdown()
+    stream_synths.close()
+
 
 @app.get("/")
 def redirect_to_index():
     return RedirectResponse(url="/index.html", status_code=303)
 
 
-def to_score(file: UploadFile) -> Score:
+def read_upload(file: UploadFile) -> bytes:
     if file.filename is None:
         raise ValueError("File corrupt.")
 
-    contents = None
     if file.filename.endswith(".mxl"):
         try:
-            z = ZipFile(file.file)
+            return samples.read_mxl(file.file)
         except BadZipFile:
-            return ValueError("File corrupt.")
-        files = [n for n in list(z.namelist()) if "META-INF" not in n]
-        contents = z.read(files[0])
+            raise ValueError("File corrupt.")
     elif file.filename.endswith(".musicxml"):
-        contents = file.file.read()
+        return file.file.read()
     else:
         raise ValueError(
             "Invalid file type. Please provide either a .mxl or .musicxml file."
         )
 
-    s = converter.parse(contents, format="musicxml")
-    if type(s) is not Score:
-        raise ValueError(
-            "Invalid format. Please provide a score, not an opus or part."
-        )
-
-    return s
-
 
 def drop_extension(fname: str):
     return fname.split(".")[0]
 
 
 def log_error(
-    file: UploadFile,
+    filename: str,
+    contents: bytes,
     seed: int,
     p: Parameters,
     t: TherapyParameters,
     error: str,
 ):
+    """
+    Logs a failed mutation and keeps a copy of the upload.
+    Takes the upload's name and contents rather than the UploadFile,
+    which is closed by the time a job fails.
+    """
     ts = time.time()
     log_dir = os.path.join(this_dir, "logs")
     log_file = os.path.join(log_dir, "log.txt")
     utils.mkdir(log_dir)
 
-    if file.filename not in default_files:
-        fpath = os.path.join(log_dir, file.filename)
+    if filename not in default_files:
+        fpath = os.path.join(log_dir, filename)
         if not os.path.exists(fpath):
             with open(fpath, "wb+") as f:
-                f.write(file.file.read())
+                f.write(contents)
 
     with open(log_file, "a") as f:
-        f.write(f"{ts}: Seed: {seed} fname: {file.filename}")
+        f.write(f"{ts}: Seed: {seed} fname: {filename}")
         f.write(f"{ts}: message: {error}")
         f.write(f"{ts}: mutant parameters: {p}")
         f.write(f"{ts}: therapy parameters: {t}")
 
 
-def get_samples(fname: str):
-    utils.mkdir(os.path.join(this_dir, "music_samples"))
-    sample_dir = os.path.join(this_dir, "music_samples")
+def result_key(
+    contents: bytes,
+    fname: str,
+    p: Parameters,
+    t: TherapyParameters,
+    seed: int,
+    fmt: AudioFormat,
+) -> str:
+    return cache.content_key(
+        contents,
+        cache.file_identity(synth.SOUNDFONT),
+        cache.canonical({"name": fname, "p": p, "t": t, "seed": seed}),
+        fmt.value.encode(),
+    )
 
-    mfp = os.path.join(sample_dir, f"{fname}.mid")
-    wfp = os.path.join(sample_dir, f"{fname}.wav")
 
-    if os.path.isfile(wfp) and os.path.isfile(mfp):
-        mf = open(mfp, mode="rb")
-        mfb = mf.read()
+def unavailable(fmt: AudioFormat):
+    return JSONResponse(
+        status_code=400,
+        content={"message": f"{fmt.value} output is not available here."},
+    )
 
-        wf = open(wfp, mode="rb")
-        wfb = wf.read()
 
-        return (mfb, wfb)
-    return None
+def busy(e: jobs.QueueFull):
+    return JSONResponse(status_code=503, content={"message": str(e)})
 
 
-@app.post("/process_file")
-def process_file(
+def mutation_parameters(
     how_many: int,
     noop: float,
     insertion: float,
@@ -139,16 +197,7 @@ def process_file(
     cancerStart: float,
     adaptive_therapy_threshold: int,
     adaptive_therapy_interval: int,
-    file: UploadFile,
-):
-    # MIDI? https://pypi.org/project/defusedxml/
-    warnings.filterwarnings("error")
-    try:
-        s = to_score(file)
-    except Exception as e:
-        return JSONResponse(status_code=422, content={"message": str(e)})
-    warnings.resetwarnings()
-
+) -> Tuple[Parameters, TherapyParameters, int]:
     mutation_parameters = Parameters(
         max_parts=maxParts,
         reproduction=reproductionProbability,
@@ -170,123 +219,437 @@ def process_file(
         adaptive_interval=adaptive_therapy_interval,
     )
 
-    fname = drop_extension(file.filename)
-    files = []
+    return mutation_parameters, therapy_parameters, seed
+
+
+MutationRequest = Annotated[
+    Tuple[Parameters, TherapyParameters, int], Depends(mutation_parameters)
+]
+
+
+def mutation_failed(error_str: str):
+    return JSONResponse(
+        status_code=500,
+        content={
+            "message": f"Error: Mutation failed. Please try again. {error_str}."
+        },
+    )
+
+
+@app.post("/process_file")
+async def process_file(
+    request: MutationRequest,
+    file: UploadFile,
+    audio_format: AudioFormat = AudioFormat.WAV,
+):
+    with timing.recording() as recorder:
+        res = await mutate_upload(request, file, audio_format)
+    metrics.observe(recorder.spans)
+    if SERVER_TIMING:
+        res.headers["Server-Timing"] = metrics.server_timing(recorder.spans)
+    return res
+
+
+async def mutate_upload(
+    request: MutationRequest, file: UploadFile, fmt: AudioFormat
+):
+    mutation_parameters, therapy_parameters, seed = request
+    if not available(fmt):
+        return unavailable(fmt)
     try:
-        # check if the hasn't already been saved
-
-        data = get_samples(fname)
-        mut_fname = f"mutant_{fname}"
-
-        if data is None:
-            mf = streamToMidiFile(s)
-            files.append((f"{fname}.mid", mf.writestr()))
-            files.append((f"{fname}.wav", midiToWav(mf)))
-        else:
-            mfb, wfb = data
-            files.append((f"{fname}.mid", mfb))
-            files.append((f"{fname}.wav", wfb))
-
-        m, tree = mutate(
-            s,
-            mutation_parameters,
-            therapy_parameters,
-            seed=seed,
-        )
+        with timing.span("upload"):
+            contents = read_upload(file)
+    except Exception as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
 
-        mf = streamToMidiFile(m)
-        files.append((f"{mut_fname}.mid", mf.writestr()))
-        files.append((f"{mut_fname}.wav", midiToWav(mf)))
-        files.append(("metadata.json", json.dumps(tree)))
+    fname = drop_extension(file.filename)
+    mut_fname = f"mutant_{fname}"
 
-        gex = GeneralObjectExporter()
-        content = gex.parse(m)
-        files.append((f"{fname}.musicxml", content))
+    # mutate is deterministic, so identical requests share one result
+    rkey = result_key(
+        contents, fname, mutation_parameters, therapy_parameters, seed, fmt
+    )
+    with timing.span("cache"):
+        f = result_cache.open(rkey)
+    if f is not None:
+        return zip_response(f, mut_fname)
 
+    try:
+        with timing.span("pool"):
+            _, spans = await runner.run(
+                pipeline.timed,
+                pipeline.process,
+                contents,
+                fname,
+                mutation_parameters,
+                therapy_parameters,
+                seed,
+                fmt,
+                rkey,
+            )
+    except jobs.QueueFull as e:
+        return busy(e)
+    except pipeline.ParseError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
     except Exception as e:
         error_str = str(e)
         log_error(
-            file, seed, mutation_parameters, therapy_parameters, error_str
-        )
-        return JSONResponse(
-            status_code=500,
-            content={
-                "message": f"Error: Mutation failed. Please try again. {error_str}."
-            },
+            file.filename,
+            contents,
+            seed,
+            mutation_parameters,
+            therapy_parameters,
+            error_str,
         )
+        return mutation_failed(error_str)
+
+    for name, seconds in spans:
+        timing.record(name, seconds)
+    return cached_zip_response(rkey, mut_fname)
+
+
+def override(base: dict, changes: dict, name: str) -> dict:
+    if not isinstance(changes, dict):
+        raise ValueError(f"{name} must be an object.")
+    merged = dict(base)
+    for k, v in changes.items():
+        if k not in base:
+            raise ValueError(f"Unknown {name} field {k}.")
+        kind = type(base[k])
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            raise ValueError(f"{name} field {k} must be a number.")
+        merged[k] = kind(v)
+    return merged
+
+
+def batch_variants(
+    request: Tuple[Parameters, TherapyParameters, int], variants: str
+) -> List[Tuple[Parameters, TherapyParameters, int]]:
+    """
+    Applies the per-mutant overrides of a batch to the parameters
+    given in the query. Each override may set "params" and "therapy"
+    fields by their names in Parameters and TherapyParameters, and
+    a "seed".
+
+    :param request: Parameters shared by the whole batch.
+    :param variants: JSON list of overrides, one per mutant.
+    :raises ValueError: Raised if the overrides are malformed.
+    """
+    p, t, seed = request
+    try:
+        overrides = json.loads(variants)
+    except json.JSONDecodeError:
+        raise ValueError("Variants must be a JSON list.")
+    if not isinstance(overrides, list) or len(overrides) == 0:
+        raise ValueError("Variants must be a non-empty JSON list.")
+    if len(overrides) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} variants are allowed.")
+
+    out = []
+    for o in overrides:
+        if not isinstance(o, dict) or not set(o) <= {
+            "params",
+            "therapy",
+            "seed",
+        }:
+            raise ValueError(
+                "Each variant may only set params, therapy and seed."
+            )
+        vp = override(p, o.get("params", {}), "params")
+        vt = override(t, o.get("therapy", {}), "therapy")
+        vs = o.get("seed", seed)
+        if isinstance(vs, bool) or not isinstance(vs, int):
+            raise ValueError("seed must be an integer.")
+        out.append((Parameters(**vp), TherapyParameters(**vt), vs))
+    return out
+
+
+@app.post("/process_batch")
+async def process_batch(
+    request: MutationRequest,
+    file: UploadFile,
+    variants: Annotated[str, Form()],
+    audio_format: AudioFormat = AudioFormat.WAV,
+):
+    """
+    Mutates one upload many times. The query holds the parameters
+    shared by all mutants, the variants form field a JSON list of
+    overrides, see batch_variants. The score is parsed and its
+    original rendered once, the mutants are spread over the workers.
+    The archive has the original at the top, mutant i under i/, and
+    variants.json with the parameters and any error of each mutant.
+    """
+    try:
+        contents = read_upload(file)
+        batch = batch_variants(request, variants)
+    except Exception as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    if not available(audio_format):
+        return unavailable(audio_format)
 
-    zf = toZip(files)
-
-    return Response(
-        content=zf.getvalue(),
+    fname = drop_extension(file.filename)
+    # the original and every mutant go to result_cache on their own
+    okey = cache.content_key(
+        pipeline.sample_key(contents).encode(),
+        fname.encode(),
+        audio_format.value.encode(),
+    )
+    try:
+        frozen = await runner.run(
+            pipeline.prepare_batch, contents, fname, audio_format, okey
+        )
+    except jobs.QueueFull as e:
+        return busy(e)
+    except pipeline.ParseError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    except Exception as e:
+        return mutation_failed(str(e))
+
+    # hold at most one slot per worker so other requests still get in
+    limit = asyncio.Semaphore(runner.workers)
+    reference = pipeline.reference_key(contents)
+
+    async def run_variant(p, t, seed):
+        rkey = result_key(contents, fname, p, t, seed, audio_format)
+        async with limit:
+            return await runner.run(
+                pipeline.timed,
+                pipeline.process_variant,
+                frozen,
+                fname,
+                p,
+                t,
+                seed,
+                audio_format,
+                f"{rkey}.mutant",
+                reference,
+            )
+
+    results = await asyncio.gather(
+        *(run_variant(*v) for v in batch), return_exceptions=True
+    )
+    for r in results:
+        if isinstance(r, jobs.QueueFull):
+            return busy(r)
+
+    original = result_cache.open(okey)
+    if original is None:
+        return mutation_failed(EXPIRED)
+    for r in results:
+        if not isinstance(r, BaseException):
+            metrics.observe(r[1])
+
+    def entries():
+        # the cached archives are opened one at a time as they are sent
+        yield from zipstream.read_members(original)
+        manifest = []
+        for i, ((p, t, seed), r) in enumerate(zip(batch, results)):
+            entry = {"params": p, "therapy": t, "seed": seed}
+            if isinstance(r, BaseException):
+                entry["error"] = str(r)
+            else:
+                f = result_cache.open(r[0])
+                if f is None:
+                    entry["error"] = EXPIRED
+                else:
+                    yield from zipstream.read_members(f, f"{i}/")
+            manifest.append(entry)
+        yield "variants.json", cache.canonical(manifest)
+
+    # the archive is deflated as it is sent, starlette iterates a
+    # plain generator in a thread so this stays off the event loop
+    name = f"mutants_{fname}"
+    return StreamingResponse(
+        zipstream.stream_zip(entries()),
         media_type="application/zip",
-        headers={
-            "Content-Disposition": f"attachment;filename={mut_fname}.zip"
-        },
+        headers={"Content-Disposition": f"attachment;filename={name}.zip"},
     )
 
 
-def toZip(files):
-    buf = io.BytesIO()
+@app.post("/jobs")
+def create_job(
+    request: MutationRequest,
+    file: UploadFile,
+    audio_format: AudioFormat = AudioFormat.WAV,
+):
+    """
+    Starts a mutation without holding the connection open.
+    Progress is streamed from /jobs/{id}/events and the archive
+    is fetched from /jobs/{id}/result.
+    """
+    mutation_parameters, therapy_parameters, seed = request
+    fmt = audio_format
+    if not available(fmt):
+        return unavailable(fmt)
+    try:
+        contents = read_upload(file)
+    except Exception as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
 
-    with ZipFile(buf, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-        for fname, data in files:
-            zip_file.writestr(fname, data)
+    # the upload is closed once this returns, before the job is done
+    filename = file.filename
+    fname = drop_extension(filename)
+    job = job_store.create(f"mutant_{fname}")
 
-    return buf
+    rkey = result_key(
+        contents, fname, mutation_parameters, therapy_parameters, seed, fmt
+    )
+    f = result_cache.open(rkey)
+    if f is not None:
+        f.close()
+        job_store.finish(job, rkey)
+        return {"id": job.id}
 
+    try:
+        fut = runner.submit(
+            pipeline.timed,
+            pipeline.process,
+            contents,
+            fname,
+            mutation_parameters,
+            therapy_parameters,
+            seed,
+            fmt,
+            rkey,
+            (job_store.queue, job.id),
+        )
+    except jobs.QueueFull as e:
+        job_store.remove(job)
+        return busy(e)
 
-def toMidi(file):
-    s = converter.parse(file, format="musicxml")
-    mf = streamToMidiFile(s)
-    return mf
+    def done(fut: Future):
+        try:
+            _, spans = fut.result()
+        except Exception as e:
+            job_store.fail(job, str(e))
+            if not isinstance(e, pipeline.ParseError):
+                log_error(
+                    filename,
+                    contents,
+                    seed,
+                    mutation_parameters,
+                    therapy_parameters,
+                    str(e),
+                )
+            return
+        metrics.observe(spans)
+        job_store.finish(job, rkey)
+
+    fut.add_done_callback(done)
+    return {"id": job.id}
+
+
+def get_job(id: str) -> jobs.Job:
+    job = job_store.get(id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No such job.")
+    return job
+
+
+@app.get("/jobs/{id}/events")
+async def job_events(id: str):
+    job = get_job(id)
+
+    async def stream():
+        sent = 0
+        while True:
+            finished = job.finished is not None
+            events = job.events[sent:]
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+            sent += len(events)
+            if finished:
+                return
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/jobs/{id}/result")
+def job_result(id: str):
+    job = get_job(id)
+    if job.finished is None:
+        return JSONResponse(
+            status_code=409, content={"message": "Job is still running."}
+        )
+    if job.result is None:
+        return mutation_failed(job.events[-1].get("message", ""))
+    return cached_zip_response(job.result, job.name)
 
 
-@app.post("/playback")
-def playback(file: Annotated[str, Body()]):
-    mf = toMidi(file)
-    return Response(content=mf.writestr())
+def cached_zip_response(key: str, name: str):
+    f = result_cache.open(key)
+    if f is None:
+        return mutation_failed(EXPIRED)
+    return zip_response(f, name)
 
 
-def midiToWav(mf):
-    midi = mf.writestr()
-    fs = PatchedSynth()
+def zip_response(f: BinaryIO, name: str):
+    """
+    Streams an archive from an open file, closing it when done.
+    """
+    return StreamingResponse(
+        zipstream.read_chunks(f),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment;filename={name}.zip",
+            "Content-Length": str(os.fstat(f.fileno()).st_size),
+        },
+    )
+
 
-    # need to provide example soundfont, or have user provide it
-    sfid = fs.sfload("piano.sf2")
-    fs.program_select(0, sfid, 0, 0)
-    fs.play_from_mem(midi)
+@app.get("/cache_stats")
+def cache_stats():
+    return {"results": result_cache.stats()}
 
-    data = []
-    s = fs.get_samples(44100)
-    # counts seconds of silence
-    empty_frames = 0
-    while empty_frames < 5:
-        data = np.append(data, s)
-        s = fs.get_samples(44100)
-        if np.all(s < 2):
-            empty_frames += 1
-        else:
-            empty_frames = 0
 
-    samples = fluidsynth.raw_audio_string(data)
-    fs.delete()
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-    wav = io.BytesIO()
-    with wave.open(wav, "wb") as wr:
-        wr.setframerate(44100)
-        wr.setnchannels(2)
-        wr.setsampwidth(2)
-        wr.writeframes(samples)
 
-    return wav.getvalue()
+@app.post("/playback")
+async def playback(file: Annotated[str, Body()]):
+    try:
+        midi = await runner.run(pipeline.playback, file)
+    except jobs.QueueFull as e:
+        return busy(e)
+    return Response(content=midi)
 
 
 @app.post("/synthesize")
-def synthesize(file: Annotated[str, Body()]):
-    mf = toMidi(file)
-    wav_data = midiToWav(mf)
-    return Response(content=wav_data)
+async def synthesize(
+    file: Annotated[str, Body()], audio_format: AudioFormat = AudioFormat.WAV
+):
+    if not available(audio_format):
+        return unavailable(audio_format)
+    try:
+        audio = await runner.run(pipeline.synthesize, file, audio_format)
+    except jobs.QueueFull as e:
+        return busy(e)
+    return Response(content=audio, media_type=MEDIA_TYPES[audio_format])
+
+
+@app.post("/synthesize/stream")
+async def synthesize_stream(
+    file: Annotated[str, Body()], audio_format: AudioFormat = AudioFormat.WAV
+):
+    """
+    Plays a score back while it renders. Only the MIDI export runs on
+    a worker, the audio is rendered here and every chunk is sent as
+    soon as the synth produces it, so playback can start right away.
+    """
+    if not available(audio_format):
+        return unavailable(audio_format)
+    try:
+        midi = await runner.run(pipeline.playback, file)
+    except jobs.QueueFull as e:
+        return busy(e)
+    # starlette runs the rendering generator in its thread pool
+    return StreamingResponse(
+        pipeline.stream_playback(midi, audio_format, stream_synths),
+        media_type=MEDIA_TYPES[audio_format],
+    )
 
 
 app.mount(
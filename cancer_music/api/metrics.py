@@ -0,0 +1,131 @@
+"""
+Prometheus histograms of the spans recorded while processing.
+Written by hand in the text exposition format to avoid pulling in
+a client library for two histograms.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Sequence
+
+from cancer_music.processor.timing import Span, totals
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from a single mutation up to a long render
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+MUTATION_PREFIX = "mutation."
+
+
+class Histogram:
+    """
+    A histogram with a single label, safe to observe from any thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = sorted(buckets)
+        self.lock = threading.Lock()
+        # per label value: counts per bucket (not cumulative), sum
+        self.counts: Dict[str, List[int]] = {}
+        self.sums: Dict[str, float] = {}
+
+    def observe(self, value: str, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            if value not in self.counts:
+                self.counts[value] = [0] * (len(self.buckets) + 1)
+                self.sums[value] = 0.0
+            self.counts[value][i] += 1
+            self.sums[value] += seconds
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for value in sorted(self.counts):
+                label = f'{self.label}="{escape(value)}"'
+                running = 0
+                for le, count in zip(self.buckets, self.counts[value]):
+                    running += count
+                    lines.append(
+                        f'{self.name}_bucket{{{label},le="{le}"}} {running}'
+                    )
+                running += self.counts[value][-1]
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="+Inf"}} {running}'
+                )
+                lines.append(f"{self.name}_sum{{{label}}} {self.sums[value]}")
+                lines.append(f"{self.name}_count{{{label}}} {running}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stages = Histogram(
+    "cancer_music_stage_seconds",
+    "Time spent in each stage of processing a score.",
+    "stage",
+)
+mutations = Histogram(
+    "cancer_music_mutation_seconds",
+    "Time spent applying a single mutation to a measure.",
+    "mutation",
+)
+
+
+def observe(spans: List[Span]):
+    """
+    Files spans under the mutation or stage histogram by name.
+    """
+    for name, seconds in spans:
+        if name.startswith(MUTATION_PREFIX):
+            mutations.observe(name[len(MUTATION_PREFIX) :], seconds)
+        else:
+            stages.observe(name, seconds)
+
+
+def render() -> str:
+    return stages.render() + mutations.render()
+
+
+def server_timing(spans: List[Span]) -> str:
+    """
+    Formats spans as a Server-Timing header, one entry per name.
+
+    :returns: Header value with durations in milliseconds.
+    """
+    return ", ".join(
+        f"{name};dur={1000 * seconds:.1f}"
+        for name, seconds in totals(spans).items()
+    )
@@ -0,0 +1,444 @@
+"""
+The CPU-heavy part of the API: parsing, mutating and rendering.
+Everything here runs inside the worker processes of the job runner,
+so it must stay importable without FastAPI.
+"""
+
+import json
+import os
+import warnings
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from music21 import converter
+from music21.midi import MidiFile
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+from music21.stream.base import Score
+
+import api.cache as cache
+import api.samples as samples
+import api.utils as utils
+import api.zipstream as zipstream
+from cancer_music.processor import rerender, smf, synth, timing
+from cancer_music.processor import utils as putils
+from cancer_music.processor.checkpoint import Checkpoints
+from cancer_music.processor.encode import (
+    AudioFormat,
+    pack,
+    render_audio,
+    stream_audio,
+)
+from cancer_music.processor.parameters import Parameters, TherapyParameters
+from cancer_music.processor.process import (
+    MutationStatus,
+    mutate,
+    normalize,
+    silent,
+    toStdOut,
+)
+
+this_dir = utils.get_this_dir()
+
+default_file_loc = os.path.join(this_dir, "front", "src", "samples")
+templates = samples.SampleTemplates(
+    default_file_loc, os.path.join(this_dir, "music_samples", "templates")
+)
+
+# renders of the original scores, keyed by content and soundfont
+SAMPLE_CACHE_BYTES = 512 * 1024 * 1024
+sample_cache = cache.DiskCache(
+    os.path.join(this_dir, "music_samples"), SAMPLE_CACHE_BYTES
+)
+
+# finished /process_file archives, written here by the workers and
+# streamed from here by the server
+RESULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+RESULT_TTL_SECONDS = 7 * 24 * 60 * 60
+result_cache = cache.DiskCache(
+    os.path.join(this_dir, "results"),
+    RESULT_DISK_BYTES,
+    ttl=RESULT_TTL_SECONDS,
+)
+
+# preloaded synths of this process; a worker renders one score at a
+# time, so the pool over all workers holds one synth per worker
+SYNTHS_PER_PROCESS = int(os.environ.get("CANCER_MUSIC_SYNTHS", 1))
+synths = synth.SynthPool(SYNTHS_PER_PROCESS)
+
+
+class ParseError(ValueError):
+    """
+    Raised when an upload cannot be turned into a score.
+    """
+
+
+def warm_worker():
+    """
+    Initializer for worker processes. Pays for music21's lazy imports
+    and the soundfont load before the first request arrives.
+    """
+    converter.parse("tinyNotation: 4/4 c4", format="tinyNotation")
+    synths.warm()
+
+
+def warm_templates():
+    templates.warm()
+
+
+def to_score(contents: bytes) -> Score:
+    # MIDI? https://pypi.org/project/defusedxml/
+    warnings.filterwarnings("error")
+    try:
+        s = converter.parse(contents, format="musicxml")
+    except Exception as e:
+        raise ParseError(str(e))
+    finally:
+        warnings.resetwarnings()
+
+    if type(s) is not Score:
+        raise ParseError(
+            "Invalid format. Please provide a score, not an opus or part."
+        )
+
+    return s
+
+
+def load_score(contents: bytes) -> Tuple[Score, bool]:
+    """
+    Parses an upload. Bundled samples come pre-parsed and normalized.
+
+    :returns: The score, and whether it is already normalized.
+    :raises ParseError: Raised if the upload is not a valid score.
+    """
+    s = templates.get(contents)
+    if s is not None:
+        return s, True
+    with timing.span("parse"):
+        return to_score(contents), False
+
+
+def sample_key(contents: bytes) -> str:
+    return cache.content_key(contents, cache.file_identity(synth.SOUNDFONT))
+
+
+def get_samples(key: str, fmt: AudioFormat = AudioFormat.WAV):
+    mfb = sample_cache.get(f"{key}.mid")
+    afb = sample_cache.get(f"{key}.{fmt.value}")
+    if mfb is None or afb is None:
+        return None
+    return (mfb, afb)
+
+
+def render_samples(key: str, s: Score, fmt: AudioFormat = AudioFormat.WAV):
+    """
+    Renders the original into the sample cache, the audio streaming
+    straight from the encoder to disk.
+    """
+    with timing.span("original.midi"):
+        mf = to_midi(s)
+        sample_cache.put(f"{key}.mid", mf.writestr())
+    with timing.span(f"original.{fmt.value}"):
+        sample_cache.put_chunks(f"{key}.{fmt.value}", midi_to_audio(mf, fmt))
+
+
+def midi_to_audio(
+    mf, fmt: AudioFormat, reference: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Renders a MIDI file on a pooled synth, holding the synth until
+    the last chunk has been taken.
+
+    :param reference: Key of the upload's reference render, for
+    mutants, see mutant_chunks.
+    """
+    with synths.synth() as fs:
+        if reference is None:
+            yield from render_audio(mf, fmt, fs)
+        else:
+            yield from pack(mutant_chunks(mf, fs, reference), fmt)
+
+
+def reference_key(contents: bytes) -> str:
+    return f"{sample_key(contents)}.ref"
+
+
+def mutant_chunks(mf, fs: synth.PatchedSynth, reference: str):
+    """
+    Renders a mutant, reusing the audio of an earlier mutant of the
+    same upload up to where the two part ways. The original can't
+    serve: mutate gives notes without a velocity full velocity, so
+    the mutant's unmutated measures don't sound like the original.
+    The first mutant of an upload is rendered in full and kept as
+    the reference for later ones.
+    """
+    midi = sample_cache.get(f"{reference}.mid")
+    if midi is not None:
+        # the audio is stored under the hash of its MIDI, so the two
+        # always belong together even if renders race to replace them
+        wf = sample_cache.open(f"{reference}.{cache.content_key(midi)}.wav")
+        if wf is not None:
+            ref = MidiFile()
+            ref.readstr(midi)
+            return rerender.render_chunks(mf, ref, wf, fs)
+    return recorded(synth.render_chunks(mf, fs=fs), reference, mf.writestr())
+
+
+def recorded(chunks, reference: str, midi: bytes):
+    with sample_cache.writing(
+        f"{reference}.{cache.content_key(midi)}.wav"
+    ) as f:
+        yield from rerender.record(chunks, f)
+    sample_cache.put(f"{reference}.mid", midi)
+
+
+def to_midi(s: Score):
+    """
+    Exports a score with a General MIDI program on every part, so
+    each instrument renders with its own sound. The score itself is
+    left as it was.
+    """
+    with putils.assigned_programs(s):
+        return smf.to_midi_file(s)
+
+
+def toMidi(file):
+    s = converter.parse(file, format="musicxml")
+    mf = to_midi(s)
+    return mf
+
+
+def report_progress(queue, job_id: str):
+    """
+    Builds a msgCallback for mutate that forwards progress to a job.
+
+    :param queue: Queue shared with the server process.
+    :param job_id: Job the progress belongs to.
+    """
+
+    def callback(status: MutationStatus, *args):
+        if status == MutationStatus.SETUP_COMPLETE:
+            event = {"status": "setup"}
+        else:
+            event = {
+                "status": "processing",
+                "measure": args[0],
+                "total": args[1],
+            }
+        queue.put((job_id, event))
+
+    return callback
+
+
+def process(
+    contents: bytes,
+    fname: str,
+    p: Parameters,
+    t: TherapyParameters,
+    seed: int,
+    fmt: AudioFormat,
+    key: str,
+    progress: Optional[Tuple] = None,
+) -> str:
+    """
+    Mutates an uploaded score and renders everything the front end needs.
+    The archive is streamed into result_cache, so neither it nor the
+    original's renders are ever held in memory whole.
+
+    :param contents: MusicXML bytes of the upload.
+    :param fname: Name of the upload without its extension.
+    :param fmt: Format of the audio renders.
+    :param key: Key to store the archive under in result_cache.
+    :param progress: Optional (queue, job id) to report progress to.
+    :returns: The key of the zip archive with the original, the mutant
+    and its tree.
+    :raises ParseError: Raised if the upload is not a valid score.
+    """
+    msgCallback = toStdOut if progress is None else report_progress(*progress)
+    s, normalized = load_score(contents)
+    entries = original_entries(contents, fname, s, fmt)
+
+    with timing.span("mutate"):
+        m, tree = mutate(
+            s,
+            p,
+            t,
+            seed=seed,
+            msgCallback=msgCallback,
+            normalized=normalized,
+            checkpoints=checkpoints_for(contents),
+        )
+    entries += mutant_entries(m, tree, fname, fmt, reference_key(contents))
+
+    with timing.span("zip"):
+        result_cache.put_chunks(key, zipstream.stream_zip(entries))
+    return key
+
+
+# snapshots of the last uploads this worker mutated, so a rerun with
+# other therapy parameters resumes where they start to matter
+CHECKPOINT_SCORES = 4
+checkpoints: OrderedDict[str, Checkpoints] = OrderedDict()
+
+
+def checkpoints_for(contents: bytes) -> Checkpoints:
+    key = cache.content_key(contents)
+    if key in checkpoints:
+        checkpoints.move_to_end(key)
+    else:
+        checkpoints[key] = Checkpoints()
+        while len(checkpoints) > CHECKPOINT_SCORES:
+            checkpoints.popitem(last=False)
+    return checkpoints[key]
+
+
+def original_entries(
+    contents: bytes, fname: str, s: Score, fmt: AudioFormat
+) -> List[zipstream.Entry]:
+    """
+    Archive entries for the original's renders, read from the sample
+    cache in chunks. Renders missing from the cache are made first.
+
+    :raises RuntimeError: Raised if the renders don't fit the cache.
+    """
+    key = sample_key(contents)
+    names = [(f"{key}.mid", f"{fname}.mid")]
+    names.append((f"{key}.{fmt.value}", f"{fname}.{fmt.value}"))
+    for attempt in range(2):
+        files = [sample_cache.open(k) for k, _ in names]
+        if all(f is not None for f in files):
+            return [
+                (name, zipstream.read_chunks(f))
+                for (_, name), f in zip(names, files)
+            ]
+        for f in files:
+            if f is not None:
+                f.close()
+        if attempt == 0:
+            render_samples(key, s, fmt)
+    raise RuntimeError("The renders of the original don't fit the cache.")
+
+
+def mutant_entries(
+    m: Score,
+    tree: dict,
+    fname: str,
+    fmt: AudioFormat,
+    reference: Optional[str] = None,
+) -> List[zipstream.Entry]:
+    """
+    Renders a mutant to the files the front end expects. The audio
+    is left as a stream, rendered as the archive takes it.
+
+    :param reference: Key of the upload's reference render, see
+    mutant_chunks.
+    """
+    mut_fname = f"mutant_{fname}"
+    entries: List[zipstream.Entry] = []
+    with timing.span("midi"):
+        mf = to_midi(m)
+        entries.append((f"{mut_fname}.mid", mf.writestr()))
+    entries.append(
+        (f"{mut_fname}.{fmt.value}", timed_audio(mf, fmt, reference))
+    )
+    entries.append(("metadata.json", json.dumps(tree)))
+
+    with timing.span("musicxml"):
+        gex = GeneralObjectExporter()
+        content = gex.parse(m)
+    entries.append((f"{fname}.musicxml", content))
+    return entries
+
+
+def timed_audio(
+    mf, fmt: AudioFormat, reference: Optional[str]
+) -> Iterator[bytes]:
+    with timing.span(fmt.value):
+        yield from midi_to_audio(mf, fmt, reference)
+
+
+def prepare_batch(
+    contents: bytes, fname: str, fmt: AudioFormat, key: str
+) -> bytes:
+    """
+    Parses and normalizes an upload once for a batch of mutants and
+    renders the original they share. The original's files are
+    streamed into result_cache as an archive of their own.
+
+    :param key: Key to store the original's archive under.
+    :returns: The frozen normalized score.
+    :raises ParseError: Raised if the upload is not a valid score.
+    """
+    s, normalized = load_score(contents)
+    entries = original_entries(contents, fname, s, fmt)
+    with timing.span("zip"):
+        result_cache.put_chunks(key, zipstream.stream_zip(entries))
+    if normalized:
+        ref = s
+    else:
+        with timing.span("mutate.expand_repeats"):
+            ref = normalize(s)
+    return putils.freeze(ref)
+
+
+def process_variant(
+    frozen: bytes,
+    fname: str,
+    p: Parameters,
+    t: TherapyParameters,
+    seed: int,
+    fmt: AudioFormat,
+    key: str,
+    reference: Optional[str] = None,
+) -> str:
+    """
+    Mutates a score frozen by prepare_batch and streams the mutant's
+    files into result_cache, like process does.
+
+    :param key: Key to store the mutant's archive under.
+    :param reference: Key of the upload's reference render, see
+    mutant_chunks.
+    :returns: The key of the archive.
+    """
+    ref = putils.thaw(frozen)
+    with timing.span("mutate"):
+        m, tree = mutate(
+            ref, p, t, seed=seed, msgCallback=silent, normalized=True
+        )
+    entries = mutant_entries(m, tree, fname, fmt, reference)
+    with timing.span("zip"):
+        result_cache.put_chunks(key, zipstream.stream_zip(entries))
+    return key
+
+
+def timed(fn: Callable, *args) -> Tuple[object, List[timing.Span]]:
+    """
+    Runs fn with a recorder active, so the spans recorded inside a
+    worker process can be sent back along with the result.
+
+    :returns: Result of fn and the spans it recorded.
+    """
+    with timing.recording() as recorder:
+        with timing.span("worker"):
+            result = fn(*args)
+    return result, recorder.spans
+
+
+def playback(file: str) -> bytes:
+    return toMidi(file).writestr()
+
+
+def synthesize(file: str, fmt: AudioFormat = AudioFormat.WAV) -> bytes:
+    return b"".join(midi_to_audio(toMidi(file), fmt))
+
+
+def stream_playback(
+    midi: bytes, fmt: AudioFormat, pool: synth.SynthPool
+) -> Iterator[bytes]:
+    """
+    Renders MIDI made by playback on a synth of the given pool,
+    yielding audio as the synth produces it.
+    """
+    mf = MidiFile()
+    mf.readstr(midi)
+    with pool.synth() as fs:
+        yield from stream_audio(mf, fmt, fs)
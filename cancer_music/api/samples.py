@@ -0,0 +1,81 @@
+import mmap
+import os
+import threading
+from typing import IO, Dict, Optional, Union
+from zipfile import ZipFile
+
+from music21 import converter, freezeThaw
+from music21.stream.base import Score
+
+import api.cache as cache
+from cancer_music.processor.process import repair_stream
+
+
+def read_mxl(fp: Union[str, IO[bytes]]) -> bytes:
+    """
+    Reads the MusicXML document out of a compressed .mxl file.
+
+    :param fp: Path or file object of the .mxl file.
+    :returns: The uncompressed MusicXML bytes.
+    """
+    with ZipFile(fp) as z:
+        files = [n for n in list(z.namelist()) if "META-INF" not in n]
+        return z.read(files[0])
+
+
+class SampleTemplates:
+    """
+    Parsed and normalized copies of the bundled sample scores.
+    Each sample is parsed at most once, run through expandRepeats and
+    repair_stream, and frozen into a pickle snapshot on disk. Requests
+    thaw a private copy straight out of the memory mapped snapshot, so
+    worker processes share the page cache instead of reparsing.
+    """
+
+    def __init__(self, sample_dir: str, snapshot_dir: str):
+        self.snapshots = cache.DiskCache(snapshot_dir, 1 << 40)
+        self.index: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        for f in os.listdir(sample_dir):
+            if f.endswith(".mxl"):
+                fp = os.path.join(sample_dir, f)
+                self.index[cache.content_key(read_mxl(fp))] = fp
+
+    def snapshot_path(self, key: str) -> str:
+        return self.snapshots.path(f"{key}.p")
+
+    def build(self, key: str, contents: bytes):
+        s = converter.parse(contents, format="musicxml")
+        ref = s.expandRepeats()
+        repair_stream(ref)
+        frozen = freezeThaw.StreamFreezer(ref).writeStr(fmt="pickle")
+        self.snapshots.put(f"{key}.p", frozen)
+
+    def thaw(self, key: str) -> Score:
+        with open(self.snapshot_path(key), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                thawer = freezeThaw.StreamThawer()
+                thawer.openStr(mm, pickleFormat="pickle")
+        return thawer.stream
+
+    def get(self, contents: bytes) -> Optional[Score]:
+        """
+        Returns a fresh copy of a bundled sample.
+
+        :param contents: MusicXML bytes of an upload.
+        :returns: The normalized score, or None if the upload is not
+        one of the bundled samples.
+        """
+        key = cache.content_key(contents)
+        if key not in self.index:
+            return None
+        if not os.path.isfile(self.snapshot_path(key)):
+            with self.lock:
+                if not os.path.isfile(self.snapshot_path(key)):
+                    self.build(key, contents)
+        return self.thaw(key)
+
+    def warm(self):
+        for key, fp in self.index.items():
+            if not os.path.isfile(self.snapshot_path(key)):
+                self.build(key, read_mxl(fp))
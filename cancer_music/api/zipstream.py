@@ -0,0 +1,108 @@
+"""
+Writes zip archives as a stream of chunks, so an archive never has
+to be held in memory as a whole.
+"""
+
+import time
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, List, Tuple, Union
+
+# members that are already compressed, or barely compress, are stored
+STORED_SUFFIXES = (".wav", ".mxl", ".zip")
+
+# name and contents of an archive member, given whole or in chunks,
+# text is written as UTF-8 like ZipFile.writestr does
+Entry = Tuple[str, Union[bytes, str, Iterable[bytes]]]
+
+
+class Sink:
+    """
+    Write-only file that keeps what was written until it is taken.
+    Not being seekable makes zipfile write data descriptors instead
+    of going back to patch the local headers.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.written
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def compression(name: str) -> int:
+    if name.lower().endswith(STORED_SUFFIXES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries: Iterable[Entry]) -> Iterator[bytes]:
+    """
+    Builds a zip archive entry by entry. WAV renders are stored,
+    everything else is deflated.
+
+    :param entries: Names and contents of the members, contents may
+    be a generator so members can be produced as they are written.
+    :returns: Iterator over the bytes of the archive.
+    """
+    sink = Sink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for name, data in entries:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = compression(name)
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if isinstance(data, bytes):
+                info.file_size = len(data)
+                chunks: Iterable[bytes] = [data]
+            else:
+                chunks = data
+            with zf.open(info, "w") as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    out = sink.take()
+                    if out:
+                        yield out
+            out = sink.take()
+            if out:
+                yield out
+    yield sink.take()
+
+
+def read_chunks(f, size: int = 1 << 16) -> Iterator[bytes]:
+    """
+    Reads a file in chunks and closes it when done.
+    """
+    try:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+def read_members(f: BinaryIO, prefix: str = "") -> Iterator[Entry]:
+    """
+    Entries of an archive on disk, each member read in chunks, so it
+    can be copied into another archive. Closes f when done.
+
+    :param prefix: Prepended to the name of every member.
+    """
+    with f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            yield prefix + info.filename, read_chunks(zf.open(info))
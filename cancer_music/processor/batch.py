@@ -0,0 +1,347 @@
+"""
+Mutates whole directories of sheet music over a grid of parameters.
+
+    mutate_sheet batch scores/ -o out --grid grid.json --seeds 8 -j 4
+
+Every (file, parameters, seed) combination is written to the output
+directory and logged to manifest.jsonl there. Running the same
+command again skips everything the manifest already has, so an
+interrupted run picks up where it stopped.
+"""
+
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Set, Tuple, TypedDict
+
+from music21 import converter
+
+from cancer_music.processor import process, timing
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+SUFFIXES = (".mxl", ".musicxml", ".xml")
+MANIFEST = "manifest.jsonl"
+# variants mutated per task; a file's score is parsed once per task
+CHUNK = 16
+
+
+class Task(TypedDict):
+    id: str
+    input: str
+    output: str
+    params: Parameters
+    therapy: TherapyParameters
+    seed: int
+
+
+def find_inputs(patterns: List[str]) -> List[str]:
+    """
+    Expands directories and glob patterns into sheet music files.
+
+    :param patterns: Files, directories or globs.
+    :returns: Sorted absolute paths without duplicates.
+    :raises ValueError: Raised if nothing matches.
+    """
+    found: Set[str] = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    found.update(
+                        os.path.join(root, f)
+                        for f in files
+                        if f.lower().endswith(SUFFIXES)
+                    )
+            elif os.path.isfile(path):
+                found.add(path)
+    if len(found) == 0:
+        raise ValueError(f"No sheet music found in {' '.join(patterns)}.")
+    return sorted(os.path.abspath(f) for f in found)
+
+
+def as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def expand(base: dict, grid: dict) -> List[dict]:
+    """
+    Takes the cartesian product of the grid's value lists over a base.
+
+    :param base: Values of the fields the grid leaves out.
+    :param grid: Field names mapped to a value or a list of values.
+    :raises ValueError: Raised for fields not in base.
+    """
+    unknown = set(grid) - set(base)
+    if unknown:
+        raise ValueError(f"Unknown grid fields {', '.join(sorted(unknown))}.")
+    keys = list(grid)
+    return [
+        dict(base, **dict(zip(keys, values)))
+        for values in itertools.product(*(as_list(grid[k]) for k in keys))
+    ]
+
+
+def parameter_grid(
+    grid: dict,
+    base_params: Parameters,
+    base_therapy: TherapyParameters,
+    seeds: List[int],
+) -> List[Tuple[Parameters, TherapyParameters, int]]:
+    """
+    Expands a grid such as
+    {"params": {"noop": [0.05, 0.1]}, "therapy": {"therapy_mode": [0, 3]}}
+    into every combination of parameters and seeds. A "seeds" list in
+    the grid replaces the seeds passed in.
+
+    :raises ValueError: Raised for fields the parameters do not have.
+    """
+    unknown = set(grid) - {"params", "therapy", "seeds"}
+    if unknown:
+        raise ValueError(f"Unknown grid sections {', '.join(unknown)}.")
+    therapies = expand(dict(base_therapy), grid.get("therapy", {}))
+    for t in therapies:
+        t["therapy_mode"] = Therapy(t["therapy_mode"])
+    return [
+        (Parameters(**p), TherapyParameters(**t), seed)
+        for p in expand(dict(base_params), grid.get("params", {}))
+        for t in therapies
+        for seed in as_list(grid.get("seeds", seeds))
+    ]
+
+
+def jsonable(value):
+    if isinstance(value, Therapy):
+        return value.value
+    if isinstance(value, dict):
+        return {k: jsonable(v) for k, v in value.items()}
+    return value
+
+
+def task_id(fp: str, p: Parameters, t: TherapyParameters, seed: int) -> str:
+    key = json.dumps(
+        [fp, jsonable(p), jsonable(t), seed], sort_keys=True
+    ).encode()
+    return hashlib.sha256(key).hexdigest()[:16]
+
+
+def plan(
+    inputs: List[str],
+    variants: List[Tuple[Parameters, TherapyParameters, int]],
+    out_dir: str,
+) -> List[Task]:
+    tasks = []
+    for fp in inputs:
+        stem = os.path.splitext(os.path.basename(fp))[0]
+        for p, t, seed in variants:
+            id = task_id(fp, p, t, seed)
+            tasks.append(
+                Task(
+                    id=id,
+                    input=fp,
+                    output=os.path.join(out_dir, stem, f"{id}.musicxml"),
+                    params=p,
+                    therapy=t,
+                    seed=seed,
+                )
+            )
+    return tasks
+
+
+def finished(out_dir: str) -> Set[str]:
+    """
+    :returns: Ids of the tasks the manifest records as written.
+    """
+    done = set()
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted run
+                    continue
+                if "error" not in entry:
+                    done.add(entry["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def chunks(tasks: List[Task], size: int) -> Iterator[List[Task]]:
+    """
+    Groups tasks of the same input so each group parses it once.
+    """
+    for _, group in itertools.groupby(tasks, key=lambda t: t["input"]):
+        group = list(group)
+        for i in range(0, len(group), size):
+            yield group[i : i + size]
+
+
+def entry(task: Task, **fields) -> dict:
+    return {
+        "id": task["id"],
+        "input": task["input"],
+        "output": task["output"],
+        "seed": task["seed"],
+        "params": jsonable(task["params"]),
+        "therapy": jsonable(task["therapy"]),
+        **fields,
+    }
+
+
+def run_chunk(tasks: List[Task]) -> List[dict]:
+    """
+    Parses the input of a group of tasks once and writes a mutant for
+    each. Failures are reported in the entry instead of raised.
+
+    :returns: Manifest entries, one per task.
+    """
+    start = time.perf_counter()
+    try:
+        s = converter.parseFile(
+            tasks[0]["input"], storePickle=False, quantizePost=False
+        )
+        ref = process.normalize(s)
+    except Exception as e:
+        return [entry(t, error=f"parse: {e}") for t in tasks]
+    parse = time.perf_counter() - start
+
+    entries = []
+    for t in tasks:
+        with timing.recording() as recorder:
+            try:
+                with timing.span("mutate"):
+                    m, tree = process.mutate_variant(
+                        ref, (t["params"], t["therapy"], t["seed"])
+                    )
+                with timing.span("write"):
+                    os.makedirs(os.path.dirname(t["output"]), exist_ok=True)
+                    m.write("musicxml", t["output"])
+            except Exception as e:
+                entries.append(entry(t, error=str(e)))
+                continue
+        timings = {"parse": parse, **recorder.totals()}
+        entries.append(entry(t, timings=timings, tree=tree))
+    return entries
+
+
+def run(
+    tasks: List[Task],
+    out_dir: str,
+    workers: int,
+    chunk: int = CHUNK,
+    report=print,
+) -> Tuple[int, int]:
+    """
+    Runs the tasks the manifest doesn't have yet, appending an entry
+    for each as its group finishes.
+
+    :param workers: Processes to use, 0 runs everything in this one.
+    :returns: Number of tasks written and failed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    done = finished(out_dir)
+    todo = [t for t in tasks if t["id"] not in done]
+    report(f"{len(tasks) - len(todo)} of {len(tasks)} already done.")
+
+    written = failed = 0
+    with open(os.path.join(out_dir, MANIFEST), "a") as manifest:
+
+        def record(entries: List[dict]):
+            nonlocal written, failed
+            for e in entries:
+                manifest.write(json.dumps(e) + "\n")
+                if "error" in e:
+                    failed += 1
+                else:
+                    written += 1
+            manifest.flush()
+            report(f"{written + failed} of {len(todo)} processed.")
+
+        groups = list(chunks(todo, chunk))
+        if workers == 0:
+            for group in groups:
+                record(run_chunk(group))
+            return written, failed
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_chunk, g) for g in groups]
+            try:
+                for fut in as_completed(futures):
+                    record(fut.result())
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    return written, failed
+
+
+def load_grid(value: Optional[str]) -> dict:
+    """
+    Reads a grid from a JSON file, or from the argument itself.
+    """
+    if value is None:
+        return {}
+    if os.path.isfile(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def main(argv: Optional[List[str]] = None):
+    # the single file script dispatches here, so import it late
+    from cancer_music.processor import main as single
+
+    parser = argparse.ArgumentParser(
+        prog="mutate_sheet batch",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Sheet music files, directories or globs."
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Directory to write to."
+    )
+    parser.add_argument(
+        "-g",
+        "--grid",
+        help="JSON file or string with the parameter grid, e.g. "
+        '\'{"params": {"noop": [0.05, 0.1]}, '
+        '"therapy": {"therapy_mode": [0, 3]}}\'.',
+    )
+    parser.add_argument(
+        "-n",
+        "--seeds",
+        type=int,
+        default=1,
+        help="Seeds 1 to n are run for every point of the grid, "
+        "unless the grid lists its own. Seed 0 would pick one at random.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes, 0 runs in this process.",
+    )
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    args = parser.parse_args(argv)
+
+    variants = parameter_grid(
+        load_grid(args.grid),
+        single.DEFAULT_PARAMS,
+        single.DEFAULT_THERAPY,
+        list(range(1, args.seeds + 1)),
+    )
+    tasks = plan(find_inputs(args.inputs), variants, args.output)
+    written, failed = run(tasks, args.output, args.jobs, args.chunk)
+    print(f"Wrote {written} mutants to {args.output}, {failed} failed.")
@@ -0,0 +1,176 @@
+"""
+Snapshots of mutate's loop, so a rerun of a score with other therapy
+parameters picks up where the two runs part ways.
+
+Until the therapy first acts, the loop only depends on the score, the
+mutation parameters and the seed. A snapshot taken at a measure both
+therapies leave alone so far holds the state either run has there,
+and the rerun only has to go through the rest of the score.
+
+    checkpoints = Checkpoints()
+    mutate(s, params, cure_late, seed=1, checkpoints=checkpoints)
+    # resumes at the measure the earlier cure now starts at
+    mutate(s, params, cure_early, seed=1, checkpoints=checkpoints)
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+from cancer_music.processor import compact, utils
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+
+def first_action(
+    t_params: TherapyParameters, cancer_start: int, score_length: int
+) -> int:
+    """
+    :returns: The first measure at which a therapy may change the
+    loop's state, or score_length if it never does.
+    """
+    mode = t_params["therapy_mode"]
+    if mode == Therapy.ADAPTIVE:
+        return cancer_start
+    if mode in (Therapy.CURE, Therapy.PARTIAL_CURE):
+        therapy_start = math.floor(t_params["start"] * score_length) - 1
+        if cancer_start <= therapy_start < score_length:
+            return therapy_start
+    return score_length
+
+
+def copy_info(mutation_info: Dict[int, dict]) -> Dict[int, dict]:
+    # compact measures are never changed once placed, the lists
+    # holding them are
+    return {
+        mp: dict(
+            info,
+            tumors=list(info["tumors"]),
+            annotations=dict(info["annotations"]),
+        )
+        for mp, info in mutation_info.items()
+    }
+
+
+class Snapshot:
+    """
+    The state of mutate's loop at the start of a measure, before the
+    therapy acts on it.
+    """
+
+    def __init__(
+        self,
+        t_params: TherapyParameters,
+        streams: utils.Streams,
+        tree: Dict[int, List[int]],
+        mutation_info: Dict[int, dict],
+        slots: Dict[int, List[compact.Slot]],
+        mutants: List[int],
+        offspring_count: int,
+        available_id: int,
+        therapy_started: bool,
+    ):
+        self.t_params = dict(t_params)
+        self.streams = streams.getstate()
+        self.tree = {k: list(v) for k, v in tree.items()}
+        self.mutation_info = copy_info(mutation_info)
+        self.slots = {k: list(v) for k, v in slots.items()}
+        self.mutants = list(mutants)
+        self.offspring_count = offspring_count
+        self.available_id = available_id
+        self.therapy_started = therapy_started
+
+    def restore(self, streams: utils.Streams) -> tuple:
+        """
+        Puts the streams back in their state and hands out copies of
+        the rest, so the snapshot can be restored again later.
+
+        :returns: tree, mutation_info, slots, mutants, offspring_count,
+        available_id and therapy_started.
+        """
+        streams.setstate(self.streams)
+        return (
+            {k: list(v) for k, v in self.tree.items()},
+            copy_info(self.mutation_info),
+            {k: list(v) for k, v in self.slots.items()},
+            list(self.mutants),
+            self.offspring_count,
+            self.available_id,
+            self.therapy_started,
+        )
+
+
+class Checkpoints:
+    """
+    The normalized score and the snapshots of the runs of one score.
+    Hand the same object to every mutate of that score, and a new one
+    for another score: mutate takes the score from here once it has
+    one.
+    """
+
+    def __init__(self, every: int = 8):
+        """
+        :param every: Measures between snapshots. One is also taken
+        where the loop starts and where the therapy first acts.
+        """
+        self.every = every
+        self.ref = None
+        # compact.ParentMeasures of the parts of ref, by part id
+        self.originals: Dict[int, compact.ParentMeasures] = {}
+        # mutation parameters and seed the snapshots were taken with
+        self.run: Optional[Tuple[Parameters, int]] = None
+        self.snapshots: Dict[int, Snapshot] = {}
+        # measure the last run resumed at, None if it started over
+        self.resumed: Optional[int] = None
+
+    def begin(self, params: Parameters, seed: int):
+        """
+        Drops the snapshots if they were taken with other mutation
+        parameters or another seed.
+        """
+        if self.run != (params, seed):
+            self.run = (dict(params), seed)
+            self.snapshots = {}
+        self.resumed = None
+
+    def latest(
+        self,
+        t_params: TherapyParameters,
+        cancer_start: int,
+        score_length: int,
+    ) -> Optional[Tuple[int, Snapshot]]:
+        """
+        :returns: The latest snapshot a run with t_params can resume
+        from and its measure, or None.
+        """
+        limit = first_action(t_params, cancer_start, score_length)
+        valid = [
+            k
+            for k, snap in self.snapshots.items()
+            if snap.t_params == t_params
+            or k
+            <= min(
+                limit,
+                first_action(snap.t_params, cancer_start, score_length),
+            )
+        ]
+        if len(valid) == 0:
+            return None
+        k = max(valid)
+        return k, self.snapshots[k]
+
+    def due(
+        self,
+        i: int,
+        t_params: TherapyParameters,
+        cancer_start: int,
+        score_length: int,
+    ) -> bool:
+        """
+        Whether to take a snapshot at the start of measure i.
+        """
+        return (i - cancer_start) % self.every == 0 or i == first_action(
+            t_params, cancer_start, score_length
+        )
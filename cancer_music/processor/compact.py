@@ -0,0 +1,772 @@
+"""
+Lightweight stand-ins for measures used while the mutation engine runs.
+Every slice is converted from music21 once, mutated as plain records,
+and turned back into a music21 Measure only when the score is assembled.
+The mutations here mirror the music21 versions in process.py and draw
+from the random generator in exactly the same order.
+"""
+
+import copy
+import random
+from fractions import Fraction
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from music21.chord import Chord
+from music21.clef import Clef
+from music21.common.enums import OffsetSpecial
+from music21.common.numberTools import opFrac
+from music21.duration import Duration
+from music21.instrument import Instrument
+from music21.meter.base import TimeSignature
+from music21.note import GeneralNote, Lyric, Note, Rest
+from music21.stream.base import Measure, Part, Stream, Voice
+from music21.volume import Volume
+
+from cancer_music.processor import utils
+
+Offset = Union[Fraction, float]
+
+NOTE = 0
+CHORD = 1
+REST = 2
+
+MAX_SUBDIVISION_QUARTER_LENGTH = 0.125
+
+# velocity, velocityScalar, velocityIsRelative
+VolumeInfo = Tuple[Optional[int], Optional[float], bool]
+
+
+class CompactNote:
+    """
+    A note, chord or rest of a compact measure. Records are never
+    modified once built, so measures can share them freely.
+
+    Records converted from a score keep a reference to the music21
+    element in source and are deep copied from it on assembly,
+    anything made up by a mutation is rebuilt from the fields.
+    """
+
+    __slots__ = (
+        "offset",
+        "ql",
+        "kind",
+        "pitches",
+        "volumes",
+        "voice",
+        "lyrics",
+        "source",
+        "shifts",
+        "grace",
+    )
+
+    def __init__(
+        self,
+        offset: Offset,
+        ql: Offset,
+        kind: int,
+        pitches: Tuple[str, ...],
+        volumes: Tuple[Optional[VolumeInfo], ...],
+        voice: Optional[int] = None,
+        lyrics: Optional[Tuple[str, ...]] = None,
+        source: Optional[GeneralNote] = None,
+        shifts: Tuple[int, ...] = (),
+        grace: bool = False,
+    ):
+        self.offset = offset
+        self.ql = ql
+        self.kind = kind
+        # nameWithOctave of the note, or of every note of a chord
+        self.pitches = pitches
+        # volume of the note, or of the chord followed by its notes,
+        # None for chord notes without a volume of their own
+        self.volumes = volumes
+        self.voice = voice
+        # None keeps the lyrics of source
+        self.lyrics = lyrics
+        self.source = source
+        # transpositions applied on top of source
+        self.shifts = shifts
+        self.grace = grace
+
+    def replace(self, **changes) -> "CompactNote":
+        fields = {k: getattr(self, k) for k in CompactNote.__slots__}
+        fields.update(changes)
+        return CompactNote(**fields)
+
+
+class CompactMeasure:
+    """
+    A measure as a flat list of records. Notes and extras (clefs,
+    dynamics, ...) refer to their voice by index into voices, which
+    holds (offset, source voice) pairs and is empty for measures
+    without voices.
+
+    The lists are only filled in by the mutation that makes the
+    measure. Once it is returned they are never changed, so copies
+    share them with the measure they copy.
+    """
+
+    __slots__ = ("source", "notes", "voices", "extras", "lyrics", "placed")
+
+    def __init__(
+        self,
+        source: Optional[Measure],
+        notes: List[CompactNote],
+        voices: List[Tuple[Offset, Optional[Voice]]],
+        extras: List[Tuple[Optional[int], Offset, object]],
+        lyrics: Optional[Tuple[str, ...]] = None,
+    ):
+        # measure the non-element attributes are taken from
+        self.source = source
+        self.notes = notes
+        self.voices = voices
+        self.extras = extras
+        # lyrics of every note in place of their own, None keeps them
+        self.lyrics = lyrics
+        # index of the measure this was placed at, None if never placed
+        self.placed: Optional[int] = None
+
+    def container(self, voice: Optional[int]) -> List[CompactNote]:
+        return [n for n in self.notes if n.voice == voice]
+
+    def flat_offset(self, n: CompactNote) -> Offset:
+        if n.voice is None:
+            return n.offset
+        return opFrac(self.voices[n.voice][0] + n.offset)
+
+    def sort(self):
+        # stable, so ties keep their insertion order like music21 does
+        self.notes.sort(
+            key=lambda n: (
+                -1 if n.voice is None else n.voice,
+                n.offset,
+                not n.grace,
+            )
+        )
+
+
+def volume_info(v: Volume) -> VolumeInfo:
+    return (v.velocity, v.velocityScalar, v.velocityIsRelative)
+
+
+def duplicate_volume(info: Optional[VolumeInfo]) -> VolumeInfo:
+    """
+    Compact counterpart of utils.duplicate_volume.
+    """
+    if info is not None and info[0] is not None:
+        return info
+    return volume_info(Volume(velocity=127))
+
+
+def from_element(el: GeneralNote, voice: Optional[int]) -> CompactNote:
+    if isinstance(el, Chord):
+        kind = CHORD
+        pitches = tuple(n.nameWithOctave for n in el.notes)
+        # n.volume creates a volume on the note, and music21 exports
+        # a chord whose notes all have one at the notes' velocities
+        volumes = (volume_info(el.volume),) + tuple(
+            volume_info(n.volume) if n.hasVolumeInformation() else None
+            for n in el.notes
+        )
+    elif isinstance(el, Note):
+        kind = NOTE
+        pitches = (el.nameWithOctave,)
+        volumes = (volume_info(el.volume),)
+    else:
+        kind = REST
+        pitches = ()
+        volumes = ()
+    return CompactNote(
+        el.offset,
+        el.duration.quarterLength,
+        kind,
+        pitches,
+        volumes,
+        voice=voice,
+        source=el,
+        grace=el.duration.isGrace,
+    )
+
+
+def matches(obj, classes: Sequence[str]) -> bool:
+    return not obj.classSet.isdisjoint(classes)
+
+
+def from_measure(
+    m: Measure,
+    dropList: Sequence[str] = (),
+    lyrics: Optional[Tuple[str, ...]] = None,
+) -> CompactMeasure:
+    """
+    Converts a music21 measure, dropping the same elements as
+    utils.copy_measure.
+
+    :param m: Measure to convert.
+    :param dropList: Classes to drop besides barlines.
+    :param lyrics: Lyrics to give every note and rest, None keeps them.
+    :returns: The compact measure.
+    """
+    drop = ["Barline"] + list(dropList)
+    notes = []
+    voices = []
+    extras = []
+    for el in m:
+        if isinstance(el, Voice):
+            index = len(voices)
+            voices.append((m.elementOffset(el), el))
+            for vel in el:
+                if isinstance(vel, GeneralNote):
+                    notes.append(from_element(vel, index))
+                else:
+                    extras.append((index, vel.offset, vel))
+        elif isinstance(el, GeneralNote):
+            notes.append(from_element(el, None))
+        elif not matches(el, drop):
+            extras.append((None, m.elementOffset(el), el))
+
+    cm = CompactMeasure(m, notes, voices, extras, lyrics)
+    cm.sort()
+    return cm
+
+
+def copy_measure(
+    cm: CompactMeasure,
+    dropList: Sequence[str] = (),
+    lyrics: Optional[Tuple[str, ...]] = None,
+) -> CompactMeasure:
+    """
+    Compact counterpart of utils.copy_measure. Only the extras outside
+    of voices are subject to dropList, like removeByClass.
+
+    :param lyrics: Lyrics to give every note and rest, None keeps them.
+    :returns: A measure sharing the notes and voices of cm.
+    """
+    drop = ["Barline"] + list(dropList)
+    extras = [
+        e for e in cm.extras if e[0] is not None or not matches(e[2], drop)
+    ]
+    if len(extras) == len(cm.extras):
+        extras = cm.extras
+    if lyrics is None:
+        lyrics = cm.lyrics
+    return CompactMeasure(cm.source, cm.notes, cm.voices, extras, lyrics)
+
+
+def duplicate_element(
+    n: CompactNote, voice: Optional[int], offset: Offset
+) -> CompactNote:
+    """
+    Compact counterpart of utils.duplicate_element,
+    the copy loses lyrics and everything else not kept in the record.
+    """
+    if n.kind == REST:
+        volumes = ()
+    else:
+        volumes = tuple(duplicate_volume(v) for v in n.volumes)
+    return CompactNote(offset, n.ql, n.kind, n.pitches, volumes, voice, ())
+
+
+def subdivide_element(
+    n: CompactNote, voice: Optional[int], offset: Offset
+) -> CompactNote:
+    dup = duplicate_element(n, voice, offset)
+    dup.ql = opFrac(n.ql * 0.5)
+    return dup
+
+
+def random_offsets(cm: CompactMeasure, rng: random.Random) -> List[Offset]:
+    """
+    Compact counterpart of utils.random_offsets.
+    """
+    timing = list(set([cm.flat_offset(n) for n in cm.notes]))
+    timing.sort()
+    start = rng.randint(0, len(timing) - 1)
+    return timing[start:]
+
+
+def containers(cm: CompactMeasure) -> List[Optional[int]]:
+    if len(cm.voices) > 0:
+        return list(range(len(cm.voices)))
+    return [None]
+
+
+def first_at(
+    notes: List[CompactNote], offset: Offset
+) -> Optional[CompactNote]:
+    for n in notes:
+        if n.offset == offset:
+            return n
+    return None
+
+
+def copy_inverse(cm: CompactMeasure, offsets: List[Offset]) -> CompactMeasure:
+    """
+    Compact counterpart of utils.copy_inverse.
+    """
+    lo = min(offsets)
+    hi = max(offsets)
+    voices = [(0, None) for _ in cm.voices]
+    notes = []
+    for v in containers(cm):
+        for n in cm.container(v):
+            if n.offset < lo or n.offset > hi:
+                notes.append(duplicate_element(n, v, n.offset))
+    return CompactMeasure(None, notes, voices, [])
+
+
+def subdivide_stream(
+    s: CompactMeasure, og: CompactMeasure, offsets: List[Offset]
+):
+    """
+    Compact counterpart of process.subdivide_stream.
+    """
+    for v in containers(og):
+        notes = og.container(v)
+        off = None
+        for offset in offsets:
+            el = first_at(notes, offset)
+            if el is not None:
+                if off is None:
+                    off = el.offset
+                if el.ql >= MAX_SUBDIVISION_QUARTER_LENGTH:
+                    new_el = subdivide_element(el, v, off)
+                else:
+                    new_el = duplicate_element(el, v, off)
+                s.notes.append(new_el)
+                off = opFrac(off + new_el.ql)
+
+        sub_offset = 0
+        for offset in offsets:
+            el = first_at(notes, offset)
+            if el is not None and el.ql >= MAX_SUBDIVISION_QUARTER_LENGTH:
+                new_el = subdivide_element(el, v, opFrac(off + sub_offset))
+                new_el.lyrics = ("i",)
+                s.notes.append(new_el)
+                sub_offset = opFrac(sub_offset + new_el.ql)
+    s.sort()
+
+
+def delete_substring(
+    s: CompactMeasure, og: CompactMeasure, offsets: List[Offset]
+):
+    """
+    Compact counterpart of process.delete_substring.
+    """
+    for v in containers(og):
+        el = None
+        for n in og.container(v):
+            if n.offset <= max(offsets):
+                el = n
+        ql = opFrac(el.offset - min(offsets) + el.ql)
+        s.notes.append(CompactNote(min(offsets), ql, REST, (), (), v, ("d",)))
+    s.sort()
+
+
+def invert_stream(
+    s: CompactMeasure, og: CompactMeasure, offsets: List[Offset]
+):
+    """
+    Compact counterpart of process.invert_stream.
+    """
+    for v in containers(og):
+        notes = og.container(v)
+        found = [first_at(notes, o) for o in offsets]
+        found = [n for n in found if n is not None]
+        if len(found) > 0:
+            off = found[0].offset
+            found.reverse()
+            for el in found:
+                new_el = duplicate_element(el, v, off)
+                new_el.lyrics = ("iv",)
+                s.notes.append(new_el)
+                off = opFrac(off + new_el.ql)
+    s.sort()
+
+
+@lru_cache(maxsize=None)
+def transpose_name(name: str, degree: int) -> str:
+    n = Note(nameWithOctave=name)
+    n.transpose(degree, inPlace=True)
+    return n.nameWithOctave
+
+
+def transpose_measure(
+    cm: CompactMeasure, offsets: List[Offset], degree: int
+) -> CompactMeasure:
+    """
+    Compact counterpart of process.transpose_measure. Only notes
+    outside of voices are transposed, chords are left alone.
+    """
+    transposed = copy_measure(cm)
+    notes = []
+    for n in cm.notes:
+        if n.voice is None and n.kind == NOTE and n.offset in offsets:
+            n = n.replace(
+                pitches=(transpose_name(n.pitches[0], degree),),
+                shifts=n.shifts + (degree,),
+                lyrics=("t",),
+            )
+        elif cm.lyrics is not None:
+            n = n.replace(lyrics=cm.lyrics)
+        notes.append(n)
+    transposed.notes = notes
+    transposed.lyrics = None
+    return transposed
+
+
+class ParentMeasures:
+    """
+    The measures of an original part that translocations draw from.
+    Time signatures are looked up once per measure, and the non-empty
+    measures are grouped by time signature so picking a replacement
+    does not scan the part.
+    """
+
+    def __init__(self, part: Part):
+        self.part = part
+        self.measures = list(part.getElementsByClass("Measure"))
+        index = utils.TimeSignatureIndex(part)
+        self.times = [time_key(index.at(m.offset)) for m in self.measures]
+        # non-empty measures in score order, by time signature
+        self.by_time: Dict[Optional[Tuple[int, int]], List[int]] = {}
+        for k, m in enumerate(self.measures):
+            # recurse, as voiced measures have no notes of their own
+            if m.recurse().notes.first() is not None:
+                self.by_time.setdefault(self.times[k], []).append(k)
+        self.converted: Dict[int, CompactMeasure] = {}
+
+    def time_at(self, cm: CompactMeasure) -> Tuple[int, int]:
+        # measures that were never placed sit at offset 0
+        k = 0 if cm.placed is None else cm.placed
+        if self.times[k] is None:
+            raise ValueError(f"No time signature found for measure {k}.")
+        return self.times[k]
+
+    def measure(self, k: int) -> CompactMeasure:
+        if k not in self.converted:
+            self.converted[k] = from_measure(
+                self.measures[k], ["Clef", "KeySignature", "TimeSignature"]
+            )
+        return self.converted[k]
+
+
+def time_key(ts: Optional[TimeSignature]) -> Optional[Tuple[int, int]]:
+    if ts is None:
+        return None
+    return (ts.numerator, ts.denominator)
+
+
+def noop(cm: CompactMeasure, __: random.Random, _: ParentMeasures):
+    return copy_measure(cm)
+
+
+def insertion(cm: CompactMeasure, rng: random.Random, _: ParentMeasures):
+    offsets = random_offsets(cm, rng)
+    m = copy_inverse(cm, offsets)
+    subdivide_stream(m, cm, offsets)
+    return m
+
+
+def transposition(cm: CompactMeasure, rng: random.Random, _: ParentMeasures):
+    choice = rng.choice([-1, 1])
+    offsets = random_offsets(cm, rng)
+    return transpose_measure(cm, offsets, choice)
+
+
+def deletion(cm: CompactMeasure, rng: random.Random, _: ParentMeasures):
+    offsets = random_offsets(cm, rng)
+    m = copy_inverse(cm, offsets)
+    delete_substring(m, cm, offsets)
+    return m
+
+
+def translocation(
+    cm: CompactMeasure, rng: random.Random, parent: ParentMeasures
+):
+    safe = parent.by_time.get(parent.time_at(cm), [])
+    return copy_measure(parent.measure(rng.choice(safe)), lyrics=("tl",))
+
+
+def inversion(cm: CompactMeasure, rng: random.Random, _: ParentMeasures):
+    offsets = random_offsets(cm, rng)
+    # skip inversion if only one element is selected
+    if len(offsets) > 1:
+        m = copy_inverse(cm, offsets)
+        invert_stream(m, cm, offsets)
+    else:
+        m = noop(cm, rng, _)
+    return m
+
+
+# same order as the weights passed to process.choose_mutation
+MUTATIONS = [
+    noop,
+    insertion,
+    transposition,
+    deletion,
+    translocation,
+    inversion,
+]
+
+
+def to_element(
+    n: CompactNote, lyrics: Optional[Tuple[str, ...]] = None
+) -> GeneralNote:
+    if n.source is not None:
+        el = copy.deepcopy(n.source)
+        for degree in n.shifts:
+            el.transpose(degree, inPlace=True)
+    elif n.kind == CHORD:
+        el = Chord()
+        for name, v in zip(n.pitches, n.volumes[1:]):
+            dn = Note(nameWithOctave=name)
+            dn.duration = Duration(n.ql)
+            if v is not None:
+                dn.volume = Volume(
+                    velocity=v[0],
+                    velocityScalar=v[1],
+                    velocityIsRelative=v[2],
+                )
+            el.add(dn)
+        el.duration.quarterLength = n.ql
+        v = n.volumes[0]
+        el.volume = Volume(
+            velocity=v[0], velocityScalar=v[1], velocityIsRelative=v[2]
+        )
+    elif n.kind == NOTE:
+        el = Note(nameWithOctave=n.pitches[0])
+        el.duration = Duration(n.ql)
+        v = n.volumes[0]
+        el.volume = Volume(
+            velocity=v[0], velocityScalar=v[1], velocityIsRelative=v[2]
+        )
+    else:
+        el = Rest(length=n.ql)
+
+    # lyrics given for the whole measure win over the note's own
+    if lyrics is None:
+        lyrics = n.lyrics
+    if lyrics is not None:
+        el.lyrics = []
+        for text in lyrics:
+            el.addLyric(text)
+    return el
+
+
+def to_measure(cm: CompactMeasure, number: Optional[int] = None) -> Measure:
+    """
+    Builds the music21 measure a compact measure stands for.
+
+    :param cm: Measure to build.
+    :param number: Measure number to give it.
+    :returns: A new music21 measure.
+    """
+    m = Measure() if cm.source is None else cm.source.cloneEmpty()
+    if number is not None:
+        m.number = number
+
+    voices = []
+    for offset, v in cm.voices:
+        nv = Voice() if v is None else v.cloneEmpty()
+        voices.append(nv)
+        m.insert(offset, nv)
+
+    for voice, offset, obj in cm.extras:
+        target = m if voice is None else voices[voice]
+        target.insert(offset, copy.deepcopy(obj))
+
+    for n in cm.notes:
+        target = m if n.voice is None else voices[n.voice]
+        target.insert(n.offset, to_element(n, cm.lyrics))
+    return m
+
+
+# placeholders for measures of a mutant part that are still music21 ones
+COPY = "copy"
+TEMPLATE = "template"
+TEMPLATE_OF = "template_of"
+
+Slot = Union[CompactMeasure, Tuple[str, object]]
+
+TEMPLATE_REMOVED = [Instrument, GeneralNote, Lyric]
+
+
+def template_of(slot: Slot) -> Slot:
+    """
+    Slot standing for the Part.template of a slot, as made by
+    utils.duplicate_part. Templates of templates are the same measure.
+    """
+    if isinstance(slot, tuple) and slot[0] in (TEMPLATE, TEMPLATE_OF):
+        return slot
+    return (TEMPLATE_OF, slot)
+
+
+def template_measure(m: Measure) -> Measure:
+    # what utils.duplicate_part leaves of a measure
+    return m.template(fillWithRests=True, removeClasses=TEMPLATE_REMOVED)
+
+
+def build_slot(slot: Slot, measures: List[Measure], number: int) -> Measure:
+    if isinstance(slot, CompactMeasure):
+        return to_measure(slot, number)
+    kind, arg = slot
+    if kind == COPY:
+        # same as utils.copy_measure, but deep copying a measure that
+        # sits in a part costs time proportional to the part
+        return to_measure(from_measure(measures[arg]))
+    if kind == TEMPLATE_OF:
+        return template_measure(build_slot(arg, measures, number))
+    return template_measure(measures[arg])
+
+
+# beamed measures already built for the parts of one original
+Shared = Dict[tuple, Measure]
+
+
+def slot_key(slot: Slot) -> tuple:
+    if isinstance(slot, CompactMeasure):
+        # copies share their lists with the measure they copy, and
+        # build the same measure wherever they are placed
+        return (
+            id(slot.source),
+            id(slot.notes),
+            id(slot.voices),
+            id(slot.extras),
+            slot.lyrics,
+        )
+    return slot
+
+
+def context_key(ts: Optional[TimeSignature], clef: Optional[Clef]) -> tuple:
+    # what beam looks at of the measure's context
+    return (
+        (
+            None
+            if ts is None
+            else (ts.ratioString, str(ts.beamSequence), str(ts.beatSequence))
+        ),
+        (
+            None
+            if clef is None
+            else (type(clef), clef.sign, clef.line, clef.octaveChange)
+        ),
+    )
+
+
+def build_shared(
+    slot: Slot,
+    measures: List[Measure],
+    number: int,
+    ts: Optional[TimeSignature],
+    clef: Optional[Clef],
+    shared: Optional[Shared],
+) -> Measure:
+    """
+    Builds and beams the measure of a slot, or copies the one built
+    for an earlier slot with the same contents and context. Offspring
+    play their parent's measures until they mutate them, so most
+    measures of a score with many subclones are built only once.
+
+    :param shared: Measures built so far, None to build every one.
+    :returns: A measure that is not shared with anything.
+    """
+    if shared is None:
+        new = build_slot(slot, measures, number)
+        beam(new, ts, clef)
+        return new
+    key = (slot_key(slot), context_key(ts, clef))
+    if key not in shared:
+        new = build_slot(slot, measures, number)
+        beam(new, ts, clef)
+        shared[key] = new
+    new = copy.deepcopy(shared[key])
+    new.number = number
+    return new
+
+
+def to_part(
+    p: Part,
+    id: int,
+    slots: List[Slot],
+    shared: Optional[Shared] = None,
+) -> Part:
+    """
+    Assembles a mutant part from the original it descends from, in a
+    single pass over the original. Gives the same part as building
+    utils.duplicate_part and replacing its measures one by one, without
+    re-sorting the part after every measure.
+
+    :param p: Original part.
+    :param id: Id of the mutant part.
+    :param slots: What to put at each measure.
+    :param shared: Measures built for earlier parts of the same
+    original, see build_shared.
+    :returns: The music21 part.
+    """
+    part = p.cloneEmpty(derivationMethod="template")
+    measures = list(p.getElementsByClass("Measure"))
+    built = []
+    ts = None
+    clef = None
+    for el in p:
+        offset = p.elementOffset(el, returnSpecial=True)
+        if isinstance(el, Measure):
+            # the context comes from the original, mutated measures
+            # drop their time signature and clef. Copies, so lending
+            # them out leaves el untouched
+            if el.timeSignature is not None:
+                ts = copy.deepcopy(el.timeSignature)
+            clefs = el.getElementsByClass(Clef)
+            if len(clefs) > 0:
+                clef = copy.deepcopy(clefs.last())
+            new = build_shared(
+                slots[len(built)], measures, el.number, ts, clef, shared
+            )
+            built.append((el, new))
+        elif isinstance(el, Stream):
+            new = el.template(
+                fillWithRests=True, removeClasses=TEMPLATE_REMOVED
+            )
+        elif not el.classSet.isdisjoint(TEMPLATE_REMOVED):
+            continue
+        else:
+            new = copy.deepcopy(el)
+
+        if offset == OffsetSpecial.AT_END:
+            part.coreStoreAtEnd(new)
+        else:
+            part.coreInsert(offset, new)
+
+    for old, new in built:
+        part.spannerBundle.replaceSpannedElement(old, new)
+    part.coreElementsChanged()
+    part.streamStatus.beams = True
+    utils.add_instrument(part, p, id)
+    return part
+
+
+def beam(m: Measure, ts: Optional[TimeSignature], clef: Optional[Clef]):
+    """
+    Beams a measure that is not in a part yet, like makeBeams on the
+    finished part would. Beaming inside the part invalidates the part's
+    caches, so every measure's time signature and clef lookup would
+    rebuild them.
+
+    :param m: Measure to beam.
+    :param ts: Time signature in effect at the start of the measure.
+    :param clef: Clef in effect at the start of the measure.
+    """
+    # lend the measure its context for the duration of the call
+    lent = []
+    if ts is not None and m.timeSignature is None:
+        lent.append(ts)
+    if clef is not None and m.clef is None:
+        lent.append(clef)
+    for obj in lent:
+        m.insert(0, obj)
+    try:
+        m.makeBeams(inPlace=True)
+    finally:
+        for obj in lent:
+            m.remove(obj)
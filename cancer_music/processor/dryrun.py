@@ -0,0 +1,236 @@
+"""
+Runs the clonal evolution of mutate without writing any music.
+
+mutate builds the tree of subclones, decides when each is alive and
+which mutation hits which measure, all while copying measures around.
+Those decisions draw from random streams of their own, apart from the
+streams the mutations themselves draw from, so they do not depend on
+the notes at all. For a given score and seed, simulate makes the same
+draws as mutate and ends up with the same tree, annotations and
+mutation choices, without touching a measure.
+
+    dry = dryrun.prepare(s)
+    runs = [dryrun.simulate(dry, params, t_params, seed) for seed in seeds]
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+from music21.stream.base import Score
+
+from cancer_music.processor import compact, process, utils
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+
+class DryScore:
+    """
+    What simulate needs to know of a score: its number of parts and
+    its length in measures.
+    """
+
+    def __init__(self, parts: int, length: int):
+        self.parts = parts
+        self.length = length
+
+
+def prepare(s: Score, normalized: bool = False) -> DryScore:
+    """
+    Measures a score once for any number of runs.
+
+    :param s: Music21 stream for a file, it is not modified.
+    :param normalized: Set if s came out of process.normalize.
+    :returns: The score's size.
+    """
+    ref = s if normalized else process.normalize(s)
+    parts = len(ref.getElementsByClass("Part"))
+    return DryScore(parts, utils.get_score_length_in_measures(ref))
+
+
+class DryRun:
+    """
+    The outcome of a simulated mutate.
+
+    tree and the parent, start, alive, mutants and annotations of each
+    entry of info are what mutate holds at its end. alive lists the
+    subclones that play a mutated measure at each measure of the
+    score, and mutations holds (measure, subclone, mutation name) for
+    every mutation drawn, in the order they were drawn.
+    """
+
+    def __init__(
+        self,
+        tree: Dict[int, List[int]],
+        info: Dict[int, dict],
+        alive: List[List[int]],
+        mutations: List[Tuple[int, int, str]],
+    ):
+        self.tree = tree
+        self.info = info
+        self.alive = alive
+        self.mutations = mutations
+
+
+def simulate(
+    dry: DryScore,
+    params: Parameters,
+    t_params: TherapyParameters,
+    seed: int,
+) -> DryRun:
+    """
+    Runs the loop of process.mutate without the mutations. Keep the
+    two in step: every draw mutate makes to decide what its subclones
+    do is made here too.
+
+    :param dry: The score, see prepare.
+    :param params: Mutation parameters, as for mutate.
+    :param t_params: Therapy parameters, as for mutate.
+    :param seed: Seed, as for mutate.
+    :returns: The tree, subclones and mutations mutate would produce.
+    """
+    ids = list(range(dry.parts))
+    streams = utils.reseed(seed)
+    setup = streams("setup")
+    tree: Dict[int, List[int]] = {i: [] for i in ids}
+
+    candidates = setup.sample(ids, setup.randint(1, len(ids)))
+    candidates.sort()
+    available_id = len(ids)
+
+    score_length = dry.length
+    cancer_start = math.floor(params["start"] * score_length) - 1
+    therapy_start = math.floor(t_params["start"] * score_length) - 1
+
+    info: Dict[int, dict] = {}
+    mutants = []
+    for p in candidates:
+        mutants.append(p)
+        info[p] = {
+            "parent": p,
+            "alive": True,
+            "start": cancer_start,
+            "mutants": utils.choose_for_slices(
+                cancer_start,
+                score_length,
+                params["how_many"],
+                streams(p, "schedule"),
+            ),
+            "annotations": {0: str(p)},
+        }
+
+    offspring_count = 0
+    weights = [
+        params["noop"],
+        params["insertion"],
+        params["transposition"],
+        params["deletion"],
+        params["translocation"],
+        params["inversion"],
+    ]
+    alive: List[List[int]] = [[] for _ in range(score_length)]
+    mutations: List[Tuple[int, int, str]] = []
+
+    therapy = streams("therapy")
+    therapy_started = False
+    for i in range(cancer_start, score_length):
+        if (
+            t_params["therapy_mode"] == Therapy.ADAPTIVE
+            and (i - cancer_start) % t_params["adaptive_interval"] == 0
+        ):
+            living = [mut for mut in mutants if info[mut]["alive"]]
+            if len(living) > t_params["adaptive_threshold"]:
+                to_kill = therapy.sample(
+                    living, len(living) - t_params["adaptive_threshold"]
+                )
+                for mp in to_kill:
+                    info[mp]["alive"] = False
+                    info[mp]["annotations"][i] = "c"
+        elif i == therapy_start and not therapy_started:
+            if t_params["therapy_mode"] == Therapy.CURE:
+                for mp in mutants:
+                    info[mp]["alive"] = False
+
+            if t_params["therapy_mode"] == Therapy.PARTIAL_CURE:
+                survivor = therapy.choice(mutants)
+                info[survivor]["annotations"][i] = "s"
+
+                for mp in mutants:
+                    if mp != survivor:
+                        info[mp]["alive"] = False
+                        info[mp]["annotations"][i] = "c"
+            therapy_started = True
+
+        for mp in mutants:
+            m_info = info[mp]
+            parent = m_info["parent"]
+            start = m_info["start"]
+
+            if m_info["alive"] and i >= start:
+                if i in m_info["mutants"]:
+                    mutation = process.choose_mutation(
+                        streams(mp, "choice"), weights, compact.MUTATIONS
+                    )
+                    mutations.append((i, mp, mutation.__name__))
+                if i >= 0:
+                    alive[i].append(mp)
+
+                rng = streams(mp, "reproduction")
+                if (i - start) % params[
+                    "how_many"
+                ] == 0 and rng.random() < params["reproduction"]:
+                    if offspring_count < params["max_parts"]:
+                        dup = available_id
+                        mutants.append(dup)
+                        offset = rng.randint(
+                            0, math.floor(params["how_many"] / 2)
+                        )
+                        new_start = i + offset
+                        tree[parent].append(dup)
+                        info[dup] = {
+                            "parent": parent,
+                            "start": new_start,
+                            "alive": True,
+                            "mutants": utils.choose_for_slices(
+                                cancer_start,
+                                score_length,
+                                params["how_many"],
+                                streams(dup, "schedule"),
+                            ),
+                            "annotations": {
+                                0: str(available_id),
+                                new_start: f"a.{mp}; off {offset}",
+                            },
+                        }
+                        available_id += 1
+                        offspring_count += 1
+                    else:
+                        dead = [
+                            p
+                            for p in mutants
+                            if not info[p]["alive"]
+                            and info[p]["parent"] == parent
+                            and p != mp
+                        ]
+                        if len(dead) > 0:
+                            new_child = rng.choice(dead)
+                            info[new_child]["alive"] = True
+                            info[new_child]["start"] = i
+                            info[new_child]["annotations"][i] = f"r.{mp}"
+
+    return DryRun(tree, info, alive, mutations)
+
+
+def dry_run(
+    s: Score,
+    params: Parameters,
+    t_params: TherapyParameters,
+    seed: int,
+    normalized: bool = False,
+) -> DryRun:
+    """
+    Simulates a single mutate of a score, see prepare and simulate.
+    """
+    return simulate(prepare(s, normalized), params, t_params, seed)
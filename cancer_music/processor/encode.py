@@ -0,0 +1,206 @@
+"""
+Compresses rendered audio on the fly with a local encoder process,
+so a render never has to be held in memory as raw PCM.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from enum import Enum
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from cancer_music.processor import synth
+
+FFMPEG = os.environ.get("CANCER_MUSIC_FFMPEG", "ffmpeg")
+OPUS_BITRATE = "128k"
+# bytes read from the encoder per chunk handed out
+READ_BYTES = 1 << 16
+
+
+class AudioFormat(str, Enum):
+    WAV = "wav"
+    FLAC = "flac"
+    OPUS = "opus"
+
+
+MEDIA_TYPES: Dict[AudioFormat, str] = {
+    AudioFormat.WAV: "audio/wav",
+    AudioFormat.FLAC: "audio/flac",
+    AudioFormat.OPUS: "audio/ogg",
+}
+
+
+class EncoderError(RuntimeError):
+    """
+    Raised when the encoder is missing or fails.
+    """
+
+
+def pcm_input() -> List[str]:
+    return [
+        "-f",
+        "s16le",
+        "-ar",
+        str(synth.SAMPLE_RATE),
+        "-ac",
+        str(synth.CHANNELS),
+        "-i",
+        "pipe:0",
+    ]
+
+
+def encoder_command(fmt: AudioFormat) -> List[str]:
+    """
+    :returns: Command reading raw PCM from stdin and writing the
+    encoded stream to stdout.
+    """
+    base = [FFMPEG, "-hide_banner", "-loglevel", "error", *pcm_input()]
+    if fmt == AudioFormat.FLAC:
+        return base + ["-c:a", "flac", "-f", "flac", "pipe:1"]
+    if fmt == AudioFormat.OPUS:
+        return base + [
+            "-c:a",
+            "libopus",
+            "-b:a",
+            OPUS_BITRATE,
+            "-f",
+            "ogg",
+            "pipe:1",
+        ]
+    raise ValueError(f"{fmt.value} is not encoded by a subprocess.")
+
+
+def available(fmt: AudioFormat) -> bool:
+    """
+    Checks whether a format can be produced on this machine.
+    """
+    return fmt == AudioFormat.WAV or shutil.which(FFMPEG) is not None
+
+
+def encode_chunks(
+    chunks: Iterator[np.ndarray], command: List[str]
+) -> Iterator[bytes]:
+    """
+    Pipes int16 sample chunks through an encoder as they are rendered
+    and hands out its output as it arrives. A thread feeds the
+    encoder so neither pipe can fill up and stall the other.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :param command: Encoder reading PCM on stdin, see encoder_command.
+    :returns: Iterator over the encoded bytes.
+    :raises EncoderError: Raised if the encoder is missing or fails.
+    """
+    try:
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise EncoderError(f"Audio encoder {command[0]} not found.")
+
+    failed: List[BaseException] = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk.astype(np.int16, copy=False).tobytes())
+        except BrokenPipeError:
+            # the encoder died, its exit code tells why
+            pass
+        except BaseException as e:
+            failed.append(e)
+        finally:
+            # close the render here and now, so a pooled synth is
+            # reset before it goes back to the pool
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        while True:
+            data = proc.stdout.read(READ_BYTES)
+            if not data:
+                break
+            yield data
+        feeder.join()
+        errors = proc.stderr.read().decode(errors="replace").strip()
+        if proc.wait() != 0:
+            raise EncoderError(f"Audio encoder failed: {errors}")
+        if failed:
+            raise failed[0]
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        feeder.join()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def pack(chunks: Iterator[np.ndarray], fmt: AudioFormat) -> Iterator[bytes]:
+    """
+    Turns rendered chunks into a file of the given format.
+    Compressed formats stream as they encode. The header of a WAV
+    needs the length of the render, so WAV is written to a temporary
+    file first and read back once it is complete.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :param fmt: Format to produce.
+    :returns: Iterator over the bytes of the audio file.
+    """
+    if fmt == AudioFormat.WAV:
+        with tempfile.TemporaryFile() as f:
+            synth.write_wav(chunks, f)
+            f.seek(0)
+            while True:
+                data = f.read(READ_BYTES)
+                if not data:
+                    break
+                yield data
+        return
+    yield from encode_chunks(chunks, encoder_command(fmt))
+
+
+def render_audio(
+    mf, fmt: AudioFormat, fs: synth.PatchedSynth
+) -> Iterator[bytes]:
+    """
+    Renders a MIDI file in the given format, see pack.
+
+    :param mf: The MIDI file to render.
+    :param fmt: Format to produce.
+    :param fs: Preloaded synth to render with.
+    :returns: Iterator over the bytes of the audio file.
+    """
+    return pack(synth.render_chunks(mf, fs=fs), fmt)
+
+
+def stream_audio(
+    mf, fmt: AudioFormat, fs: synth.PatchedSynth
+) -> Iterator[bytes]:
+    """
+    Renders a MIDI file in the given format, handing out each chunk
+    as soon as the synth produces it. WAV comes with open sizes in
+    its header, FLAC and Ogg streams need no sizes up front.
+
+    :param mf: The MIDI file to render.
+    :param fmt: Format to produce.
+    :param fs: Preloaded synth to render with.
+    :returns: Iterator over the bytes of the audio stream.
+    """
+    chunks = synth.render_chunks(mf, fs=fs)
+    if fmt == AudioFormat.WAV:
+        return synth.stream_wav(chunks)
+    return encode_chunks(chunks, encoder_command(fmt))
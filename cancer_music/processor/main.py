@@ -9,12 +9,44 @@ from datetime import datetime
 
 from music21 import converter
 
-from cancer_music.processor import process, utils
-from cancer_music.processor.parameters import Parameters, Therapy, TherapyParameters
+from cancer_music.processor import batch, process, utils
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+DEFAULT_PARAMS = Parameters(
+    max_parts=4,
+    reproduction=0.3,
+    how_many=4,
+    noop=0.05,
+    insertion=0.25,
+    transposition=0.15,
+    deletion=0.15,
+    translocation=0.15,
+    inversion=0.25,
+    start=0.25,
+)
+
+DEFAULT_THERAPY = TherapyParameters(
+    therapy_mode=Therapy.CURE,
+    mutant_survival=0.5,
+    start=0.75,
+    adaptive_threshold=2,
+    adaptive_interval=8,
+)
 
 
 def main():
-    parser = argparse.ArgumentParser(prog="SheetMusicMutator")
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch.main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        prog="SheetMusicMutator",
+        epilog="Run mutate_sheet batch --help to mutate many files.",
+    )
     parser.add_argument(
         "sheet_music",
         help="Sheet music to mutate. \
@@ -47,43 +79,11 @@ def main():
     except Exception as e:
         raise ValueError(f"{fp} could not be parsed: {str(e)}.")
 
-    maxParts = 4
-    reproductionProbability = 0.3
-    how_many = 4
-
-    noop = 0.05
-    insertion = 0.25
-    transposition = 0.15
-    deletion = 0.15
-    inversion = 0.25
-    translocation = 0.15
-
-    cancerStart = 0.25
-    mode = 1
-    mutant_survival = 0.5
-    start = 0.75
-
+    print("Seed", args.seed)
     s, tree = process.mutate(
         s,
-        Parameters(
-            max_parts=maxParts,
-            reproduction=reproductionProbability,
-            how_many=how_many,
-            noop=noop,
-            insertion=insertion,
-            transposition=transposition,
-            deletion=deletion,
-            translocation=translocation,
-            inversion=inversion,
-            start=cancerStart,
-        ),
-        TherapyParameters(
-            therapy_mode=Therapy(mode),
-            mutant_survival=mutant_survival,
-            start=start,
-            adaptive_threshold=2,
-            adaptive_interval=8,
-        ),
+        DEFAULT_PARAMS,
+        DEFAULT_THERAPY,
         seed=args.seed,
     )
 
@@ -1,22 +1,32 @@
+import copy
 import math
 import random
 import sys
+import time
+from concurrent.futures import Executor
 from enum import Enum
 from fractions import Fraction
-from typing import List, Optional, Union
+from typing import Callable, List, Optional, Tuple, Union
 
 from music21.note import GeneralNote, Rest
 from music21.stream.base import Measure, Part, Score, Stream
 from typeguard import typechecked
 
-from cancer_music.processor import utils
-from cancer_music.processor.parameters import Parameters, Therapy, TherapyParameters
+from cancer_music.processor import compact, timing, utils
+from cancer_music.processor.checkpoint import Checkpoints, Snapshot
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
 
 MAX_SUBDIVISION_QUARTER_LENGTH = 0.125
 
 
 def repair_stream(s):
-    for el in s.flatten().notes:
+    # recurse rather than flatten: a cached flat stream stays among the
+    # sites of every note and makes each later copy of a note slow
+    for el in s.recurse().notes:
         el.volume = utils.duplicate_volume(el)
 
     # make sure all parts have the same number of measures
@@ -29,6 +39,19 @@ def repair_stream(s):
         )
 
 
+def normalize(s: Score) -> Score:
+    """
+    Expands repeats and checks that the parts line up, which mutate
+    does first unless it is told the score is already normalized.
+
+    :param s: The score to normalize, it is not modified.
+    :returns: A normalized copy of the score.
+    """
+    ref = s.expandRepeats()
+    repair_stream(ref)
+    return ref
+
+
 class MutationStatus(Enum):
     SETUP_COMPLETE = 0
     PROCESSING = 1
@@ -41,6 +64,10 @@ def toStdOut(status: MutationStatus, *args):
         print(f"Processing measure {args[0]} of {args[1]}.", end="\r")
 
 
+def silent(status: MutationStatus, *args):
+    pass
+
+
 @typechecked
 def mutate(
     s: Score,
@@ -65,17 +92,46 @@ def mutate(
     ),
     seed: int = random.randrange(sys.maxsize),
     msgCallback=toStdOut,
+    normalized: bool = False,
+    executor: Optional[Executor] = None,
+    checkpoints: Optional[Checkpoints] = None,
 ):
     """
     Main method for mutating a file.
 
-    :param s: Music21 stream for a file.
+    Every subclone draws from random streams of its own: one for the
+    measures it mutates, one for which mutation, one for reproducing,
+    and one per mutation for the mutation itself. So the mutations of
+    a measure only depend on each other through offspring and run in
+    waves: the subclones already there first, then those born into
+    the measure, which start from their parent's mutated tumors.
+
+    :param s: Music21 stream for a file, it is not modified.
+    :param normalized: Set if s came out of normalize, so it is not
+    normalized again.
+    :param executor: Runs the mutations of each wave in parallel if
+    given, such as a ThreadPoolExecutor. The mutant only depends on
+    the seed, not on the executor.
+    :param checkpoints: Snapshots of earlier runs of the same score.
+    The loop resumes from the latest one this run shares and takes
+    new ones as it goes.
     """
-    ref = s.expandRepeats()
-    repair_stream(ref)
+    if checkpoints is not None and checkpoints.ref is not None:
+        ref = checkpoints.ref
+    elif normalized:
+        ref = s
+    else:
+        with timing.span("mutate.expand_repeats"):
+            ref = normalize(s)
+    if checkpoints is not None:
+        checkpoints.ref = ref
 
+    setup_start = time.perf_counter()
     parts = list(ref.getElementsByClass("Part"))
-    rng = utils.reseed(seed)
+    streams = utils.reseed(seed)
+    setup = streams("setup")
+    if checkpoints is not None:
+        checkpoints.begin(params, streams.seed)
 
     tree = {}
 
@@ -85,7 +141,7 @@ def mutate(
     parts.sort(key=lambda x: x.id)
 
     # possibility of multiple parts being chosen
-    candidates = rng.sample(parts, rng.randint(1, len(parts)))
+    candidates = setup.sample(parts, setup.randint(1, len(parts)))
     candidates.sort(key=lambda x: x.id)
     available_id = len(parts)
 
@@ -93,149 +149,198 @@ def mutate(
     cancer_start = math.floor(params["start"] * score_length) - 1
     therapy_start = math.floor(t_params["start"] * score_length) - 1
 
+    # the loop works on compact measures, music21 parts are only built
+    # once it is done. slots holds what goes at each measure of a mutant.
     mutation_info = {}
+    slots = {}
+    originals = {}
 
     m = Score()
     all_parts = []
     mutants = []
     for p in parts:
-        np = None
         if p in candidates:
-            np = utils.duplicate_part_keep_measures(p, p.id, cancer_start)
-            tumors = utils.slice_part(
-                p,
-                cancer_start,
-                cancer_start + params["how_many"],
-                dropList=["Clef", "KeySignature", "TimeSignature"],
-                removeLyrics=True,
-            )
-
-            mutants.append(np)
-            mutation_info[np.id] = {
-                "parent": p,
+            if checkpoints is None:
+                originals[p.id] = compact.ParentMeasures(p)
+            else:
+                if p.id not in checkpoints.originals:
+                    checkpoints.originals[p.id] = compact.ParentMeasures(p)
+                originals[p.id] = checkpoints.originals[p.id]
+            measures = originals[p.id].measures
+            kept = set(range(len(measures))[0:cancer_start])
+            slots[p.id] = [
+                (compact.COPY, k) if k in kept else (compact.TEMPLATE, k)
+                for k in range(len(measures))
+            ]
+            tumors = [
+                compact.from_measure(
+                    measure,
+                    ["Clef", "KeySignature", "TimeSignature"],
+                    lyrics=("",),
+                )
+                for measure in measures[
+                    cancer_start : cancer_start + params["how_many"]
+                ]
+            ]
+
+            mutants.append(p.id)
+            mutation_info[p.id] = {
+                "parent": p.id,
                 "tumors": tumors,
                 "alive": True,
                 "start": cancer_start,
                 "mutants": utils.choose_for_slices(
-                    cancer_start, score_length, params["how_many"], rng
+                    cancer_start,
+                    score_length,
+                    params["how_many"],
+                    streams(p.id, "schedule"),
                 ),
-                "annotations": {0: str(np.id)},
+                "annotations": {0: str(p.id)},
             }
         else:
-            np = utils.duplicate_part_keep_measures(
-                p, p.id, len(p.getElementsByClass("Measure"))
+            np = compact.to_part(
+                p,
+                p.id,
+                [
+                    (compact.COPY, k)
+                    for k in range(len(p.getElementsByClass("Measure")))
+                ],
             )
             all_parts.append(np)
             utils.annotate_first_of_measure(np, 0, str(np.id))
 
     msgCallback(MutationStatus.SETUP_COMPLETE)
+    loop_start = time.perf_counter()
+    timing.record("mutate.setup", loop_start - setup_start)
     offspring_count = 0
+    weights = [
+        params["noop"],
+        params["insertion"],
+        params["transposition"],
+        params["deletion"],
+        params["translocation"],
+        params["inversion"],
+    ]
 
-    # slice - heart of loop
     therapy_started = False
-    for i in range(cancer_start, score_length):
+    first = cancer_start
+    latest = None
+    if checkpoints is not None:
+        latest = checkpoints.latest(t_params, cancer_start, score_length)
+    if latest is not None:
+        first, snapshot = latest
+        (
+            tree,
+            mutation_info,
+            slots,
+            mutants,
+            offspring_count,
+            available_id,
+            therapy_started,
+        ) = snapshot.restore(streams)
+        checkpoints.resumed = first
+
+    # slice - heart of loop
+    therapy = streams("therapy")
+    for i in range(first, score_length):
         msgCallback(MutationStatus.PROCESSING, i, score_length)
+        if (
+            checkpoints is not None
+            and i != checkpoints.resumed
+            and checkpoints.due(i, t_params, cancer_start, score_length)
+        ):
+            checkpoints.snapshots[i] = Snapshot(
+                t_params,
+                streams,
+                tree,
+                mutation_info,
+                slots,
+                mutants,
+                offspring_count,
+                available_id,
+                therapy_started,
+            )
         # have adaptive therapy check every 2
         if (
             t_params["therapy_mode"] == Therapy.ADAPTIVE
             and (i - cancer_start) % t_params["adaptive_interval"] == 0
         ):
             # try to keep the number of mutants down
-            alive = [mut for mut in mutants if mutation_info[mut.id]["alive"]]
+            alive = [mut for mut in mutants if mutation_info[mut]["alive"]]
             if len(alive) > t_params["adaptive_threshold"]:
-                to_kill = rng.sample(
+                to_kill = therapy.sample(
                     alive, len(alive) - t_params["adaptive_threshold"]
                 )
                 for mp in to_kill:
-                    mutation_info[mp.id]["alive"] = False
-                    mutation_info[mp.id]["annotations"][i] = "c"
+                    mutation_info[mp]["alive"] = False
+                    mutation_info[mp]["annotations"][i] = "c"
         elif i == therapy_start and not therapy_started:
             if t_params["therapy_mode"] == Therapy.CURE:
                 for mp in mutants:
-                    mutation_info[mp.id]["alive"] = False
+                    mutation_info[mp]["alive"] = False
 
             if t_params["therapy_mode"] == Therapy.PARTIAL_CURE:
                 # all but one die
-                survivor = rng.choice(mutants)
-                mutation_info[survivor.id]["annotations"][i] = "s"
+                survivor = therapy.choice(mutants)
+                mutation_info[survivor]["annotations"][i] = "s"
 
                 for mp in mutants:
-                    if mp.id != survivor.id:
-                        mutation_info[mp.id]["alive"] = False
-                        mutation_info[mp.id]["annotations"][i] = "c"
+                    if mp != survivor:
+                        mutation_info[mp]["alive"] = False
+                        mutation_info[mp]["annotations"][i] = "c"
             therapy_started = True
 
+        # settle what every subclone does this measure, in order
+        jobs = []
+        births = []
+        unborn = set()
         for mp in mutants:
-            m_info = mutation_info[mp.id]
-            tumors = m_info["tumors"]
+            m_info = mutation_info[mp]
             parent = m_info["parent"]
             is_alive = m_info["alive"]
             start = m_info["start"]
             to_mutate = m_info["mutants"]
 
             if is_alive and i >= start:
-                dm = mp.getElementsByClass("Measure")[i]
-                t = tumors[(i - start) % len(tumors)]
                 if i in to_mutate:
                     mutation = choose_mutation(
-                        rng,
-                        [
-                            params["noop"],
-                            params["insertion"],
-                            params["transposition"],
-                            params["deletion"],
-                            params["translocation"],
-                            params["inversion"],
-                        ],
+                        streams(mp, "choice"), weights, compact.MUTATIONS
                     )
                 else:
-                    mutation = noop
-                mutant_measure = mutation(t, rng, parent)
-                mutant_measure.number = dm.number
-                mutant_measure.makeBeams(inPlace=True)
-                mp.replace(dm, mutant_measure)
-                tumors[(i - start) % len(tumors)] = mutant_measure
+                    mutation = compact.noop
+                jobs.append((mp, mutation))
 
+                rng = streams(mp, "reproduction")
                 if (i - start) % params[
                     "how_many"
                 ] == 0 and rng.random() < params["reproduction"]:
                     # if there's still room, create a new part
                     if offspring_count < params["max_parts"]:
-                        dup = utils.duplicate_part(mp, available_id)
+                        dup = available_id
+                        # its tumors are copied once mp has mutated
+                        births.append((dup, mp))
+                        unborn.add(dup)
                         mutants.append(dup)
                         offset = rng.randint(
                             0, math.floor(params["how_many"] / 2)
                         )
                         new_start = i + offset
                         # take greatest ancestor as parent for transpositions
-                        tree[parent.id].append(dup.id)
-                        mutation_info[dup.id] = {
+                        tree[parent].append(dup)
+                        mutation_info[dup] = {
                             "parent": parent,
-                            "tumors": list(
-                                map(
-                                    lambda measure: utils.copy_measure(
-                                        measure,
-                                        [
-                                            "Clef",
-                                            "KeySignature",
-                                            "TimeSignature",
-                                        ],
-                                        removeLyrics=True,
-                                    ),
-                                    tumors,
-                                ),
-                            ),
+                            "tumors": None,
                             "start": new_start,
                             "alive": True,
                             "mutants": utils.choose_for_slices(
                                 cancer_start,
                                 score_length,
                                 params["how_many"],
-                                rng,
+                                streams(dup, "schedule"),
                             ),
                             "annotations": {
                                 0: str(available_id),
-                                new_start: f"a.{mp.id}; off {offset}",
+                                new_start: f"a.{mp}; off {offset}",
                             },
                         }
                         available_id += 1
@@ -245,54 +350,162 @@ def mutate(
                         dead = [
                             p
                             for p in mutants
-                            if not mutation_info[p.id]["alive"]
-                            and mutation_info[p.id]["parent"] == parent
-                            and p.id != mp.id
+                            if not mutation_info[p]["alive"]
+                            and mutation_info[p]["parent"] == parent
+                            and p != mp
                         ]
                         if len(dead) > 0:
                             new_child = rng.choice(dead)
-                            mutation_info[new_child.id]["alive"] = True
-                            mutation_info[new_child.id]["start"] = i
-                            mutation_info[new_child.id]["annotations"][
+                            mutation_info[new_child]["alive"] = True
+                            mutation_info[new_child]["start"] = i
+                            mutation_info[new_child]["annotations"][
                                 i
-                            ] = f"r.{mp.id}"
+                            ] = f"r.{mp}"
+
+        # then mutate, in waves of subclones whose tumors are there
+        mutated = set()
+        while jobs:
+            wave = [job for job in jobs if job[0] not in unborn]
+            jobs = [job for job in jobs if job[0] in unborn]
+            tasks = []
+            for mp, mutation in wave:
+                m_info = mutation_info[mp]
+                t = m_info["tumors"][
+                    (i - m_info["start"]) % len(m_info["tumors"])
+                ]
+                rng = streams.fresh(mp, "mutation", i)
+                tasks.append((mutation, t, rng, originals[m_info["parent"]]))
+            if executor is None:
+                done = [apply_mutation(*task) for task in tasks]
+            else:
+                done = list(executor.map(apply_mutation, *zip(*tasks)))
+
+            for (mp, mutation), (mutant_measure, seconds) in zip(wave, done):
+                timing.record(f"mutation.{mutation.__name__}", seconds)
+                m_info = mutation_info[mp]
+                tumors = m_info["tumors"]
+                mutant_measure.placed = i
+                slots[mp][i] = mutant_measure
+                tumors[(i - m_info["start"]) % len(tumors)] = mutant_measure
+                mutated.add(mp)
+
+            for dup, mp in births:
+                if dup in unborn and mp in mutated:
+                    unborn.discard(dup)
+                    # the copies share their notes with mp's tumors
+                    slots[dup] = [compact.template_of(s) for s in slots[mp]]
+                    mutation_info[dup]["tumors"] = [
+                        compact.copy_measure(
+                            measure,
+                            ["Clef", "KeySignature", "TimeSignature"],
+                            lyrics=("",),
+                        )
+                        for measure in mutation_info[mp]["tumors"]
+                    ]
 
-    # once we're done, add all the ancestry annotations
-    for mp in mutants:
-        annotations = mutation_info[mp.id]["annotations"]
-        for k, v in annotations.items():
-            utils.annotate_first_of_measure(mp, k, v)
+    timing.record("mutate.loop", time.perf_counter() - loop_start)
+
+    # once we're done, build the parts and add the ancestry annotations
+    with timing.span("mutate.build_parts"):
+        shared = {}
+        for mp in mutants:
+            parent = mutation_info[mp]["parent"]
+            np = compact.to_part(
+                originals[parent].part,
+                mp,
+                slots[mp],
+                shared.setdefault(parent, {}),
+            )
+            annotations = mutation_info[mp]["annotations"]
+            for k, v in annotations.items():
+                # offspring born near the end may start past it
+                if k < score_length:
+                    utils.annotate_first_of_measure(np, k, v)
+            all_parts.append(np)
 
-    all_parts.extend(mutants)
     all_parts.sort(key=lambda x: x.id)
     for p in all_parts:
-        p.makeBeams(inPlace=True)
+        # beamed measure by measure in compact.to_part
         m.append(p)
 
     return m, tree
 
 
-def noop(m: Measure, __: random.Random, _: Stream):
-    return utils.copy_measure(m)
+def apply_mutation(
+    mutation: Callable,
+    t: compact.CompactMeasure,
+    rng: random.Random,
+    parent: compact.ParentMeasures,
+) -> Tuple[compact.CompactMeasure, float]:
+    """
+    Runs one mutation of mutate's loop, in whatever thread or process
+    an executor picks.
 
+    :returns: The mutated measure and the seconds it took.
+    """
+    start = time.perf_counter()
+    mutant_measure = mutation(t, rng, parent)
+    return mutant_measure, time.perf_counter() - start
 
-@typechecked
-def insertion(measure: Measure, rng: random.Random, _: Optional[Stream]):
+
+# mutation parameters, therapy parameters and seed of one mutant
+Variant = Tuple[Parameters, TherapyParameters, int]
+
+
+def mutate_variant(
+    ref: Score, variant: Variant, msgCallback=silent
+) -> Tuple[Score, dict]:
+    """
+    Mutates an already normalized score with one set of parameters.
+    """
+    p, t, seed = variant
+    return mutate(
+        ref, p, t, seed=seed, msgCallback=msgCallback, normalized=True
+    )
+
+
+def mutate_many(
+    s: Score,
+    variants: List[Variant],
+    executor: Optional[Executor] = None,
+    msgCallback=silent,
+) -> List[Tuple[Score, dict]]:
     """
-    Inserts a note into the measure, either by replacing a rest
-    or subdividing an already existing note.
+    Mutates one score many times, e.g. for a sweep over seeds or
+    therapy modes. The score is normalized once for all variants.
 
-    :param m: Measure to insert a note into.
-    :param _: Stream, unused but do not remove.
+    :param s: Music21 stream for a file.
+    :param variants: Parameters and seed of each mutant.
+    :param executor: Runs the variants in parallel if given, such as
+    a ProcessPoolExecutor. The normalized score is frozen once and
+    sent along with every variant.
+    :returns: Mutant score and tree of each variant, in order.
     """
-    offsets = utils.random_offsets(measure, rng)
-    m = utils.copy_inverse(measure, offsets)
+    if executor is None:
+        ref = normalize(s)
+        return [mutate_variant(ref, v, msgCallback) for v in variants]
+    # spanners like staff groups still point at the parts of s after
+    # expandRepeats, and freezing empties whatever they point at
+    frozen = utils.freeze(normalize(copy.deepcopy(s)))
+    futures = [
+        executor.submit(mutate_frozen, frozen, v, msgCallback)
+        for v in variants
+    ]
+    results = []
+    for f in futures:
+        m, tree = f.result()
+        results.append((utils.thaw(m), tree))
+    return results
 
-    subdivide_stream(m, measure, offsets)
-    # n = utils.get_first_element(m)
-    # n.addLyric("ins")
 
-    return m
+def mutate_frozen(
+    frozen: bytes, variant: Variant, msgCallback=silent
+) -> Tuple[bytes, dict]:
+    """
+    mutate_variant for another process, scores travel frozen.
+    """
+    m, tree = mutate_variant(utils.thaw(frozen), variant, msgCallback)
+    return utils.freeze(m), tree
 
 
 @typechecked
@@ -356,22 +569,6 @@ def subdivide_stream(
                     sub_offset += new_el.duration.quarterLength
 
 
-@typechecked
-def transposition(measure: Measure, rng: random.Random, _: Stream) -> Measure:
-    """
-    Transposes the measure by either 1 or -1 half-steps.
-
-    :param m: The measure to transpose.
-    :param _: Stream, unused, do not remove.
-    :returns: A tranposed copy of the measure.
-    """
-    options = [-1, 1]
-    choice = rng.choice(options)
-    offsets = utils.random_offsets(measure, rng)
-
-    return transpose_measure(measure, offsets, choice)
-
-
 @typechecked
 def transpose_measure(
     measure: Measure, offsets: List[Union[Fraction, float]], degree: int
@@ -396,27 +593,6 @@ def transpose_measure(
     return transposed
 
 
-@typechecked
-def deletion(measure: Measure, rng: random.Random, _: Stream):
-    """
-    Picks a random substring of the measure and
-    returns a copy with that substring replaced
-    with a rest.
-
-    :param measure: The measure to delete a substring from.
-    :param _: Stream, unused.
-    :returns: A measure with random offsets deleted.
-    """
-    offsets = utils.random_offsets(measure, rng)
-    m = utils.copy_inverse(measure, offsets)
-
-    delete_substring(m, measure, offsets)
-    # n = utils.get_first_element(m)
-    # n.addLyric("del")
-
-    return m
-
-
 @typechecked
 def delete_substring(
     s: Stream, og: Stream, offsets: List[Union[Fraction, float]]
@@ -442,64 +618,6 @@ def delete_substring(
         s.insert(min(offsets), rest)
 
 
-@typechecked
-def translocation(og: Measure, rng: random.Random, s: Stream):
-    """
-    Picks a random measure from the part to replace
-    the measure with.
-
-    :param _: Measure, unused.
-    :param s: The stream to pick a new measure from.
-    :returns: A random measure from the stream.
-    """
-
-    # filter out empty measures
-    measures = list(
-        filter(
-            lambda m: not all(
-                map(lambda n: n.isRest, m.getElementsByClass("GeneralNote"))
-            ),
-            list(s.getElementsByClass("Measure")),
-        )
-    )
-
-    # filter out measures that don't match the timesignature of the original measure
-    ts = utils.get_time(og, s)
-
-    def comp(a, b):
-        return a.numerator == b.numerator and a.denominator == b.denominator
-
-    safe = list(filter(lambda m: comp(ts, utils.get_time(m, s)), measures))
-
-    choice = utils.copy_measure(
-        rng.choice(safe), ["Clef", "KeySignature", "TimeSignature"]
-    )
-    utils.add_lyric_for_measure(choice, "tl")
-    return choice
-
-
-@typechecked
-def inversion(measure: Measure, rng: random.Random, _: Optional[Stream]):
-    """
-    Picks a set of offsets to invert in a measure and returns
-    a copy with the inverted measure.
-
-    :param measure: The measure to invert.
-    :param _: Stream, unused.
-    :returns: A measure with a random offset inverted.
-    """
-    offsets = utils.random_offsets(measure, rng)
-    # skip inversion if only one element is selected
-    if len(offsets) > 1:
-        m = utils.copy_inverse(measure, offsets)
-        invert_stream(m, measure, offsets)
-        # n = utils.get_first_element(m)
-        # n.addLyric("inv")
-    else:
-        m = noop(measure, rng, _)
-    return m
-
-
 @typechecked
 def invert_stream(
     s: Stream, og: Stream, offsets: List[Union[Fraction, float]]
@@ -538,25 +656,23 @@ def invert_stream(
 
 
 def choose_mutation(
-    rng: random.Random, weights: List[float] = [0.2, 0.2, 0.1, 0.25, 0.05, 0.2]
+    rng: random.Random,
+    weights: List[float] = [0.2, 0.2, 0.1, 0.25, 0.05, 0.2],
+    mutations: Optional[List[Callable]] = None,
 ):
     """
     Randomly picks a mutation to perform on a measure.
 
     :param weights: Weights to pick the mutations with.
+    :param mutations: Mutations to pick from, in the order of weights.
+    Defaults to the ones working on compact measures.
     :raises ValueError: Thrown if the weights do not sum to one.
     """
 
     if sum(weights) != 1.0:
         raise ValueError("Mutation weights do not sum to 1.")
 
-    mutations = [
-        noop,
-        insertion,
-        transposition,
-        deletion,
-        translocation,
-        inversion,
-    ]
+    if mutations is None:
+        mutations = compact.MUTATIONS
     # need to return 0th element because random.choices() returns a list
     return rng.choices(mutations, weights, k=1)[0]
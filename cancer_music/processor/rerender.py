@@ -0,0 +1,356 @@
+"""
+Renders a mutant by reusing the audio of a reference render.
+
+Everything before cancer_start is the same in all mutants of a score,
+so a reference's render is copied up to the first difference and only
+the rest of the mutant is synthesized, crossfaded in over the copy.
+The tail render starts a little earlier, at a point where no note is
+held, so what it lacks from before that point has died away by the
+time it is heard. The MIDI events of both are compared first;
+when no safe point is found the mutant is rendered in full.
+"""
+
+import math
+import wave
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from music21.midi import (
+    ChannelVoiceMessages,
+    DeltaTime,
+    MetaEvents,
+    MidiEvent,
+    MidiFile,
+    MidiTrack,
+)
+
+from cancer_music.processor import synth
+
+# length of the crossfade from the reference's audio to the new render,
+# long enough to hide the player's millisecond timing jitter
+FADE_SECONDS = 0.05
+# how long notes ended before the tail render starts may still ring
+RELEASE_SECONDS = 1.0
+SUSTAIN_PEDAL = 64
+
+# absolute tick, type, channel and the two data values of an event
+Event = Tuple[int, int, int, int, int]
+
+CHANNEL_MESSAGES = {
+    ChannelVoiceMessages.NOTE_OFF,
+    ChannelVoiceMessages.NOTE_ON,
+    ChannelVoiceMessages.POLYPHONIC_KEY_PRESSURE,
+    ChannelVoiceMessages.CONTROLLER_CHANGE,
+    ChannelVoiceMessages.PROGRAM_CHANGE,
+    ChannelVoiceMessages.CHANNEL_KEY_PRESSURE,
+    ChannelVoiceMessages.PITCH_BEND,
+}
+# state a tail render has to be given before its first note
+STATE_MESSAGES = {
+    ChannelVoiceMessages.CONTROLLER_CHANGE,
+    ChannelVoiceMessages.PROGRAM_CHANGE,
+    ChannelVoiceMessages.PITCH_BEND,
+}
+
+
+def absolute(track: MidiTrack) -> Iterator[Tuple[int, MidiEvent]]:
+    tick = 0
+    for e in track.events:
+        if e.isDeltaTime():
+            tick += e.time
+        else:
+            yield tick, e
+
+
+def event_key(e: MidiEvent) -> Tuple[int, int, int, int]:
+    """
+    What an event does to the sound, note-ons of velocity 0 counting
+    as note-offs.
+    """
+    if e.type == MetaEvents.SET_TEMPO:
+        return (e.type.value, 0, int.from_bytes(e.data[:3], "big"), 0)
+    if e.isNoteOff():
+        return (ChannelVoiceMessages.NOTE_OFF.value, e.channel, e.pitch, 0)
+    return (e.type.value, e.channel, e.parameter1, e.parameter2 or 0)
+
+
+def timeline(mf: MidiFile) -> List[Event]:
+    """
+    Merges the events that shape the sound of all tracks into one
+    sorted list. Program changes that repeat a channel's program are
+    dropped, so a subclone announcing its parent's program on its
+    parent's channel changes nothing.
+
+    :param mf: The MIDI file.
+    :returns: Sorted events, see Event.
+    """
+    events = []
+    for track in mf.tracks:
+        for tick, e in absolute(track):
+            if e.type in CHANNEL_MESSAGES or e.type == MetaEvents.SET_TEMPO:
+                events.append((tick, *event_key(e)))
+    events.sort()
+
+    programs: Dict[int, int] = {}
+    kept = []
+    program_change = ChannelVoiceMessages.PROGRAM_CHANGE.value
+    for ev in events:
+        if ev[1] == program_change:
+            if programs.get(ev[2]) == ev[3]:
+                continue
+            programs[ev[2]] = ev[3]
+        kept.append(ev)
+    return kept
+
+
+def divergence(a: List[Event], b: List[Event]) -> int:
+    """
+    :returns: Tick of the first event in which two timelines differ,
+    or the end of the longer one if one is a prefix of the other.
+    """
+    for x, y in zip(a, b):
+        if x != y:
+            return min(x[0], y[0])
+    rest = a[len(b) :] or b[len(a) :]
+    if rest:
+        return rest[0][0]
+    return a[-1][0] + 1 if a else 0
+
+
+def quiet_ticks(events: List[Event], until: int) -> List[int]:
+    """
+    Finds the ticks up to until at which no note sounds and no
+    sustain pedal is down, so audio can be cut there without losing
+    a note that started before the cut.
+
+    :returns: The quiet ticks in ascending order.
+    """
+    note_on = ChannelVoiceMessages.NOTE_ON.value
+    note_off = ChannelVoiceMessages.NOTE_OFF.value
+    controller = ChannelVoiceMessages.CONTROLLER_CHANGE.value
+    held: Dict[Tuple[int, int], int] = {}
+    pedals = set()
+    quiet = []
+    i = 0
+    while i < len(events) and events[i][0] <= until:
+        tick = events[i][0]
+        group = []
+        while i < len(events) and events[i][0] == tick:
+            group.append(events[i])
+            i += 1
+        # notes ending at the tick end before the cut
+        for _, kind, channel, p1, p2 in group:
+            if kind == note_off and held.get((channel, p1)):
+                held[(channel, p1)] -= 1
+            elif kind == controller and p1 == SUSTAIN_PEDAL:
+                if p2 >= 64:
+                    pedals.add(channel)
+                else:
+                    pedals.discard(channel)
+        if not any(held.values()) and not pedals:
+            quiet.append(tick)
+        for _, kind, channel, p1, _ in group:
+            if kind == note_on:
+                held[(channel, p1)] = held.get((channel, p1), 0) + 1
+    return quiet
+
+
+def seconds_at(mf: MidiFile):
+    tempos = synth.tempo_map(mf)
+    return lambda tick: synth.ticks_to_seconds(
+        tick, tempos, mf.ticksPerQuarterNote
+    )
+
+
+def splice_points(ref: MidiFile, mf: MidiFile) -> Optional[Tuple[int, int]]:
+    """
+    Works out where the mutant can take over from the reference.
+
+    :param ref: MIDI of the reference.
+    :param mf: MIDI of the mutant.
+    :returns: Tick to render the mutant from and tick of the first
+    difference, or None if the mutant must be rendered whole.
+    """
+    if ref.ticksPerQuarterNote != mf.ticksPerQuarterNote:
+        return None
+    a, b = timeline(ref), timeline(mf)
+    div = divergence(a, b)
+    seconds = seconds_at(mf)
+    # the render has to run a release time ahead of the crossfade,
+    # which has to end before the first difference
+    latest = seconds(div) - FADE_SECONDS - RELEASE_SECONDS
+    candidates = [t for t in quiet_ticks(b, div) if seconds(t) <= latest]
+    if not candidates or candidates[-1] == 0:
+        return None
+    return candidates[-1], div
+
+
+def tail_midi(mf: MidiFile, start: int) -> MidiFile:
+    """
+    Cuts a MIDI file at a quiet tick. Tempo, programs, controllers
+    and pitch bends in effect at the cut are moved to its start,
+    notes before the cut are dropped.
+
+    :param mf: The MIDI file.
+    :param start: Tick to cut at, see quiet_ticks.
+    :returns: A MIDI file playing what mf plays from start on.
+    """
+    tail = MidiFile()
+    tail.format = mf.format
+    tail.ticksPerQuarterNote = mf.ticksPerQuarterNote
+    for track in mf.tracks:
+        state: Dict[tuple, MidiEvent] = {}
+        timed: List[Tuple[int, MidiEvent]] = []
+        for tick, e in absolute(track):
+            if tick >= start or e.type == MetaEvents.END_OF_TRACK:
+                timed.append((max(tick - start, 0), e))
+            elif e.type == MetaEvents.SET_TEMPO:
+                state[("tempo",)] = e
+            elif e.type in STATE_MESSAGES:
+                number = (
+                    e.parameter1
+                    if e.type == ChannelVoiceMessages.CONTROLLER_CHANGE
+                    else None
+                )
+                state[(e.type, e.channel, number)] = e
+
+        out = MidiTrack(track.index)
+        last = 0
+        for tick, e in [(0, e) for e in state.values()] + timed:
+            out.events.append(DeltaTime(out, time=tick - last))
+            out.events.append(e)
+            last = tick
+        tail.tracks.append(out)
+    return tail
+
+
+def read_frames(wr: wave.Wave_read, frames: int) -> np.ndarray:
+    return np.frombuffer(wr.readframes(frames), dtype=np.int16)
+
+
+def skip_frames(
+    chunks: Iterator[np.ndarray], frames: int
+) -> Iterator[np.ndarray]:
+    samples = frames * synth.CHANNELS
+    for chunk in chunks:
+        if samples >= len(chunk):
+            samples -= len(chunk)
+            continue
+        yield chunk[samples:]
+        samples = 0
+
+
+def splice(
+    wr: wave.Wave_read,
+    switch_frame: int,
+    tail: Iterator[np.ndarray],
+    fade_frames: int,
+) -> Iterator[np.ndarray]:
+    """
+    Plays the reference's audio up to switch_frame, then fades over
+    fade_frames to the tail render, which must start at switch_frame.
+
+    :param wr: The reference's WAV, at its first frame.
+    :param switch_frame: Frame the crossfade starts at.
+    :param tail: Chunks of the mutant from switch_frame on.
+    :param fade_frames: Length of the crossfade.
+    :returns: Interleaved int16 stereo chunks.
+    """
+    copied = 0
+    while copied < switch_frame:
+        frames = min(synth.CHUNK_FRAMES, switch_frame - copied)
+        yield read_frames(wr, frames)
+        copied += frames
+
+    old = read_frames(wr, fade_frames).astype(np.float32)
+    new = np.zeros(0, dtype=np.int16)
+    for chunk in tail:
+        new = np.concatenate([new, chunk])
+        if len(new) >= len(old):
+            break
+    n = min(len(old), len(new))
+    if n:
+        ramp = np.repeat(
+            np.linspace(0.0, 1.0, n // synth.CHANNELS, dtype=np.float32),
+            synth.CHANNELS,
+        )
+        mixed = old[:n] * (1.0 - ramp) + new[:n].astype(np.float32) * ramp
+        yield np.clip(np.rint(mixed), -32768, 32767).astype(np.int16)
+    if len(new) > n:
+        yield new[n:]
+    yield from tail
+
+
+def open_reference(f: BinaryIO) -> Optional[wave.Wave_read]:
+    """
+    Opens the reference's WAV if it has the synth's sample format.
+    """
+    try:
+        wr = wave.open(f, "rb")
+    except (wave.Error, EOFError):
+        return None
+    if (
+        wr.getframerate() != synth.SAMPLE_RATE
+        or wr.getnchannels() != synth.CHANNELS
+        or wr.getsampwidth() != synth.SAMPLE_WIDTH
+    ):
+        return None
+    return wr
+
+
+def render_chunks(
+    mf: MidiFile,
+    ref: MidiFile,
+    ref_wav: BinaryIO,
+    fs: synth.PatchedSynth,
+) -> Iterator[np.ndarray]:
+    """
+    Renders a mutant, reusing the reference's audio where the two
+    are known to sound the same, and in full otherwise.
+
+    :param mf: MIDI of the mutant.
+    :param ref: MIDI the reference's audio was rendered from.
+    :param ref_wav: WAV render of the reference, closed when done.
+    :param fs: Preloaded synth to render with.
+    :returns: Interleaved int16 stereo chunks.
+    """
+    with ref_wav:
+        wr = open_reference(ref_wav)
+        points = None if wr is None else splice_points(ref, mf)
+        fade_frames = math.ceil(FADE_SECONDS * synth.SAMPLE_RATE)
+        if points is not None:
+            start, div = points
+            seconds = seconds_at(mf)
+            start_frame = round(seconds(start) * synth.SAMPLE_RATE)
+            switch_frame = (
+                round(seconds(div) * synth.SAMPLE_RATE) - fade_frames
+            )
+            if wr.getnframes() < switch_frame + fade_frames:
+                points = None
+        if points is None:
+            yield from synth.render_chunks(mf, fs=fs)
+            return
+        render = synth.render_chunks(tail_midi(mf, start), fs=fs)
+        tail = skip_frames(render, switch_frame - start_frame)
+        try:
+            yield from splice(wr, switch_frame, tail, fade_frames)
+        finally:
+            render.close()
+
+
+def record(chunks: Iterator[np.ndarray], f: BinaryIO) -> Iterator[np.ndarray]:
+    """
+    Passes rendered chunks on while writing them to a WAV file, so a
+    render can serve as the reference of later ones.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :param f: Seekable file to write the WAV to, left open.
+    :returns: The same chunks.
+    """
+    with wave.open(f, "wb") as wr:
+        wr.setframerate(synth.SAMPLE_RATE)
+        wr.setnchannels(synth.CHANNELS)
+        wr.setsampwidth(synth.SAMPLE_WIDTH)
+        for chunk in chunks:
+            wr.writeframes(chunk.astype(np.int16, copy=False).tobytes())
+            yield chunk
@@ -0,0 +1,559 @@
+"""
+Writes Standard MIDI files straight from a score's measures.
+
+streamToMidiFile deep copies the whole score to expand repeats, realize
+dynamics and strip ties before it looks at a single note, which makes
+it the slowest step of exporting a mutant. The writer here reads the
+same offsets, durations, pitches and velocities from the score in
+place and emits the same events in the same order, so the files come
+out byte for byte like those of streamToMidiFile. Scores using what
+it does not cover (repeats, microtones, percussion notes) are handed
+to streamToMidiFile.
+"""
+
+from fractions import Fraction
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from music21 import bar, defaults, dynamics, key, meter, repeat, tempo
+from music21.chord import Chord
+from music21.common.numberTools import opFrac
+from music21.instrument import Conductor, Instrument, UnpitchedPercussion
+from music21.midi import (
+    ChannelVoiceMessages,
+    DeltaTime,
+    MetaEvents,
+    MidiEvent,
+    MidiFile,
+    MidiTrack,
+)
+from music21.midi.translate import (
+    keySignatureToMidiEvents,
+    streamToMidiFile,
+    tempoToMidiEvents,
+    timeSignatureToMidiEvents,
+)
+from music21.note import GeneralNote, Note, NotRest, Unpitched
+from music21.spanner import RepeatBracket
+from music21.stream.base import Measure, Part, Score, Stream
+
+Offset = Union[Fraction, float]
+
+TICKS_PER_QUARTER = defaults.ticksPerQuarter
+# what streamToMidiFile moves to the conductor track, in its order
+CONDUCTOR_CLASSES = (
+    tempo.MetronomeMark,
+    meter.TimeSignature,
+    key.KeySignature,
+)
+# channels streamToMidiFile hands out, all but the drums
+CHANNELS = list(range(1, 10)) + list(range(11, 17))
+DRUM_CHANNEL = 10
+
+# tick, sort order of the event type and the event, see MidiEvent.sortOrder
+Packet = Tuple[int, int, MidiEvent]
+
+
+class Unsupported(Exception):
+    """
+    Raised when a score needs streamToMidiFile.
+    """
+
+
+def to_midi_file(s: Score) -> MidiFile:
+    """
+    Exports a score to MIDI, like streamToMidiFile(s) without copying
+    the score. Falls back to streamToMidiFile for scores it does not
+    cover.
+
+    :param s: The score, left untouched.
+    :returns: The MIDI file.
+    """
+    try:
+        return write(s)
+    except Unsupported:
+        return streamToMidiFile(s)
+
+
+def ticks(o: Offset) -> int:
+    return int(round(o * TICKS_PER_QUARTER))
+
+
+def sort_key(el, offset: Offset, index: int):
+    # Music21Object.sortTuple, index standing for the insertion order
+    return (
+        offset,
+        el.priority,
+        el.classSortOrder,
+        1 if el.isStream or not el.duration.isGrace else 0,
+        index,
+    )
+
+
+def copied(p: Part) -> List:
+    """
+    The elements of a part in the order streamToMidiFile's copy of it
+    holds them: expanding repeats puts the measures before everything
+    else in the part.
+
+    :raises Unsupported: Raised for parts with notes outside measures.
+    """
+    measures = []
+    others = []
+    for el in p:
+        if isinstance(el, Measure):
+            measures.append(el)
+        elif isinstance(el, GeneralNote):
+            raise Unsupported()
+        else:
+            others.append(el)
+    return measures + others
+
+
+def recursed(p: Part, elements: List) -> Iterator:
+    """
+    Iterates the copy of a part like recurse() does.
+    """
+    keyed = [
+        (sort_key(el, p.elementOffset(el), i), el)
+        for i, el in enumerate(elements)
+    ]
+    keyed.sort(key=lambda k: k[0])
+    for _, el in keyed:
+        yield el
+        if isinstance(el, Stream):
+            yield from el.recurse()
+
+
+def flat_elements(p: Part, elements: List) -> List[Tuple[Offset, object]]:
+    """
+    The elements of a part with their offsets, in the order of the
+    flattened copy: by position and, for ties, by the order flattening
+    came across the elements.
+
+    :param elements: The part's elements, see copied.
+    """
+    found = []
+
+    def visit(container: Stream, at: Offset):
+        # raw order, which copying keeps and flattening goes by
+        for el in container._elements:
+            offset = opFrac(at + container.elementOffset(el))
+            if isinstance(el, Stream):
+                visit(el, offset)
+            else:
+                found.append((sort_key(el, offset, len(found)), offset, el))
+
+    for el in elements:
+        offset = p.elementOffset(el)
+        if isinstance(el, Stream):
+            visit(el, offset)
+        else:
+            found.append((sort_key(el, offset, len(found)), offset, el))
+    found.sort(key=lambda f: f[0])
+    return [(offset, el) for _, offset, el in found]
+
+
+def check_part(p: Part):
+    """
+    :raises Unsupported: Raised if streamToMidiFile would expand
+    repeats or write something the writer does not.
+    """
+    if not p.getElementsByClass(Measure):
+        raise Unsupported()
+    if repeat.Expander(p).isExpandable() is not None:
+        raise Unsupported()
+    for sp in p.spannerBundle:
+        if isinstance(sp, RepeatBracket):
+            raise Unsupported()
+    for el in p.recurse():
+        if isinstance(el, bar.Repeat):
+            raise Unsupported()
+
+
+def realized_volumes(
+    flat: List[Tuple[Offset, object]], end: Offset
+) -> Dict[int, float]:
+    """
+    Velocity scalars of the notes and chords of a flattened part, as
+    volume.realizeVolume sets them: every dynamic lasts until the next
+    one, or the end of the part.
+
+    :returns: Realized volume by id of the note or chord.
+    """
+    marks = [(o, el) for o, el in flat if isinstance(el, dynamics.Dynamic)]
+    boundaries = {}
+    for (start, mark), (stop, _) in zip(marks, marks[1:] + [(end, None)]):
+        boundaries[(start, start + opFrac(stop - start))] = mark
+    keys = sorted(boundaries)
+
+    volumes = {}
+    last = 0
+    for offset, el in flat:
+        if not isinstance(el, NotRest):
+            continue
+        dm = False
+        for k in range(last, len(keys)):
+            start, stop = keys[k]
+            if stop > offset >= start:
+                last = k
+                dm = boundaries[keys[k]]
+                break
+        volumes[id(el)] = realized(el, dm)
+        if isinstance(el, Chord) and el.hasComponentVolumes():
+            for n in el:
+                # music21 reads the components' cached value, realized
+                # against the chord's dynamic when nothing set it before
+                cached = (
+                    n.volume._cachedRealized
+                    if n.hasVolumeInformation()
+                    else None
+                )
+                volumes[id(n)] = realized(n, dm) if cached is None else cached
+    return volumes
+
+
+def realized(el, dm) -> float:
+    """
+    Volume.getRealized of a note or chord given its dynamic, without
+    caching the result on the note or creating a volume it lacks.
+    """
+    v = el.volume if el.hasVolumeInformation() else None
+    scalar = None if v is None else v.velocityScalar
+    relative = v is None or v.velocityIsRelative
+    val = 0.5
+    if scalar is None:
+        val += 0.20866
+    elif relative:
+        val = val * (scalar * 2.0)
+    else:
+        val = scalar
+    if relative:
+        if dm:
+            val = val * (dm.volumeScalar * 2.0)
+        for a in el.articulations:
+            val += a.volumeShift
+    return min(max(val, 0.0), 1.0)
+
+
+def tied_durations(
+    flat: List[Tuple[Offset, object]],
+) -> Tuple[Dict[int, Offset], set]:
+    """
+    Merges tied notes like stripTies(matchByPitch=True) on the part.
+
+    :returns: New lengths of the first notes of ties by id, and the
+    ids of the notes merged into them.
+    """
+    notes = [
+        el
+        for _, el in flat
+        if isinstance(el, GeneralNote) and el.quarterLength > 0
+    ]
+    lengths: Dict[int, Offset] = {}
+    merged = set()
+    connected: List[int] = []
+
+    def same_pitch(last, n) -> bool:
+        if isinstance(last, Chord) or isinstance(n, Chord):
+            return False
+        return (
+            hasattr(last, "pitch")
+            and hasattr(n, "pitch")
+            and last.pitch == n.pitch
+        )
+
+    def same_pitches(last, n) -> bool:
+        if len(last.pitches) != len(n.pitches):
+            return False
+        return all(
+            a.step == b.step and a.isEnharmonic(b)
+            for a, b in zip(last.pitches, n.pitches)
+        )
+
+    def end_match(i: int, n) -> bool:
+        if (
+            not isinstance(n, Chord)
+            and getattr(n, "tie", None) is not None
+            and n.tie.type == "stop"
+        ):
+            return True
+        if i == 0 or i - 1 not in connected:
+            return False
+        last = notes[i - 1]
+        if same_pitch(last, n):
+            return True
+        if (
+            not isinstance(n, Note)
+            and hasattr(last, "pitches")
+            and hasattr(n, "pitches")
+        ):
+            return same_pitches(last, n)
+        return False
+
+    for i, n in enumerate(notes):
+        ends = None
+        tie = getattr(n, "tie", None)
+        if tie is not None and tie.type == "start":
+            if i == 0 or i - 1 not in connected:
+                connected = [i]
+            else:
+                connected.append(i)
+            ends = False
+        elif tie is not None and tie.type == "continue":
+            if not connected or end_match(i, n):
+                connected.append(i)
+            else:
+                connected = [i]
+            ends = False
+        if ends is None:
+            ends = end_match(i, n)
+        if not ends:
+            continue
+
+        connected.append(i)
+        if len(connected) < 2:
+            connected = []
+            continue
+        rest = 0
+        for q in connected[1:]:
+            rest += lengths.get(id(notes[q]), notes[q].quarterLength)
+            merged.add(id(notes[q]))
+        first = notes[connected[0]]
+        lengths[id(first)] = opFrac(
+            lengths.get(id(first), first.quarterLength) + rest
+        )
+        connected = []
+    return lengths, merged
+
+
+def channel_data(
+    parts: List[Tuple[Part, List]],
+) -> Dict[Optional[int], int]:
+    """
+    Works out the channel of every MIDI program like
+    translate.channelInstrumentData.
+
+    :param parts: Parts and their elements, see copied.
+    :returns: Channel by program.
+    """
+    acceptable = list(CHANNELS)
+    by_program: Dict[Optional[int], int] = {}
+    programs: List[Optional[int]] = []
+    for p, elements in parts:
+        instruments = [
+            el for el in recursed(p, elements) if isinstance(el, Instrument)
+        ]
+        for ins in instruments:
+            if (
+                ins.midiChannel is not None
+                and ins.midiProgram not in by_program
+            ):
+                channel = ins.midiChannel + 1
+                if channel in acceptable:
+                    acceptable.remove(channel)
+                elif channel != DRUM_CHANNEL:
+                    raise Unsupported()
+                by_program[ins.midiProgram] = channel
+            if ins.midiProgram not in programs:
+                programs.append(ins.midiProgram)
+        if not instruments and None not in programs:
+            programs.append(None)
+
+    needed = [x for x in programs if x not in by_program]
+    for i, program in enumerate(needed):
+        # one channel is always kept free
+        channel = acceptable[i] if i < len(acceptable) - 1 else acceptable[0]
+        by_program[program] = channel
+    return by_program
+
+
+def part_packets(
+    flat: List[Tuple[Offset, object]], channel: int, end: Offset
+) -> List[Packet]:
+    """
+    Note, lyric and program change events of a part, sorted like
+    translate.streamToPackets sorts them.
+    """
+    volumes = realized_volumes(flat, end)
+    lengths, merged = tied_durations(flat)
+    packets: List[Packet] = []
+    for offset, el in flat:
+        if isinstance(el, Instrument):
+            me = MidiEvent(type=ChannelVoiceMessages.PROGRAM_CHANGE)
+            me.channel = channel
+            me.data = 0 if el.midiProgram is None else el.midiProgram
+            packets.append((ticks(offset), 0, me))
+            continue
+        if not isinstance(el, NotRest) or id(el) in merged:
+            continue
+        on = ticks(offset)
+        off = on + ticks(lengths.get(id(el), el.quarterLength))
+        if el.lyric is not None and el.lyric != "":
+            me = MidiEvent(type=MetaEvents.LYRIC, channel=channel)
+            me.data = el.lyric.encode("utf-8", "ignore")
+            packets.append((on, 0, me))
+        if isinstance(el, Chord):
+            pitches = [n.pitch.midi for n in el]
+            sources = list(el) if el.hasComponentVolumes() else [el] * len(el)
+        else:
+            pitches = [el.pitch.midi]
+            sources = [el]
+        for pitch, source in zip(pitches, sources):
+            me = MidiEvent(type=ChannelVoiceMessages.NOTE_ON, channel=channel)
+            me.pitch = pitch
+            me.velocity = int(round(volumes[id(source)] * 127))
+            packets.append((on, 0, me))
+        for pitch in pitches:
+            me = MidiEvent(type=ChannelVoiceMessages.NOTE_OFF, channel=channel)
+            me.pitch = pitch
+            me.velocity = 0
+            packets.append((off, -20, me))
+    packets.sort(key=lambda pk: (pk[0], pk[1]))
+    return packets
+
+
+def check_notes(flat: List[Tuple[Offset, object]]):
+    for _, el in flat:
+        if isinstance(el, Unpitched):
+            raise Unsupported()
+        if isinstance(el, Chord):
+            if any(not isinstance(n, Note) for n in el):
+                raise Unsupported()
+            pitches = el.pitches
+        elif isinstance(el, Note):
+            pitches = (el.pitch,)
+        else:
+            continue
+        if not all(pt.isTwelveTone() for pt in pitches):
+            raise Unsupported()
+
+
+def conductor_packets(parts: List[Tuple[Part, List]]) -> List[Packet]:
+    """
+    Tempo, time and key signature events like translate.conductorStream
+    gathers them, at most one per kind and offset, taken part by part.
+    """
+    found = []
+    for kind, klass in enumerate(CONDUCTOR_CLASSES):
+        last = -1
+        for p, elements in parts:
+            for el in recursed(p, elements):
+                if not isinstance(el, klass):
+                    continue
+                offset = el.getOffsetInHierarchy(p)
+                if offset > last:
+                    found.append((kind, offset, el))
+                last = offset
+    if not any(kind == 0 for kind, _, _ in found):
+        found.append((0, 0.0, tempo.MetronomeMark(number=120)))
+    if not any(kind == 1 for kind, _, _ in found):
+        found.append((1, 0.0, meter.TimeSignature("4/4")))
+
+    # the conductor part sorts them like any part
+    found = [
+        (sort_key(el, offset, i), offset, el)
+        for i, (_, offset, el) in enumerate(found)
+    ]
+    found.sort(key=lambda f: f[0])
+    packets = []
+    for _, offset, el in found:
+        if isinstance(el, tempo.MetronomeMark):
+            events = tempoToMidiEvents(el, includeDeltaTime=False)
+        elif isinstance(el, meter.TimeSignature):
+            events = timeSignatureToMidiEvents(el, includeDeltaTime=False)
+        else:
+            events = keySignatureToMidiEvents(el, includeDeltaTime=False)
+        for me in events or []:
+            me.channel = None
+            packets.append((ticks(offset), me.sortOrder, me))
+    packets.sort(key=lambda pk: (pk[0], pk[1]))
+    return packets
+
+
+def track(
+    index: int,
+    packets: List[Packet],
+    channel: Optional[int],
+    first: Optional[Instrument],
+) -> MidiTrack:
+    """
+    Lays out a track like translate.packetsToMidiTrack.
+    """
+    mt = MidiTrack(index)
+    if not isinstance(first, Conductor):
+        name = "" if first is None else (first.bestName() or "")
+        mt.events.append(DeltaTime(mt, channel=channel))
+        me = MidiEvent(mt, type=MetaEvents.SEQUENCE_TRACK_NAME)
+        me.channel = channel
+        me.data = name.encode("utf-8", "ignore")
+        mt.events.append(me)
+        if first is not None and first.midiProgram is not None:
+            mt.events.append(DeltaTime(mt, channel=channel))
+            me = MidiEvent(mt, type=ChannelVoiceMessages.PROGRAM_CHANGE)
+            me.channel = channel
+            me.data = first.midiProgram
+            mt.events.append(me)
+
+    last = 0
+    for tick, _, me in packets:
+        mt.events.append(DeltaTime(mt, time=tick - last, channel=me.channel))
+        mt.events.append(me)
+        last = tick
+
+    mt.events.append(DeltaTime(mt, time=TICKS_PER_QUARTER))
+    me = MidiEvent(mt, type=MetaEvents.END_OF_TRACK)
+    me.data = b""
+    mt.events.append(me)
+    mt.updateEvents()
+    return mt
+
+
+def write(s: Score) -> MidiFile:
+    """
+    :raises Unsupported: Raised if the score needs streamToMidiFile.
+    """
+    parts = []
+    for el in s:
+        if isinstance(el, Stream):
+            if not isinstance(el, Part):
+                raise Unsupported()
+            # expanding repeats moves every part to the start
+            parts.append(el)
+        elif isinstance(el, CONDUCTOR_CLASSES):
+            raise Unsupported()
+    if not parts:
+        raise Unsupported()
+
+    parts = [(p, copied(p)) for p in parts]
+    flats = []
+    for p, elements in parts:
+        check_part(p)
+        flat = flat_elements(p, elements)
+        check_notes(flat)
+        flats.append(flat)
+
+    by_program = channel_data(parts)
+    mf = MidiFile()
+    mf.ticksPerQuarterNote = TICKS_PER_QUARTER
+    mf.tracks.append(track(0, conductor_packets(parts), None, Conductor()))
+    for i, ((p, _), flat) in enumerate(zip(parts, flats)):
+        first = next(
+            (el for _, el in flat if isinstance(el, Instrument)), None
+        )
+        if first is not None and isinstance(first, UnpitchedPercussion):
+            channel = DRUM_CHANNEL
+        elif first is None:
+            channel = by_program.get(None, 1)
+        else:
+            channel = by_program[first.midiProgram]
+        packets = part_packets(flat, channel, p.highestTime)
+        if packets:
+            # every track that plays something starts with its pitch
+            # bend cleared
+            me = MidiEvent(type=ChannelVoiceMessages.PITCH_BEND)
+            me.channel = channel
+            me.setPitchBend(0)
+            packets.append((0, -10, me))
+            packets.sort(key=lambda pk: (pk[0], pk[1]))
+        mf.tracks.append(track(i + 1, packets, channel, first))
+    return mf
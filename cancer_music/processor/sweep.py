@@ -0,0 +1,238 @@
+"""
+Monte Carlo sweeps of the clonal dynamics of mutate.
+
+Which subclones are born, die and come back, and which mutation hits
+which measure, depend on the parameters, the length of the score and
+its number of parts, but not on its notes. Here those dynamics run
+for many runs at once as NumPy arrays, one row per run, so comparing
+therapies over thousands of seeds takes seconds instead of thousands
+of mutate calls.
+
+Runs draw from NumPy's generator, so they follow the same
+distribution as mutate, not the same runs for the same seeds. Use
+dryrun for that.
+
+    results = sweep.sweep(length, parts, [(params, t_params)], runs=10000)
+    results[0].alive.mean(axis=0)
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from cancer_music.processor.parameters import (
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+# same order as the weights of process.choose_mutation
+MUTATION_NAMES = [
+    "noop",
+    "insertion",
+    "transposition",
+    "deletion",
+    "translocation",
+    "inversion",
+]
+
+Variant = Tuple[Parameters, TherapyParameters]
+
+
+class Sweep:
+    """
+    The runs of one variant of a sweep.
+
+    alive holds the number of subclones playing a mutated measure at
+    each measure of each run, offspring the number of subclones born
+    by the end of each measure, both with shape (runs, measures).
+    mutations counts the mutations drawn at each measure over all
+    runs, with shape (measures, len(MUTATION_NAMES)).
+    """
+
+    def __init__(
+        self,
+        params: Parameters,
+        t_params: TherapyParameters,
+        alive: np.ndarray,
+        offspring: np.ndarray,
+        mutations: np.ndarray,
+    ):
+        self.params = params
+        self.t_params = t_params
+        self.alive = alive
+        self.offspring = offspring
+        self.mutations = mutations
+
+
+def per_run(values: List, runs: int) -> np.ndarray:
+    return np.repeat(np.asarray(values), runs, axis=0)
+
+
+def sweep(
+    length: int,
+    parts: int,
+    variants: List[Variant],
+    runs: int,
+    seed: Optional[int] = None,
+) -> List[Sweep]:
+    """
+    Runs the clonal dynamics of mutate's loop for every variant,
+    all variants and runs as one batch.
+
+    :param length: Length of the score in measures, see
+    utils.get_score_length_in_measures.
+    :param parts: Number of parts of the score.
+    :param variants: Mutation and therapy parameters to compare.
+    :param runs: Runs per variant.
+    :param seed: Seed of NumPy's generator.
+    :returns: The runs of each variant, in order.
+    :raises ValueError: Raised if the mutation weights of a variant do
+    not sum to one.
+    """
+    for params, _ in variants:
+        weights = [params[name] for name in MUTATION_NAMES]
+        if sum(weights) != 1.0:
+            raise ValueError("Mutation weights do not sum to 1.")
+
+    rng = np.random.default_rng(seed)
+    total = len(variants) * runs
+    rows = np.arange(total)
+    variant = per_run(range(len(variants)), runs)
+
+    how_many = per_run([p["how_many"] for p, _ in variants], runs)
+    max_parts = per_run([p["max_parts"] for p, _ in variants], runs)
+    reproduction = per_run([p["reproduction"] for p, _ in variants], runs)
+    cumulative = per_run(
+        [np.cumsum([p[name] for name in MUTATION_NAMES]) for p, _ in variants],
+        runs,
+    )
+    cancer_start = per_run(
+        [int(np.floor(p["start"] * length)) - 1 for p, _ in variants], runs
+    )
+    mode = per_run([t["therapy_mode"].value for _, t in variants], runs)
+    therapy_start = per_run(
+        [int(np.floor(t["start"] * length)) - 1 for _, t in variants], runs
+    )
+    threshold = per_run([t["adaptive_threshold"] for _, t in variants], runs)
+    interval = per_run([t["adaptive_interval"] for _, t in variants], runs)
+
+    # subclones by order of birth: the parts that turn cancerous,
+    # in part order, then their offspring
+    slots = parts + int(max_parts.max())
+    candidates = rng.integers(1, parts + 1, total)
+    chosen = (
+        np.argsort(rng.random((total, parts)), axis=1) < candidates[:, None]
+    )
+    root = np.zeros((total, slots), dtype=int)
+    root[:, :parts] = np.argsort(~chosen, axis=1, kind="stable")
+    index = np.arange(slots)
+    exists = index[None, :] < candidates[:, None]
+    alive = exists.copy()
+    start = np.repeat(cancer_start[:, None], slots, axis=1)
+    born = np.zeros(total, dtype=int)
+
+    # the measure mutated in each slice of how_many measures
+    slices = (length - cancer_start) // how_many
+    picks = np.floor(
+        rng.random((total, slots, max(int(slices.max()), 1)))
+        * how_many[:, None, None]
+    ).astype(int)
+
+    alive_counts = np.zeros((total, length), dtype=np.int16)
+    offspring = np.zeros((total, length), dtype=np.int16)
+    mutations = np.zeros((len(variants), length, len(MUTATION_NAMES)), int)
+
+    for i in range(int(cancer_start.min()), length):
+        running = i >= cancer_start
+        since = i - cancer_start
+
+        adaptive = (
+            running
+            & (mode == Therapy.ADAPTIVE.value)
+            & (since % interval == 0)
+        )
+        living = exists & alive
+        over = adaptive & (living.sum(axis=1) > threshold)
+        if over.any():
+            # keep threshold subclones picked at random
+            keys = np.where(living, rng.random((total, slots)), np.inf)
+            rank = np.argsort(np.argsort(keys, axis=1), axis=1)
+            alive &= ~(over[:, None] & living & (rank >= threshold[:, None]))
+
+        therapy = running & ~adaptive & (i == therapy_start)
+        cure = therapy & (mode == Therapy.CURE.value)
+        alive &= ~cure[:, None]
+        partial = therapy & (mode == Therapy.PARTIAL_CURE.value)
+        if partial.any():
+            # the survivor is drawn among all subclones, dead or alive
+            survivor = np.floor(
+                rng.random(total) * (candidates + born)
+            ).astype(int)
+            alive &= ~partial[:, None] | (index[None, :] == survivor[:, None])
+
+        for c in range(slots):
+            active = running & alive[:, c] & (i >= start[:, c])
+            if not active.any():
+                continue
+            if i >= 0:
+                alive_counts[:, i] += active
+
+            j = since // how_many
+            picked = active & (j < slices)
+            r = rows[picked]
+            picked[r] = picks[r, c, j[r]] == since[r] % how_many[r]
+            kind = np.minimum(
+                (cumulative <= rng.random(total)[:, None]).sum(axis=1),
+                len(MUTATION_NAMES) - 1,
+            )
+            if i >= 0:
+                np.add.at(mutations, (variant[picked], i, kind[picked]), 1)
+
+            reproduces = (
+                active
+                & ((i - start[:, c]) % how_many == 0)
+                & (rng.random(total) < reproduction)
+            )
+            room = born < max_parts
+
+            new = reproduces & room
+            if new.any():
+                r = rows[new]
+                dup = candidates[r] + born[r]
+                exists[r, dup] = True
+                alive[r, dup] = True
+                root[r, dup] = root[r, c]
+                start[r, dup] = i + np.floor(
+                    rng.random(len(r)) * (how_many[r] // 2 + 1)
+                ).astype(int)
+                born[r] += 1
+
+            revives = reproduces & ~room
+            if revives.any():
+                dead = (
+                    exists
+                    & ~alive
+                    & (root == root[:, c][:, None])
+                    & (index[None, :] != c)
+                    & revives[:, None]
+                )
+                keys = np.where(dead, rng.random((total, slots)), -1.0)
+                pick = keys.argmax(axis=1)
+                r = rows[dead.any(axis=1)]
+                alive[r, pick[r]] = True
+                start[r, pick[r]] = i
+
+        if i >= 0:
+            offspring[:, i] = born
+
+    return [
+        Sweep(
+            params,
+            t_params,
+            alive_counts[k * runs : (k + 1) * runs],
+            offspring[k * runs : (k + 1) * runs],
+            mutations[k],
+        )
+        for k, (params, t_params) in enumerate(variants)
+    ]
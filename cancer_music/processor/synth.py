@@ -1,12 +1,27 @@
+import contextlib
+import io
+import math
+import os
+import queue
+import struct
+import threading
+import wave
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
 from fluidsynth import (
     Synth,
     c_int,
     c_uint,
     c_void_p,
     cfunc,
+    delete_fluid_player,
     fluid_player_play,
+    fluid_player_stop,
+    fluid_synth_get_sfont_by_id,
     new_fluid_player,
 )
+from music21.midi import ChannelVoiceMessages, MetaEvents, MidiFile
 
 fluid_player_add_mem = cfunc(
     "fluid_player_add_mem",
@@ -16,9 +31,390 @@ fluid_player_add_mem = cfunc(
     ("len", c_uint, 1),
 )
 
+# any General MIDI bank works, programs it lacks fall back to piano
+SOUNDFONT = os.environ.get("CANCER_MUSIC_SOUNDFONT", "piano.sf2")
+FALLBACK_PROGRAM = 0
+# channel General MIDI keeps for percussion (0-indexed) and its bank
+DRUM_CHANNEL = 9
+DRUM_BANK = 128
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+# frames handed out per call to get_samples
+CHUNK_FRAMES = 4096
+# upper bound on how long we let notes ring out after the last event
+MAX_TAIL_SECONDS = 5
+# peak amplitude below which a chunk of the tail counts as silence
+SILENCE_THRESHOLD = 2
+# sizes a streamed WAV header gives, read as "until the stream ends"
+STREAMING_SIZE = 0xFFFFFFFF
+# default tempo of a MIDI file without a SET_TEMPO event (120 bpm)
+DEFAULT_US_PER_QUARTER = 500000
+
 
 class PatchedSynth(Synth):
+    player = None
+    sfid = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.presets: Dict[Tuple[int, int], bool] = {}
+
+    def has_preset(self, bank: int, program: int) -> bool:
+        """
+        Checks whether the loaded soundfont has a program, so the
+        answer for a pooled synth is looked up once per program.
+        """
+        key = (bank, program)
+        if key not in self.presets:
+            name = self.sfpreset_name(self.sfid, bank, program)
+            # without the preset API every program is assumed present
+            self.presets[key] = (
+                name is not None or fluid_synth_get_sfont_by_id is None
+            )
+        return self.presets[key]
+
     def play_from_mem(self, data):
         self.player = new_fluid_player(self.synth)
         fluid_player_add_mem(self.player, data, len(data))
         fluid_player_play(self.player)
+
+    def stop_player(self):
+        if self.player is not None:
+            fluid_player_stop(self.player)
+            delete_fluid_player(self.player)
+            self.player = None
+
+    def delete(self):
+        self.stop_player()
+        super().delete()
+
+
+def tempo_map(mf: MidiFile) -> List[Tuple[int, int]]:
+    """
+    Collects the tempo changes of a MIDI file.
+
+    :param mf: The MIDI file to scan.
+    :returns: Sorted (tick, microseconds per quarter) pairs,
+    always starting at tick 0.
+    """
+    changes = {0: DEFAULT_US_PER_QUARTER}
+    for track in mf.tracks:
+        tick = 0
+        for e in track.events:
+            if e.isDeltaTime():
+                tick += e.time
+            elif e.type == MetaEvents.SET_TEMPO:
+                changes[tick] = int.from_bytes(e.data[:3], "big")
+    return sorted(changes.items())
+
+
+def last_tick(mf: MidiFile) -> int:
+    """
+    Finds the tick of the latest event over all tracks.
+
+    :param mf: The MIDI file to scan.
+    :returns: Tick of the last event.
+    """
+    end = 0
+    for track in mf.tracks:
+        tick = sum(e.time for e in track.events if e.isDeltaTime())
+        end = max(end, tick)
+    return end
+
+
+def ticks_to_seconds(
+    ticks: int, tempos: List[Tuple[int, int]], tpq: int
+) -> float:
+    """
+    Converts an absolute tick position into seconds.
+
+    :param ticks: Tick position to convert.
+    :param tempos: Tempo map as returned by tempo_map.
+    :param tpq: Ticks per quarter note of the file.
+    :returns: Time in seconds.
+    """
+    seconds = 0.0
+    for i, (tick, us) in enumerate(tempos):
+        if tick >= ticks:
+            break
+        nxt = tempos[i + 1][0] if i + 1 < len(tempos) else ticks
+        seconds += (min(nxt, ticks) - tick) * us / (tpq * 1e6)
+    return seconds
+
+
+def midi_length_seconds(mf: MidiFile) -> float:
+    """
+    Works out how long a MIDI file plays for from its tempo map.
+
+    :param mf: The MIDI file.
+    :returns: Duration up to its last event, in seconds.
+    """
+    return ticks_to_seconds(
+        last_tick(mf), tempo_map(mf), mf.ticksPerQuarterNote
+    )
+
+
+def load_synth(soundfont: str = SOUNDFONT) -> PatchedSynth:
+    """
+    Creates a synth with the soundfont already loaded.
+
+    :param soundfont: Path of the soundfont to load.
+    :returns: A synth ready to render.
+    """
+    fs = PatchedSynth(samplerate=SAMPLE_RATE)
+    # need to provide example soundfont, or have user provide it
+    fs.sfid = fs.sfload(soundfont)
+    fs.program_select(0, fs.sfid, 0, 0)
+    return fs
+
+
+def reset_synth(fs: PatchedSynth):
+    """
+    Silences a synth and drops its player so it can render again.
+    """
+    fs.stop_player()
+    fs.system_reset()
+    fs.program_select(0, fs.sfid, 0, 0)
+
+
+class SynthPool:
+    """
+    Hands out synths with the soundfont already loaded, one thread at
+    a time. Synths are made on first demand up to size and reset when
+    they come back, so only the first renders pay for the load.
+    """
+
+    def __init__(self, size: int, soundfont: str = SOUNDFONT):
+        if size < 1:
+            raise ValueError("A synth pool needs at least one synth.")
+        self.size = size
+        self.soundfont = soundfont
+        # last in, first out so a lightly used pool keeps reusing
+        # the same warm synth
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def warm(self, count: Optional[int] = None):
+        """
+        Loads synths ahead of the first render.
+
+        :param count: Number of synths to load, the whole pool if
+        missing.
+        """
+        count = self.size if count is None else min(count, self.size)
+        with self.lock:
+            missing = max(0, count - self.created)
+            self.created += missing
+        for _ in range(missing):
+            self.idle.put(load_synth(self.soundfont))
+
+    def acquire(self) -> PatchedSynth:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            grow = self.created < self.size
+            if grow:
+                self.created += 1
+        if not grow:
+            return self.idle.get()
+        try:
+            return load_synth(self.soundfont)
+        except BaseException:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, fs: PatchedSynth):
+        # a render abandoned halfway still has its player attached
+        if fs.player is not None:
+            reset_synth(fs)
+        self.idle.put(fs)
+
+    @contextlib.contextmanager
+    def synth(self) -> Iterator[PatchedSynth]:
+        """
+        Borrows a synth for the enclosed block, waiting for one to be
+        returned if all of them are in use.
+        """
+        fs = self.acquire()
+        try:
+            yield fs
+        finally:
+            self.release(fs)
+
+    def close(self):
+        """
+        Deletes the idle synths. Synths still borrowed are left alone.
+        """
+        while True:
+            try:
+                fs = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.created -= 1
+            fs.delete()
+
+
+def fit_programs(mf: MidiFile, fs: PatchedSynth) -> bytes:
+    """
+    Serializes a MIDI file for a synth, replacing the programs its
+    soundfont lacks with the fallback so no part plays silently.
+    The MIDI file itself is left as it was.
+
+    :param mf: The MIDI file, one channel and program per instrument.
+    :param fs: The synth that will play it.
+    :returns: Contents of the MIDI file to play.
+    """
+    replaced = []
+    for track in mf.tracks:
+        for e in track.events:
+            if e.type != ChannelVoiceMessages.PROGRAM_CHANGE:
+                continue
+            # events count channels from 1
+            bank = DRUM_BANK if e.channel == DRUM_CHANNEL + 1 else 0
+            if not fs.has_preset(bank, e.data):
+                replaced.append((e, e.data))
+                e.data = FALLBACK_PROGRAM
+    try:
+        return mf.writestr()
+    finally:
+        for e, program in replaced:
+            e.data = program
+
+
+def render_chunks(
+    mf: MidiFile, soundfont: str = SOUNDFONT, fs: Optional[PatchedSynth] = None
+) -> Iterator[np.ndarray]:
+    """
+    Renders a MIDI file to interleaved 16-bit stereo frames.
+    All tracks are mixed in a single pass, each channel playing the
+    program its instrument selects.
+    Renders exactly the length given by the tempo map, then keeps
+    going only while the release tail is still audible.
+
+    :param mf: The MIDI file to render.
+    :param soundfont: Path of the soundfont to render with.
+    :param fs: Preloaded synth to reuse, a new one is made if missing.
+    :returns: Iterator over int16 sample chunks.
+    """
+    total = math.ceil(midi_length_seconds(mf) * SAMPLE_RATE)
+    owned = fs is None
+    if fs is None:
+        fs = load_synth(soundfont)
+    try:
+        fs.play_from_mem(fit_programs(mf, fs))
+
+        rendered = 0
+        while rendered < total:
+            frames = min(CHUNK_FRAMES, total - rendered)
+            yield fs.get_samples(frames)
+            rendered += frames
+
+        tail = 0
+        while tail < MAX_TAIL_SECONDS * SAMPLE_RATE:
+            s = fs.get_samples(CHUNK_FRAMES)
+            if -SILENCE_THRESHOLD < s.min() and s.max() < SILENCE_THRESHOLD:
+                break
+            yield s
+            tail += CHUNK_FRAMES
+    finally:
+        if owned:
+            fs.delete()
+        else:
+            reset_synth(fs)
+
+
+def to_wav(chunks: Iterator[np.ndarray]) -> bytes:
+    """
+    Packs rendered chunks into a WAV file.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :returns: Contents of the WAV file.
+    """
+    wav = io.BytesIO()
+    with wave.open(wav, "wb") as wr:
+        wr.setframerate(SAMPLE_RATE)
+        wr.setnchannels(CHANNELS)
+        wr.setsampwidth(SAMPLE_WIDTH)
+        for chunk in chunks:
+            wr.writeframes(chunk.astype(np.int16, copy=False).tobytes())
+    return wav.getvalue()
+
+
+def wav_header(frames: Optional[int] = None) -> bytes:
+    """
+    Builds the 44 byte header of a 16-bit PCM WAV file.
+
+    :param frames: Number of frames that follow. If missing, the
+    sizes are left open so the file can be streamed as it renders.
+    :returns: The header.
+    """
+    if frames is None:
+        riff = data = STREAMING_SIZE
+    else:
+        data = frames * CHANNELS * SAMPLE_WIDTH
+        riff = 36 + data
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        riff,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        CHANNELS,
+        SAMPLE_RATE,
+        SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH,
+        CHANNELS * SAMPLE_WIDTH,
+        SAMPLE_WIDTH * 8,
+        b"data",
+        data,
+    )
+
+
+def write_wav(chunks: Iterator[np.ndarray], f: BinaryIO) -> int:
+    """
+    Writes rendered chunks to a seekable file as a WAV file, one chunk
+    at a time. The sizes in the header are filled in once the last
+    chunk is written.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :param f: File to write to, from its current position.
+    :returns: Number of frames written.
+    """
+    start = f.tell()
+    f.write(wav_header())
+    frames = 0
+    for chunk in chunks:
+        data = chunk.astype(np.int16, copy=False).tobytes()
+        f.write(data)
+        frames += len(data) // (CHANNELS * SAMPLE_WIDTH)
+    end = f.tell()
+    f.seek(start)
+    f.write(wav_header(frames))
+    f.seek(end)
+    return frames
+
+
+def stream_wav(chunks: Iterator[np.ndarray]) -> Iterator[bytes]:
+    """
+    Packs rendered chunks into a WAV file as they arrive, behind a
+    header with open sizes.
+
+    :param chunks: Interleaved int16 stereo chunks.
+    :returns: Iterator over the bytes of the WAV file.
+    """
+    yield wav_header()
+    for chunk in chunks:
+        yield chunk.astype(np.int16, copy=False).tobytes()
+
+
+def render_wav(
+    mf: MidiFile, soundfont: str = SOUNDFONT, fs: Optional[PatchedSynth] = None
+) -> bytes:
+    return to_wav(render_chunks(mf, soundfont, fs))
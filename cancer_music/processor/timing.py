@@ -0,0 +1,85 @@
+"""
+Spans for finding out where the time of a mutation goes.
+Nothing is recorded unless a Recorder is active, so spans left in
+the hot loop cost a context variable lookup when nobody listens.
+"""
+
+import contextlib
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# name and duration in seconds
+Span = Tuple[str, float]
+
+
+class Recorder:
+    """
+    Collects finished spans in the order they end.
+    Subclass and override record to send them somewhere else.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def record(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def totals(self) -> Dict[str, float]:
+        """
+        :returns: Total seconds per span name, in order of first end.
+        """
+        return totals(self.spans)
+
+
+active: ContextVar[Optional[Recorder]] = ContextVar(
+    "timing_recorder", default=None
+)
+
+
+@contextlib.contextmanager
+def recording(recorder: Optional[Recorder] = None) -> Iterator[Recorder]:
+    """
+    Makes a recorder the target of every span opened in this context.
+
+    :param recorder: Recorder to use, a plain one is made if missing.
+    """
+    if recorder is None:
+        recorder = Recorder()
+    token = active.set(recorder)
+    try:
+        yield recorder
+    finally:
+        active.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Times the enclosed block under the given name.
+    """
+    recorder = active.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.record(name, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float):
+    """
+    Records a span timed by hand, for blocks too long to indent.
+    """
+    recorder = active.get()
+    if recorder is not None:
+        recorder.record(name, seconds)
+
+
+def totals(spans: List[Span]) -> Dict[str, float]:
+    summed: Dict[str, float] = {}
+    for name, seconds in spans:
+        summed[name] = summed.get(name, 0.0) + seconds
+    return summed
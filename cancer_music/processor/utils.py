@@ -1,3 +1,5 @@
+import bisect
+import contextlib
 import copy
 import math
 import os
@@ -6,11 +8,13 @@ import sys
 import uuid
 from fractions import Fraction
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+from music21 import freezeThaw, instrument
 from music21.chord import Chord
 from music21.duration import Duration
-from music21.instrument import Instrument
+from music21.exceptions21 import InstrumentException
+from music21.instrument import Instrument, UnpitchedPercussion
 from music21.key import Key
 from music21.meter.base import TimeSignature
 from music21.note import GeneralNote, Lyric, Note, Rest
@@ -19,12 +23,48 @@ from music21.volume import Volume
 from typeguard import typechecked
 
 
-def reseed(seed: Optional[int] = None):
+class Streams:
+    """
+    Random generators derived from one seed, one per key. A key names
+    who draws and for what, such as a subclone and its mutations, so
+    what one key draws does not depend on how much the others drew or
+    in which order they ran.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.generators: Dict[tuple, random.Random] = {}
+
+    def __call__(self, *key) -> random.Random:
+        """
+        :returns: The generator of a key, made on first use and kept.
+        """
+        if key not in self.generators:
+            self.generators[key] = self.fresh(*key)
+        return self.generators[key]
+
+    def fresh(self, *key) -> random.Random:
+        """
+        :returns: A new generator for a key, not kept, so it can be
+        handed to another thread or process.
+        """
+        # string seeds are hashed with SHA-512, the same on every run
+        return random.Random(":".join(map(str, (self.seed,) + key)))
+
+    def getstate(self) -> Dict[tuple, tuple]:
+        return {key: g.getstate() for key, g in self.generators.items()}
+
+    def setstate(self, state: Dict[tuple, tuple]):
+        self.generators = {}
+        for key, generator_state in state.items():
+            self.generators[key] = random.Random()
+            self.generators[key].setstate(generator_state)
+
+
+def reseed(seed: Optional[int] = None) -> Streams:
     if not seed:
         seed = random.randrange(sys.maxsize)
-    rng = random.Random(seed)
-    print("Seed", seed)
-    return rng
+    return Streams(seed)
 
 
 def choose_for_slices(start, end, steps, rng):
@@ -36,29 +76,49 @@ def choose_for_slices(start, end, steps, rng):
     return choices
 
 
+class TimeSignatureIndex:
+    """
+    Time signatures of a part sorted by offset, so the one active at
+    any offset is found by bisection instead of scanning every measure.
+    """
+
+    def __init__(self, parent_stream: Part):
+        self.offsets: List[Union[Fraction, float]] = []
+        self.signatures: List[TimeSignature] = []
+        for m in parent_stream.getElementsByClass("Measure"):
+            ts = m.timeSignature
+            # measures come sorted, on ties the first one wins
+            if ts is None or (self.offsets and m.offset == self.offsets[-1]):
+                continue
+            self.offsets.append(m.offset)
+            self.signatures.append(ts)
+
+    def at(self, offset: Union[Fraction, float]) -> Optional[TimeSignature]:
+        """
+        Gets the latest time signature at or before an offset.
+
+        :param offset: Offset in the part.
+        :return: The time signature, None if there is none yet.
+        """
+        i = bisect.bisect_right(self.offsets, offset)
+        if i == 0:
+            return None
+        return self.signatures[i - 1]
+
+
 @typechecked
 def get_time(m: Measure, parent_stream: Part) -> TimeSignature:
     """
     Gets the current active time signature for a measure.
+    Use a TimeSignatureIndex when looking up many measures of a part.
 
     :param m: Measure to get time signature for.
     :return: The measure's time signature.
     :raises ValueError: Raised if no time signature exists.
     """
-
-    all_measures = list(parent_stream.getElementsByClass("Measure"))
-
-    ts_list = [
-        (m.timeSignature, m.offset)
-        for m in all_measures
-        if m.timeSignature is not None
-    ]
-    # find the latest timesignature
-    previous = list(filter(lambda ts: ts[1] <= m.offset, ts_list))
-    ts = max(previous, key=lambda p: p[1])
-
-    if isinstance(ts[0], TimeSignature):
-        return ts[0]
+    ts = TimeSignatureIndex(parent_stream).at(m.offset)
+    if isinstance(ts, TimeSignature):
+        return ts
     else:
         raise ValueError(f"No time signature found for measure {m.number}.")
 
@@ -316,15 +376,78 @@ def duplicate_part(p: Union[Part, PartStaff], id) -> Part:
         ],
         fillWithRests=True,
     )
+    add_instrument(dup, p, id)
+    return dup
+
+
+def add_instrument(dup: Part, p: Union[Part, PartStaff], id):
+    """
+    Gives a duplicated part its id and a plain copy of the
+    instrument of the part it was made from.
 
+    :param dup: The duplicate.
+    :param p: The part it was made from.
+    :raises ValueError: Raised if p has no instrument.
+    """
     p_ins = p.getInstrument()
     if p_ins is not None:
         ins = Instrument(p_ins.instrumentName)
+        # keep the sound, so a subclone plays like its parent
+        ins.midiProgram = p_ins.midiProgram
+        ins.midiChannel = p_ins.midiChannel
         dup.id = id
         dup.insert(0, ins)
     else:
         raise ValueError(f"Part {p.id} missing an instrument!")
-    return dup
+
+
+def assign_programs(
+    s: Score,
+) -> List[Tuple[Instrument, Optional[int], Optional[int]]]:
+    """
+    Gives every part without a MIDI program the General MIDI program
+    of its instrument name, e.g. "Violin" or "Flute". Parts whose
+    name is not an instrument music21 knows keep playing as piano.
+
+    :param s: Score to update in place, see assigned_programs to leave
+    it as it was.
+    :returns: The instruments changed, with the program and channel
+    they had before.
+    """
+    changed = []
+    for p in s.parts:
+        ins = p.getInstrument()
+        if ins is None or ins.midiProgram is not None:
+            continue
+        for name in (ins.instrumentName, p.partName):
+            if not name:
+                continue
+            try:
+                known = instrument.fromString(name)
+            except InstrumentException:
+                continue
+            changed.append((ins, ins.midiProgram, ins.midiChannel))
+            ins.midiProgram = known.midiProgram
+            if isinstance(known, UnpitchedPercussion):
+                ins.midiChannel = known.midiChannel
+            break
+    return changed
+
+
+@contextlib.contextmanager
+def assigned_programs(s: Score) -> Iterator[Score]:
+    """
+    Assigns programs like assign_programs for the duration of the
+    block, and gives the instruments their own back after it. For
+    scores that are used again, such as templates and checkpoints.
+    """
+    changed = assign_programs(s)
+    try:
+        yield s
+    finally:
+        for ins, program, channel in changed:
+            ins.midiProgram = program
+            ins.midiChannel = channel
 
 
 def clear_part(p: Part, start) -> Part:
@@ -341,3 +464,18 @@ def clear_part(p: Part, start) -> Part:
 def consolidate_rests(s: Stream):
     # tricky, need to see what the measures look like with voices
     pass
+
+
+def freeze(s: Stream) -> bytes:
+    """
+    Pickles a stream so it can be sent to another process.
+    Mutated scores hold weak references that plain pickle refuses.
+    Streams outside s that its spanners point at are emptied.
+    """
+    return freezeThaw.StreamFreezer(s).writeStr(fmt="pickle")
+
+
+def thaw(data: bytes) -> Stream:
+    thawer = freezeThaw.StreamThawer()
+    thawer.openStr(data, pickleFormat="pickle")
+    return thawer.stream
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from api import cache
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return cache.DiskCache(str(tmp_path), 10)
+
+
+def test_content_key_is_stable():
+    assert cache.content_key(b"ab", b"c") == cache.content_key(b"ab", b"c")
+    assert cache.content_key(b"ab", b"c") != cache.content_key(b"a", b"bc")
+
+
+def test_get_missing(disk):
+    assert disk.get("nothing") is None
+
+
+def test_put_get(disk):
+    disk.put("a", b"1234")
+    assert disk.get("a") == b"1234"
+    assert not any(n.startswith(".tmp-") for n in os.listdir(disk.directory))
+
+
+def test_put_chunks_open(disk):
+    disk.put_chunks("a", iter([b"12", b"34"]))
+    with disk.open("a") as f:
+        assert f.read() == b"1234"
+    assert disk.open("b") is None
+    stats = disk.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["disk_bytes"] == 4
+    assert stats["disk_entries"] == 1
+
+
+def test_evicts_least_recently_used(disk):
+    disk.put("a", b"1234")
+    disk.put("b", b"1234")
+    # make "a" the older entry, then touch it so "b" becomes the oldest
+    os.utime(disk.path("a"), (time.time() - 20, time.time() - 20))
+    os.utime(disk.path("b"), (time.time() - 10, time.time() - 10))
+    assert disk.get("a") == b"1234"
+
+    disk.put("c", b"1234")
+    assert disk.get("b") is None
+    assert disk.get("a") == b"1234"
+    assert disk.get("c") == b"1234"
+
+
+def test_disk_ttl(tmp_path):
+    disk = cache.DiskCache(str(tmp_path), 100, ttl=60)
+    disk.put("a", b"1234")
+    old = time.time() - 120
+    os.utime(disk.path("a"), (old, old))
+    assert disk.get("a") is None
+    assert not os.path.exists(disk.path("a"))
+
+
+def test_canonical_ignores_key_order():
+    assert cache.canonical({"a": 1, "b": 2}) == cache.canonical(
+        {"b": 2, "a": 1}
+    )
+
+
+def test_writing(disk):
+    with disk.writing("a") as f:
+        f.write(b"12")
+        f.seek(0)
+        f.write(b"3")
+    assert disk.get("a") == b"32"
+    with pytest.raises(ValueError):
+        with disk.writing("b") as f:
+            f.write(b"12")
+            raise ValueError()
+    assert disk.get("b") is None
+    assert not any(n.startswith(".tmp-") for n in os.listdir(disk.directory))
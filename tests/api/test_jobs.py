@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from api import jobs
+
+
+@pytest.fixture
+def runner():
+    r = jobs.JobRunner(1, 1)
+    yield r
+    r.shutdown()
+
+
+def test_runs_jobs(runner):
+    assert runner.submit(pow, 2, 10).result() == 1024
+
+
+def test_refuses_when_full(runner):
+    running = runner.submit(time.sleep, 0.5)
+    waiting = runner.submit(time.sleep, 0)
+    with pytest.raises(jobs.QueueFull):
+        runner.submit(time.sleep, 0)
+    running.result()
+    waiting.result()
+    # slots are given back by done callbacks, which may lag the result
+    time.sleep(0.1)
+    assert runner.submit(pow, 2, 2).result() == 4
+
+
+def wait_for(job):
+    for _ in range(100):
+        if job.finished is not None:
+            return
+        time.sleep(0.05)
+
+
+def test_job_store_events():
+    store = jobs.JobStore(60)
+    try:
+        job = store.create("mutant")
+        store.report(job.id, {"status": "setup"})
+        store.finish(job, "key")
+        wait_for(job)
+
+        assert store.get(job.id) is job
+        assert job.result == "key"
+        assert [e["status"] for e in job.events] == [
+            "queued",
+            "setup",
+            "done",
+        ]
+    finally:
+        store.shutdown()
+
+
+def test_job_store_expires_finished_jobs():
+    store = jobs.JobStore(0)
+    try:
+        job = store.create("mutant")
+        store.fail(job, "boom")
+        wait_for(job)
+        time.sleep(0.01)
+        assert store.get(job.id) is None
+    finally:
+        store.shutdown()
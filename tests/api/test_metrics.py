@@ -0,0 +1,26 @@
+from api import metrics
+
+
+def test_histogram_render():
+    h = metrics.Histogram("t_seconds", "Test.", "stage", buckets=[0.1, 1])
+    h.observe("mutate", 0.05)
+    h.observe("mutate", 0.5)
+    h.observe("mutate", 5)
+    lines = h.render().splitlines()
+    assert lines[:2] == [
+        "# HELP t_seconds Test.",
+        "# TYPE t_seconds histogram",
+    ]
+    assert 't_seconds_bucket{stage="mutate",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="mutate",le="1"} 2' in lines
+    assert 't_seconds_bucket{stage="mutate",le="+Inf"} 3' in lines
+    assert 't_seconds_sum{stage="mutate"} 5.55' in lines
+    assert 't_seconds_count{stage="mutate"} 3' in lines
+
+
+def test_server_timing():
+    spans = [("mutate", 0.5), ("mutation.noop", 0.001), ("mutate", 0.25)]
+    assert (
+        metrics.server_timing(spans)
+        == "mutate;dur=750.0, mutation.noop;dur=1.0"
+    )
@@ -0,0 +1,23 @@
+import os
+
+from music21.stream.base import Score
+
+from api import samples
+
+
+def test_templates(tmp_path):
+    templates = samples.SampleTemplates("tests/data", str(tmp_path))
+    contents = samples.read_mxl("tests/data/twinkle.mxl")
+
+    a = templates.get(contents)
+    b = templates.get(contents)
+    assert isinstance(a, Score)
+    # every request gets its own copy
+    assert a is not b
+    assert len(a.parts) == len(b.parts)
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_unknown_upload(tmp_path):
+    templates = samples.SampleTemplates("tests/data", str(tmp_path))
+    assert templates.get(b"<score-partwise/>") is None
@@ -0,0 +1,46 @@
+import io
+import zipfile
+
+from api import zipstream
+
+
+def unzip(chunks) -> zipfile.ZipFile:
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert zf.testzip() is None
+    return zf
+
+
+def test_roundtrip():
+    zf = unzip(
+        zipstream.stream_zip([("a.json", "{}" * 100), ("b/c.mid", b"MThd")])
+    )
+    assert zf.read("a.json") == b"{}" * 100
+    assert zf.read("b/c.mid") == b"MThd"
+
+
+def test_wav_is_stored():
+    zf = unzip(zipstream.stream_zip([("a.wav", b"RIFF"), ("a.json", b"{}")]))
+    assert zf.getinfo("a.wav").compress_type == zipfile.ZIP_STORED
+    assert zf.getinfo("a.json").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_chunked_entries():
+    data = bytes(range(256)) * 1000
+    f = io.BytesIO(data)
+    zf = unzip(
+        zipstream.stream_zip([("a.wav", zipstream.read_chunks(f, 1000))])
+    )
+    assert zf.read("a.wav") == data
+    assert f.closed
+
+
+def test_read_members():
+    f = io.BytesIO()
+    for chunk in zipstream.stream_zip([("a.wav", b"RIFF"), ("b.json", "{}")]):
+        f.write(chunk)
+    f.seek(0)
+    zf = unzip(zipstream.stream_zip(zipstream.read_members(f, "1/")))
+    assert zf.namelist() == ["1/a.wav", "1/b.json"]
+    assert zf.read("1/a.wav") == b"RIFF"
+    assert zf.read("1/b.json") == b"{}"
+    assert f.closed
@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from processor import batch
+from processor.main import DEFAULT_PARAMS, DEFAULT_THERAPY
+
+
+def test_parameter_grid():
+    grid = {
+        "params": {"noop": [0.05, 0.1], "how_many": 2},
+        "therapy": {"therapy_mode": [0, 3]},
+    }
+    variants = batch.parameter_grid(
+        grid, DEFAULT_PARAMS, DEFAULT_THERAPY, [1, 2]
+    )
+    assert len(variants) == 8
+    assert {p["noop"] for p, _, _ in variants} == {0.05, 0.1}
+    assert all(p["how_many"] == 2 for p, _, _ in variants)
+    assert {t["therapy_mode"].value for _, t, _ in variants} == {0, 3}
+    assert {seed for _, _, seed in variants} == {1, 2}
+
+
+def test_parameter_grid_unknown_field():
+    with pytest.raises(ValueError):
+        batch.parameter_grid(
+            {"params": {"nope": 1}}, DEFAULT_PARAMS, DEFAULT_THERAPY, [1]
+        )
+
+
+def test_find_inputs():
+    inputs = batch.find_inputs(["tests/data", "tests/data/*.mxl"])
+    assert [os.path.basename(f) for f in inputs] == [
+        "twinkle.mxl",
+        "voice_test.mxl",
+    ]
+    with pytest.raises(ValueError):
+        batch.find_inputs(["tests/nothing_here"])
+
+
+def test_run_resumes(tmp_path):
+    out = str(tmp_path)
+    variants = batch.parameter_grid(
+        {}, DEFAULT_PARAMS, DEFAULT_THERAPY, [2, 3]
+    )
+    tasks = batch.plan(
+        [os.path.abspath("tests/data/twinkle.mxl")], variants, out
+    )
+
+    # pretend an earlier run got through the first task
+    assert batch.run(tasks[:1], out, 0, report=lambda _: None) == (1, 0)
+    assert batch.run(tasks, out, 0, report=lambda _: None) == (1, 0)
+
+    with open(os.path.join(out, batch.MANIFEST)) as f:
+        entries = [json.loads(line) for line in f]
+    assert [e["id"] for e in entries] == [t["id"] for t in tasks]
+    for e in entries:
+        assert os.path.isfile(e["output"])
+        assert "mutate" in e["timings"]
+        assert (
+            e["therapy"]["therapy_mode"]
+            == DEFAULT_THERAPY["therapy_mode"].value
+        )
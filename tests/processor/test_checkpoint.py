@@ -0,0 +1,114 @@
+import os
+
+import pytest
+from music21 import converter
+
+from processor import checkpoint, process
+from processor.process import (  # the classes mutate checks against
+    Checkpoints,
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+PARAMS = Parameters(
+    how_many=4,
+    max_parts=4,
+    reproduction=0.4,
+    noop=0.2,
+    insertion=0.2,
+    transposition=0.1,
+    deletion=0.25,
+    translocation=0.05,
+    inversion=0.2,
+    start=0.1,
+)
+
+
+def therapy(mode, start):
+    return TherapyParameters(
+        therapy_mode=mode,
+        mutant_survival=0.0,
+        start=start,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+
+
+def fingerprint(s):
+    return [
+        (
+            p.id,
+            [
+                (type(n).__name__, n.quarterLength, n.pitches, n.lyric)
+                for n in p.recurse().notesAndRests
+            ],
+        )
+        for p in s.parts
+    ]
+
+
+def test_first_action():
+    assert checkpoint.first_action(therapy(Therapy.OFF, 0.5), 3, 40) == 40
+    assert checkpoint.first_action(therapy(Therapy.CURE, 0.5), 3, 40) == 19
+    assert checkpoint.first_action(therapy(Therapy.ADAPTIVE, 0.5), 3, 40) == 3
+    # a therapy before the cancer never acts
+    assert checkpoint.first_action(therapy(Therapy.CURE, 0.0), 3, 40) == 40
+
+
+@pytest.mark.parametrize(
+    "late,early",
+    [
+        (therapy(Therapy.CURE, 0.8), therapy(Therapy.CURE, 0.5)),
+        (therapy(Therapy.OFF, 0.5), therapy(Therapy.PARTIAL_CURE, 0.6)),
+        (therapy(Therapy.CURE, 0.5), therapy(Therapy.CURE, 0.5)),
+    ],
+)
+def test_resume(late, early):
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    checkpoints = Checkpoints(every=4)
+    process.mutate(
+        s,
+        PARAMS,
+        late,
+        seed=5,
+        msgCallback=process.silent,
+        checkpoints=checkpoints,
+    )
+    assert checkpoints.resumed is None
+
+    m, tree = process.mutate(
+        s,
+        PARAMS,
+        early,
+        seed=5,
+        msgCallback=process.silent,
+        checkpoints=checkpoints,
+    )
+    assert checkpoints.resumed is not None
+    fresh, fresh_tree = process.mutate(
+        s, PARAMS, early, seed=5, msgCallback=process.silent
+    )
+    assert tree == fresh_tree
+    assert fingerprint(m) == fingerprint(fresh)
+
+
+def test_other_seed():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    t = therapy(Therapy.OFF, 0.5)
+    checkpoints = Checkpoints()
+    for seed in (5, 6):
+        m, tree = process.mutate(
+            s,
+            PARAMS,
+            t,
+            seed=seed,
+            msgCallback=process.silent,
+            checkpoints=checkpoints,
+        )
+        assert checkpoints.resumed is None
+    fresh, fresh_tree = process.mutate(
+        s, PARAMS, t, seed=6, msgCallback=process.silent
+    )
+    assert tree == fresh_tree
+    assert fingerprint(m) == fingerprint(fresh)
@@ -0,0 +1,276 @@
+import copy
+import random
+
+import pytest
+from music21 import midi
+from music21.chord import Chord
+from music21.instrument import Piano
+from music21.meter.base import TimeSignature
+from music21.note import Note, Rest
+from music21.stream.base import Measure, Part, Voice
+
+from processor import compact, utils
+from processor.process import (
+    delete_substring,
+    invert_stream,
+    subdivide_stream,
+)
+
+
+@pytest.fixture
+def sm():
+    m = Measure()
+    m.append(Note("C", type="quarter"))
+    m.append(Note("D", type="quarter"))
+    m.append(Note("E", type="quarter"))
+    m.append(Note("F", type="quarter"))
+    return m
+
+
+@pytest.fixture
+def voiced():
+    m = Measure()
+    v1 = Voice()
+    v1.append(Note("C", type="quarter"))
+    v1.append(Note("D", type="quarter"))
+    v1.append(Note("E", type="quarter"))
+    v1.append(Note("F", type="quarter"))
+    v2 = Voice()
+    v2.append(Note("G", type="half"))
+    v2.append(Note("G", type="half"))
+    m.insert(0, v1)
+    m.insert(0, v2)
+    return m
+
+
+def contents(m):
+    return [
+        (
+            el.getOffsetInHierarchy(m),
+            type(el).__name__,
+            el.quarterLength,
+            tuple(p.nameWithOctave for p in el.pitches),
+            tuple(lyr.text for lyr in el.lyrics),
+        )
+        for el in m.recurse().notesAndRests
+    ]
+
+
+@pytest.mark.parametrize("fixture", ["sm", "voiced"])
+@pytest.mark.parametrize(
+    "ops",
+    [
+        (subdivide_stream, compact.subdivide_stream),
+        (delete_substring, compact.delete_substring),
+        (invert_stream, compact.invert_stream),
+    ],
+)
+def test_matches_music21(fixture, ops, request):
+    measure = request.getfixturevalue(fixture)
+    offsets = [0.0, 1.0]
+    m = utils.copy_inverse(measure, offsets)
+    ops[0](m, measure, offsets)
+
+    cm = compact.from_measure(measure)
+    c = compact.copy_inverse(cm, offsets)
+    ops[1](c, cm, offsets)
+
+    assert contents(compact.to_measure(c)) == contents(m)
+
+
+def velocities(m):
+    mf = midi.translate.streamToMidiFile(m)
+    return [
+        e.velocity
+        for t in mf.tracks
+        for e in t.events
+        if e.type == midi.ChannelVoiceMessages.NOTE_ON
+    ]
+
+
+def test_chord_velocities():
+    measure = Measure()
+    measure.append(Chord(["C4", "E4"], type="quarter"))
+    loud = Chord(["D4", "F4"], type="quarter")
+    loud.volume.velocity = 100
+    measure.append(loud)
+    split = Chord(["E4", "G4"], type="quarter")
+    split.setVolumes([60, 90])
+    measure.append(split)
+    measure.append(Note("F4", type="quarter"))
+    offsets = [0.0, 1.0, 2.0]
+
+    og = copy.deepcopy(measure)
+    m = utils.copy_inverse(og, offsets)
+    subdivide_stream(m, og, offsets)
+
+    cm = compact.from_measure(measure)
+    c = compact.copy_inverse(cm, offsets)
+    compact.subdivide_stream(c, cm, offsets)
+
+    assert velocities(compact.to_measure(c)) == velocities(m)
+    # neither reading nor copying a measure gives its chord notes volumes
+    assert not measure.notes[0].hasComponentVolumes()
+    assert velocities(compact.to_measure(cm)) == velocities(measure)
+
+
+def test_roundtrip(voiced):
+    m = compact.to_measure(compact.from_measure(voiced), 3)
+    assert m.number == 3
+    assert contents(m) == contents(voiced)
+
+
+def test_transpose_measure(sm):
+    cm = compact.from_measure(sm)
+    m = compact.to_measure(compact.transpose_measure(cm, [2.0, 3.0], 1))
+    assert m[0] == Note("C", type="quarter")
+    assert m[1] == Note("D", type="quarter")
+    assert m[2] == Note("F", type="quarter")
+    assert m[3] == Note("F#", type="quarter")
+    assert m[3].lyric == "t"
+    # the source measure is left alone
+    assert sm[3] == Note("F", type="quarter")
+
+
+def test_copy_measure_lyrics(sm):
+    cm = compact.copy_measure(compact.from_measure(sm), lyrics=("",))
+    m = compact.to_measure(cm)
+    assert all(n.lyric == "" for n in m.notes)
+
+
+def test_copy_measure_shares(sm):
+    cm = compact.from_measure(sm, lyrics=("",))
+    dup = compact.copy_measure(cm, lyrics=("x",))
+    assert dup.notes is cm.notes
+    assert [n.lyric for n in compact.to_measure(dup).notes] == ["x"] * 4
+    assert [n.lyric for n in compact.to_measure(cm).notes] == [""] * 4
+
+    m = compact.to_measure(compact.transpose_measure(dup, [3.0], 1))
+    assert [n.lyric for n in m.notes] == ["x", "x", "x", "t"]
+
+
+def test_deletion_rest(sm):
+    cm = compact.from_measure(sm)
+    c = compact.copy_inverse(cm, [2.0, 3.0])
+    compact.delete_substring(c, cm, [2.0, 3.0])
+    m = compact.to_measure(c)
+    assert m[2] == Rest(type="half")
+    assert m[2].lyric == "d"
+
+
+def test_random_offsets_same_draws(voiced):
+    cm = compact.from_measure(voiced)
+    assert compact.random_offsets(cm, random.Random(3)) == (
+        utils.random_offsets(voiced, random.Random(3))
+    )
+
+
+def test_parent_measures_by_time():
+    p = Part()
+    for i, (ts, n) in enumerate([("4/4", "C"), (None, None), ("3/4", "D")]):
+        m = Measure(number=i)
+        if ts is not None:
+            m.insert(0, TimeSignature(ts))
+        if n is None:
+            m.append(Rest(type="whole"))
+        else:
+            m.append(Note(n, type="quarter"))
+        p.append(m)
+    parent = compact.ParentMeasures(p)
+    assert parent.times == [(4, 4), (4, 4), (3, 4)]
+    # the empty measure can't be picked
+    assert parent.by_time == {(4, 4): [0], (3, 4): [2]}
+
+    cm = compact.from_measure(p.getElementsByClass("Measure")[0])
+    cm.placed = 2
+    m = compact.to_measure(compact.translocation(cm, random.Random(0), parent))
+    assert m[0] == Note("D", type="quarter")
+    assert m[0].lyric == "tl"
+
+
+def test_parent_measures_voiced(voiced):
+    p = Part()
+    voiced.insert(0, TimeSignature("4/4"))
+    p.append(voiced)
+    assert compact.ParentMeasures(p).by_time == {(4, 4): [0]}
+
+
+def test_to_part():
+    p = Part(id="P")
+    p.insert(0, Piano())
+    for i in range(3):
+        m = Measure(number=i + 1)
+        if i == 0:
+            m.insert(0, TimeSignature("2/4"))
+        m.append(Note("C", type="eighth"))
+        m.append(Note("D", type="eighth"))
+        m.append(Note("E", type="quarter"))
+        p.append(m)
+
+    cm = compact.from_measure(p.getElementsByClass("Measure")[2])
+    slots = [(compact.COPY, 0), (compact.TEMPLATE, 1), cm]
+    part = compact.to_part(p, 7, slots)
+    measures = part.getElementsByClass("Measure")
+
+    assert part.id == 7
+    assert part.getInstrument().instrumentName == "Piano"
+    assert [m.number for m in measures] == [1, 2, 3]
+    assert measures[0].notes[0].beams.getTypes() == ["start"]
+    assert measures[1].notes.first() is None
+    assert measures[1].duration.quarterLength == 2
+    # beamed with the time signature of the first measure
+    assert measures[2].timeSignature is None
+    assert measures[2].notes[1].beams.getTypes() == ["stop"]
+
+
+def test_to_part_shared():
+    p = Part(id="P")
+    for i in range(3):
+        m = Measure(number=i + 1)
+        if i == 0:
+            m.insert(0, TimeSignature("2/4"))
+        m.append(Note("C", type="eighth"))
+        m.append(Note("D", type="eighth"))
+        m.append(Note("E", type="quarter"))
+        p.append(m)
+
+    cm = compact.from_measure(p.getElementsByClass("Measure")[2])
+    dup = compact.copy_measure(cm)
+    slots = [(compact.TEMPLATE, 0), cm, dup]
+    shared = {}
+    parts = [compact.to_part(p, i, slots, shared) for i in range(2)]
+    # the template, and a single measure for cm and its copy
+    assert len(shared) == 2
+    alone = compact.to_part(p, 0, slots)
+    for part in parts:
+        measures = part.getElementsByClass("Measure")
+        assert [m.number for m in measures] == [1, 2, 3]
+        assert [contents(m) for m in measures] == [
+            contents(m) for m in alone.getElementsByClass("Measure")
+        ]
+        assert measures[2].notes[1].beams.getTypes() == ["stop"]
+    # every part gets measures of its own
+    assert parts[0].measure(2) is not parts[1].measure(2)
+
+
+def test_to_part_mutated_first_measure():
+    p = Part(id="P")
+    for i in range(2):
+        m = Measure(number=i + 1)
+        if i == 0:
+            m.insert(0, TimeSignature("2/4"))
+        m.append(Note("C", type="eighth"))
+        m.append(Note("D", type="eighth"))
+        m.append(Note("E", type="quarter"))
+        p.append(m)
+
+    # tumors drop their time signature, like in mutate
+    first = p.getElementsByClass("Measure")[0]
+    cm = compact.from_measure(first, ["Clef", "KeySignature", "TimeSignature"])
+    slots = [compact.noop(cm, random.Random(0), None), (compact.COPY, 1)]
+    measures = compact.to_part(p, 1, slots).getElementsByClass("Measure")
+
+    assert measures[0].timeSignature is None
+    for m in measures:
+        assert m.notes[0].beams.getTypes() == ["start"]
+        assert m.notes[1].beams.getTypes() == ["stop"]
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+from music21 import converter
+
+from processor import dryrun, process
+from processor.process import (  # the classes mutate checks against
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+PARAMS = Parameters(
+    how_many=4,
+    max_parts=4,
+    reproduction=0.4,
+    noop=0.2,
+    insertion=0.2,
+    transposition=0.1,
+    deletion=0.25,
+    translocation=0.05,
+    inversion=0.2,
+    start=0.1,
+)
+
+
+@pytest.mark.parametrize(
+    "mode,seed",
+    [
+        (Therapy.OFF, 2),
+        (Therapy.CURE, 5),
+        (Therapy.PARTIAL_CURE, 3),
+        (Therapy.ADAPTIVE, 8),
+    ],
+)
+def test_matches_mutate(monkeypatch, mode, seed):
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    ref = process.normalize(s)
+    t = TherapyParameters(
+        therapy_mode=mode,
+        mutant_survival=0.0,
+        start=0.5,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+    drawn = []
+    choose = process.choose_mutation
+
+    def recording(*args):
+        mutation = choose(*args)
+        drawn.append(mutation.__name__)
+        return mutation
+
+    monkeypatch.setattr(process, "choose_mutation", recording)
+    m, tree = process.mutate(
+        ref, PARAMS, t, seed=seed, msgCallback=process.silent, normalized=True
+    )
+    monkeypatch.undo()
+
+    run = dryrun.simulate(
+        dryrun.prepare(ref, normalized=True), PARAMS, t, seed
+    )
+    assert run.tree == tree
+    assert [name for _, _, name in run.mutations] == drawn
+    assert sorted(p.id for p in m.parts) == sorted(
+        set(range(len(s.parts))) | set(run.info)
+    )
+
+
+def test_alive():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    t = TherapyParameters(
+        therapy_mode=Therapy.CURE,
+        mutant_survival=0.0,
+        start=0.5,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+    run = dryrun.dry_run(s, PARAMS, t, 5)
+    length = len(run.alive)
+    cancer_start = int(PARAMS["start"] * length) - 1
+    therapy_start = int(t["start"] * length) - 1
+    assert all(len(a) == 0 for a in run.alive[:cancer_start])
+    assert len(run.alive[cancer_start]) > 0
+    # the cure kills every subclone for good
+    assert all(len(a) == 0 for a in run.alive[therapy_start:])
+    assert not any(info["alive"] for info in run.info.values())
@@ -0,0 +1,56 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from processor import encode, synth
+from processor.encode import AudioFormat
+
+
+def chunks(n=8):
+    return [np.arange(4096, dtype=np.int16) + i for i in range(n)]
+
+
+def test_encode_streams_through_command():
+    out = b"".join(encode.encode_chunks(iter(chunks()), ["cat"]))
+    assert out == b"".join(c.tobytes() for c in chunks())
+
+
+def test_pack_wav():
+    out = list(encode.pack(iter(chunks(40)), AudioFormat.WAV))
+    assert len(out) > 1
+    assert max(len(data) for data in out) <= encode.READ_BYTES
+    assert b"".join(out) == synth.to_wav(iter(chunks(40)))
+
+
+def test_encoder_missing():
+    with pytest.raises(encode.EncoderError):
+        list(encode.encode_chunks(iter(chunks()), ["no-such-encoder"]))
+
+
+def test_encoder_fails():
+    with pytest.raises(encode.EncoderError):
+        list(encode.encode_chunks(iter(chunks()), ["false"]))
+
+
+def test_abandoned_render_is_closed():
+    closed = []
+
+    def render():
+        try:
+            for c in chunks(1000):
+                yield c
+        finally:
+            closed.append(True)
+
+    out = encode.encode_chunks(render(), ["cat"])
+    next(out)
+    out.close()
+    assert closed == [True]
+
+
+@pytest.mark.skipif(shutil.which(encode.FFMPEG) is None, reason="no ffmpeg")
+def test_flac():
+    command = encode.encoder_command(AudioFormat.FLAC)
+    out = b"".join(encode.encode_chunks(iter(chunks()), command))
+    assert out.startswith(b"fLaC")
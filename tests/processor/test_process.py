@@ -1,13 +1,21 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+from music21 import converter
 from music21.note import Note, Rest
 from music21.stream.base import Measure, Voice
 
 from processor import utils
-from processor.parameters import Therapy, TherapyParameters
-from processor.process import (
+from processor.process import (  # the classes mutate checks against
+    Parameters,
+    Therapy,
+    TherapyParameters,
     delete_substring,
     invert_stream,
     mutate,
+    mutate_many,
+    silent,
     subdivide_stream,
     transpose_measure,
 )
@@ -251,3 +259,78 @@ def test_partial(streams):
             ),
         )
         stream.write("musicxml", f"partial_cured_{filename}")
+
+
+def fingerprint(s):
+    return [
+        (
+            p.id,
+            [
+                (type(n).__name__, n.quarterLength, n.pitches, n.lyric)
+                for n in p.recurse().notesAndRests
+            ],
+        )
+        for p in s.parts
+    ]
+
+
+@pytest.mark.parametrize("executor", [None, ThreadPoolExecutor(2)])
+def test_mutate_many(executor):
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    p = Parameters(
+        how_many=4,
+        max_parts=4,
+        reproduction=0.3,
+        noop=0.2,
+        insertion=0.2,
+        transposition=0.1,
+        deletion=0.25,
+        translocation=0.05,
+        inversion=0.2,
+        start=0.1,
+    )
+    t = TherapyParameters(
+        therapy_mode=Therapy.ADAPTIVE,
+        mutant_survival=0.0,
+        start=0.0,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+    variants = [(p, t, seed) for seed in (2, 3, 4)]
+
+    many = mutate_many(s, variants, executor)
+    for (m, tree), (_, _, seed) in zip(many, variants):
+        single, single_tree = mutate(s, p, t, seed=seed)
+        assert tree == single_tree
+        assert fingerprint(m) == fingerprint(single)
+
+
+def test_mutate_executor():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    p = Parameters(
+        how_many=2,
+        max_parts=6,
+        reproduction=0.6,
+        noop=0.2,
+        insertion=0.2,
+        transposition=0.1,
+        deletion=0.25,
+        translocation=0.05,
+        inversion=0.2,
+        start=0.1,
+    )
+    t = TherapyParameters(
+        therapy_mode=Therapy.OFF,
+        mutant_survival=0.0,
+        start=0.0,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+    m, tree = mutate(s, p, t, seed=5, msgCallback=silent)
+    with ThreadPoolExecutor(4) as executor:
+        parallel, parallel_tree = mutate(
+            s, p, t, seed=5, msgCallback=silent, executor=executor
+        )
+    assert sum(len(children) for children in tree.values()) > 0
+    assert parallel_tree == tree
+    assert fingerprint(parallel) == fingerprint(m)
@@ -0,0 +1,122 @@
+import io
+import wave
+
+import numpy as np
+from music21.midi import ChannelVoiceMessages
+from music21.midi.translate import streamToMidiFile
+from music21.note import Note, Rest
+from music21.stream.base import Measure, Part, Score
+
+from processor import rerender, synth
+
+
+def score(pitches):
+    """
+    One measure per pitch at the default 120 bpm, two seconds each.
+    """
+    p = Part()
+    for i, pitch in enumerate(pitches):
+        m = Measure(number=i + 1)
+        m.append(Note(pitch, quarterLength=4) if pitch else Rest(4))
+        p.append(m)
+    s = Score()
+    s.insert(0, p)
+    return streamToMidiFile(s)
+
+
+def test_divergence():
+    mf = score(["C4", "D4", "E4", "F4"])
+    tpq = mf.ticksPerQuarterNote
+    ref = rerender.timeline(mf)
+    mut = rerender.timeline(score(["C4", "D4", "E4", "G4"]))
+    assert rerender.divergence(ref, ref) == ref[-1][0] + 1
+    assert rerender.divergence(ref, mut) == 12 * tpq
+    assert rerender.divergence(mut, ref) == 12 * tpq
+    assert rerender.divergence(ref, mut[:3]) == mut[3][0]
+
+
+def test_quiet_ticks():
+    mf = score(["C4", None, "E4"])
+    events = rerender.timeline(mf)
+    tpq = mf.ticksPerQuarterNote
+    # between notes, but not while one is held
+    quiet = rerender.quiet_ticks(events, 12 * tpq)
+    assert 0 in quiet
+    assert all(t % (4 * tpq) == 0 for t in quiet)
+
+
+def test_splice_points():
+    ref = score(["C4", "D4", "E4", "F4"])
+    mf = score(["C4", "D4", "E4", "G4"])
+    tpq = mf.ticksPerQuarterNote
+    # the difference is at 6s, so the render starts at the last quiet
+    # tick a fade and a release earlier
+    assert rerender.splice_points(ref, mf) == (8 * tpq, 12 * tpq)
+    # too early to save anything
+    assert rerender.splice_points(ref, score(["G4"])) is None
+
+
+def test_tail_midi():
+    mf = score(["C4", "D4", "E4"])
+    tpq = mf.ticksPerQuarterNote
+    tail = rerender.tail_midi(mf, 4 * tpq)
+    notes = [
+        (tick, e.pitch)
+        for t in tail.tracks
+        for tick, e in rerender.absolute(t)
+        if e.type == ChannelVoiceMessages.NOTE_ON and not e.isNoteOff()
+    ]
+    assert notes == [(0, 62), (4 * tpq, 64)]
+    # the state before the cut is set up front
+    assert any(
+        tick == 0 and e.type == ChannelVoiceMessages.PITCH_BEND
+        for t in tail.tracks
+        for tick, e in rerender.absolute(t)
+    )
+
+
+def wav(samples: np.ndarray) -> io.BytesIO:
+    f = io.BytesIO()
+    for _ in rerender.record(iter([samples]), f):
+        pass
+    f.seek(0)
+    return f
+
+
+def test_splice():
+    ref = np.full(2 * 1000, 1000, dtype=np.int16)
+    tail = iter([np.full(2 * 50, -1000, dtype=np.int16)] * 12)
+    wr = rerender.open_reference(wav(ref))
+    out = np.concatenate(list(rerender.splice(wr, 400, tail, 100)))
+    assert len(out) == 2 * 1000
+    assert (out[: 2 * 400] == 1000).all()
+    fade = out[2 * 400 : 2 * 500]
+    assert fade[0] == 1000 and fade[-1] == -1000
+    assert (np.diff(fade[::2]) <= 0).all()
+    assert (out[2 * 500 :] == -1000).all()
+
+
+def test_render_chunks_falls_back(monkeypatch):
+    rendered = []
+
+    def render_chunks(mf, fs=None):
+        rendered.append(mf)
+        yield np.zeros(2 * 10, dtype=np.int16)
+
+    monkeypatch.setattr(rerender.synth, "render_chunks", render_chunks)
+    mf = score(["G4"])
+    ref_wav = wav(np.zeros(2 * 10, dtype=np.int16))
+    out = list(rerender.render_chunks(mf, score(["C4"]), ref_wav, None))
+    assert rendered == [mf]
+    assert len(out) == 1
+    assert ref_wav.closed
+
+
+def test_record():
+    chunks = [np.arange(2 * 10, dtype=np.int16)] * 2
+    f = io.BytesIO()
+    assert list(rerender.record(iter(chunks), f)) == chunks
+    f.seek(0)
+    with wave.open(f) as wr:
+        assert wr.getframerate() == synth.SAMPLE_RATE
+        assert wr.readframes(20) == b"".join(c.tobytes() for c in chunks)
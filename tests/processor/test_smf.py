@@ -0,0 +1,115 @@
+import os
+
+import pytest
+from music21 import bar, converter, dynamics, tempo
+from music21.chord import Chord
+from music21.midi.translate import streamToMidiFile
+from music21.note import Note, Rest
+from music21.stream.base import Measure, Part, Score
+from music21.tie import Tie
+
+from processor import smf
+from processor.process import (  # the classes mutate checks against
+    Parameters,
+    Therapy,
+    TherapyParameters,
+    mutate,
+    normalize,
+)
+
+SAMPLES = "cancer_music/api/front/src/samples"
+
+
+def part(*measures):
+    p = Part()
+    for i, elements in enumerate(measures):
+        m = Measure(number=i + 1)
+        for el in elements:
+            m.append(el)
+        p.append(m)
+    return p
+
+
+def score(*parts):
+    s = Score()
+    for p in parts:
+        s.insert(0, p)
+    return s
+
+
+def assert_same(s):
+    assert smf.write(s).writestr() == streamToMidiFile(s).writestr()
+
+
+def test_files(streams):
+    for _, s in streams:
+        assert_same(s)
+
+
+# smf relies on music21 internals, so a music21 upgrade that changes
+# them fails here
+@pytest.mark.parametrize("f", sorted(os.listdir(SAMPLES)))
+def test_samples(f):
+    s = normalize(converter.parse(os.path.abspath(f"{SAMPLES}/{f}")))
+    assert_same(s)
+    m, _ = mutate(s, seed=1, msgCallback=lambda *_: None, normalized=True)
+    assert_same(m)
+
+
+def test_mutant():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    p = Parameters(
+        how_many=4,
+        max_parts=4,
+        reproduction=0.3,
+        noop=0.2,
+        insertion=0.2,
+        transposition=0.1,
+        deletion=0.25,
+        translocation=0.05,
+        inversion=0.2,
+        start=0.1,
+    )
+    t = TherapyParameters(
+        therapy_mode=Therapy.ADAPTIVE,
+        mutant_survival=0.0,
+        start=0.0,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+    m, _ = mutate(s, p, t, seed=2, msgCallback=lambda *_: None)
+    assert_same(m)
+
+
+def test_ties():
+    first, second = Note("C4", quarterLength=2), Note("C4", quarterLength=4)
+    first.tie, second.tie = Tie("start"), Tie("stop")
+    c1, c2 = Chord(["E4", "G4"], quarterLength=4), Chord(["E4", "G4"])
+    c1.tie, c2.tie = Tie("start"), Tie("stop")
+    s = score(
+        part([Rest(2), first], [second]),
+        part([c1], [c2, Rest(3)]),
+    )
+    assert_same(s)
+
+
+def test_dynamics():
+    loud = Chord(["C4", "E4"], quarterLength=2)
+    loud[1].volume.velocity = 40
+    s = score(
+        part(
+            [dynamics.Dynamic("p"), Note("C4", quarterLength=2), loud],
+            [tempo.MetronomeMark(number=90), dynamics.Dynamic("ff")]
+            + [Note("D4") for _ in range(4)],
+        )
+    )
+    assert_same(s)
+
+
+def test_falls_back():
+    p = part([Note("C4", quarterLength=4)], [Note("D4", quarterLength=4)])
+    p.getElementsByClass(Measure)[1].rightBarline = bar.Repeat(direction="end")
+    s = score(p)
+    with pytest.raises(smf.Unsupported):
+        smf.write(s)
+    assert smf.to_midi_file(s).writestr() == streamToMidiFile(s).writestr()
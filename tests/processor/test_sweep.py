@@ -0,0 +1,79 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pytest
+from music21 import converter
+
+from processor import dryrun, sweep
+from processor.process import (  # the classes mutate checks against
+    Parameters,
+    Therapy,
+    TherapyParameters,
+)
+
+PARAMS = Parameters(
+    how_many=4,
+    max_parts=4,
+    reproduction=0.4,
+    noop=0.2,
+    insertion=0.2,
+    transposition=0.1,
+    deletion=0.25,
+    translocation=0.05,
+    inversion=0.2,
+    start=0.1,
+)
+
+
+def therapy(mode):
+    return TherapyParameters(
+        therapy_mode=mode,
+        mutant_survival=0.0,
+        start=0.5,
+        adaptive_threshold=2,
+        adaptive_interval=8,
+    )
+
+
+def test_shapes():
+    variants = [(PARAMS, therapy(mode)) for mode in Therapy]
+    results = sweep.sweep(40, 3, variants, 50, seed=1)
+    assert len(results) == len(variants)
+    for r, (p, t) in zip(results, variants):
+        assert r.params is p and r.t_params is t
+        assert r.alive.shape == r.offspring.shape == (50, 40)
+        assert r.mutations.shape == (40, len(sweep.MUTATION_NAMES))
+        assert (r.offspring <= PARAMS["max_parts"]).all()
+        assert (np.diff(r.offspring, axis=1) >= 0).all()
+
+    cure = results[Therapy.CURE.value]
+    assert (cure.alive[:, 19:] == 0).all()
+    assert (cure.mutations[19:] == 0).all()
+
+
+def test_matches_dryrun():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    dry = dryrun.prepare(s)
+    t = therapy(Therapy.ADAPTIVE)
+    alive = []
+    offspring = []
+    for seed in range(1, 301):
+        with contextlib.redirect_stdout(io.StringIO()):
+            run = dryrun.simulate(dry, PARAMS, t, seed)
+        alive.append([len(a) for a in run.alive])
+        offspring.append(sum(len(c) for c in run.tree.values()))
+
+    r = sweep.sweep(dry.length, dry.parts, [(PARAMS, t)], 5000, 1)[0]
+    assert np.abs(r.alive.mean(axis=0) - np.mean(alive, axis=0)).max() < 0.3
+    assert abs(r.offspring[:, -1].mean() - np.mean(offspring)) < 0.3
+    shares = r.mutations.sum(axis=0) / r.mutations.sum()
+    weights = [PARAMS[name] for name in sweep.MUTATION_NAMES]
+    assert np.allclose(shares, weights, atol=0.02)
+
+
+def test_weights():
+    bad = Parameters(PARAMS, noop=0.5)
+    with pytest.raises(ValueError):
+        sweep.sweep(10, 1, [(bad, therapy(Therapy.OFF))], 10)
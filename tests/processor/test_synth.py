@@ -0,0 +1,177 @@
+import io
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+from music21 import instrument
+from music21.midi import ChannelVoiceMessages, MidiFile
+from music21.midi.translate import streamToMidiFile
+from music21.note import Note
+from music21.stream.base import Measure, Part, Score
+from music21.tempo import MetronomeMark
+
+from processor import synth
+
+
+class FakeSynth:
+    def __init__(self):
+        self.player = None
+        self.resets = 0
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    made = []
+
+    def load_synth(soundfont=synth.SOUNDFONT):
+        made.append(FakeSynth())
+        return made[-1]
+
+    monkeypatch.setattr(synth, "load_synth", load_synth)
+    monkeypatch.setattr(
+        synth, "reset_synth", lambda fs: setattr(fs, "resets", fs.resets + 1)
+    )
+    return made
+
+
+def test_pool_reuses_synths(loads):
+    pool = synth.SynthPool(2)
+    for _ in range(5):
+        with pool.synth():
+            pass
+    assert len(loads) == 1
+
+
+def test_pool_is_bounded(loads):
+    pool = synth.SynthPool(2)
+    busy = []
+    seen = []
+    lock = threading.Lock()
+
+    def render():
+        with pool.synth() as fs:
+            with lock:
+                busy.append(fs)
+                seen.append((len(busy), len(set(map(id, busy)))))
+            time.sleep(0.01)
+            with lock:
+                busy.remove(fs)
+
+    threads = [threading.Thread(target=render) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 2
+    # never more than two at once, and never the same synth twice
+    assert all(n <= 2 and n == distinct for n, distinct in seen)
+
+
+def test_pool_warm_and_reset(loads):
+    pool = synth.SynthPool(3)
+    pool.warm(2)
+    assert len(loads) == 2
+    with pool.synth() as fs:
+        fs.player = object()
+    assert fs.resets == 1
+    pool.close()
+    assert pool.created == 0
+    assert all(fs.deleted for fs in loads)
+
+
+class PianoOnly:
+    def has_preset(self, bank, program):
+        return (bank, program) == (0, 0)
+
+
+def program_changes(mf: MidiFile):
+    return {
+        (e.channel, e.data)
+        for t in mf.tracks
+        for e in t.events
+        if e.type == ChannelVoiceMessages.PROGRAM_CHANGE
+    }
+
+
+def test_fit_programs():
+    s = Score()
+    for ins in (instrument.Piano(), instrument.Violin()):
+        p = Part()
+        p.insert(0, ins)
+        m = Measure(number=1)
+        m.append(Note("C4", quarterLength=4))
+        p.append(m)
+        s.insert(0, p)
+    mf = streamToMidiFile(s)
+    # one channel per instrument, mixed in the same file
+    assert program_changes(mf) == {(1, 0), (2, 40)}
+
+    played = MidiFile()
+    played.readstr(synth.fit_programs(mf, PianoOnly()))
+    assert program_changes(played) == {(1, 0), (2, 0)}
+    assert program_changes(mf) == {(1, 0), (2, 40)}
+
+
+def tempo_score():
+    # four quarters at 60 bpm, then four at 120: 4 + 2 seconds
+    p = Part()
+    for _ in range(8):
+        p.append(Note("C4", type="quarter"))
+    p.insert(0, MetronomeMark(number=60))
+    p.insert(4, MetronomeMark(number=120))
+    s = Score()
+    s.insert(0, p)
+    return s
+
+
+def test_tempo_map():
+    mf = streamToMidiFile(tempo_score())
+    tpq = mf.ticksPerQuarterNote
+    assert synth.tempo_map(mf) == [(0, 1000000), (4 * tpq, 500000)]
+    # music21 ends the track a quarter after the last note
+    assert synth.last_tick(mf) == 9 * tpq
+
+
+def test_ticks_to_seconds():
+    tempos = [(0, 1000000), (400, 500000)]
+    assert synth.ticks_to_seconds(0, tempos, 100) == 0
+    assert synth.ticks_to_seconds(200, tempos, 100) == pytest.approx(2)
+    assert synth.ticks_to_seconds(600, tempos, 100) == pytest.approx(5)
+    # no tempo event plays at 120 bpm
+    default = [(0, synth.DEFAULT_US_PER_QUARTER)]
+    assert synth.ticks_to_seconds(200, default, 100) == pytest.approx(1)
+
+
+def test_midi_length_seconds():
+    mf = streamToMidiFile(tempo_score())
+    # the notes, then the quarter before the end of track at 120 bpm
+    assert synth.midi_length_seconds(mf) == pytest.approx(6.5)
+
+
+def test_wav_header_matches_wave():
+    chunks = [np.zeros(2 * 100, dtype=np.int16)] * 3
+    assert synth.to_wav(iter(chunks))[:44] == synth.wav_header(300)
+
+
+def test_stream_wav():
+    chunks = [np.full(2 * 100, i, dtype=np.int16) for i in range(3)]
+    out = list(synth.stream_wav(iter(chunks)))
+    assert out[0] == synth.wav_header()
+    assert out[1:] == [c.tobytes() for c in chunks]
+    # the open sizes still read as a valid WAV
+    with wave.open(io.BytesIO(b"".join(out))) as wr:
+        assert wr.getframerate() == synth.SAMPLE_RATE
+        assert wr.readframes(300) == b"".join(out[1:])
+
+
+def test_write_wav():
+    chunks = [np.full(2 * 100, i, dtype=np.int16) for i in range(3)]
+    f = io.BytesIO()
+    assert synth.write_wav(iter(chunks), f) == 300
+    assert f.getvalue() == synth.to_wav(iter(chunks))
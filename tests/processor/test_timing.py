@@ -0,0 +1,37 @@
+import os
+
+from music21 import converter
+
+from processor import process, timing
+
+
+def test_span_without_recorder():
+    with timing.span("nobody"):
+        pass
+    assert timing.active.get() is None
+
+
+def test_recording():
+    with timing.recording() as recorder:
+        with timing.span("a"):
+            with timing.span("b"):
+                pass
+        timing.record("b", 1.0)
+    assert [name for name, _ in recorder.spans] == ["b", "a", "b"]
+    assert recorder.totals()["b"] >= 1.0
+    assert timing.active.get() is None
+
+
+def test_mutate_records_stages():
+    s = converter.parse(os.path.abspath("tests/data/twinkle.mxl"))
+    # the recorder must live in the timing module process imported
+    with process.timing.recording() as recorder:
+        process.mutate(s, seed=2, msgCallback=lambda *_: None)
+    names = {name for name, _ in recorder.spans}
+    assert {
+        "mutate.expand_repeats",
+        "mutate.setup",
+        "mutate.loop",
+        "mutate.build_parts",
+    } <= names
+    assert any(name.startswith("mutation.") for name in names)
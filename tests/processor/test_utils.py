@@ -2,6 +2,7 @@ import random
 from random import randint
 
 import pytest
+from music21 import instrument
 from music21.chord import Chord
 from music21.clef import BassClef, TrebleClef
 from music21.key import Key, KeySignature
@@ -125,3 +126,70 @@ def test_get_time(proper_score):
     for r, a in zip(times, correct):
         assert r.numerator == a.numerator
         assert r.denominator == a.denominator
+
+
+def test_time_signature_index(proper_score):
+    part = proper_score.getElementsByClass("Part")[0]
+    index = utils.TimeSignatureIndex(part)
+    measures = part.getElementsByClass("Measure")
+    for measure in measures:
+        ts = index.at(measure.offset)
+        expected = utils.get_time(measure, part)
+        assert ts.ratioString == expected.ratioString
+    assert index.at(-1) is None
+
+
+def programs_score(*instruments) -> Score:
+    s = Score()
+    for ins in instruments:
+        p = Part()
+        p.insert(0, ins)
+        m = Measure(number=1)
+        m.append(Note("C4", quarterLength=4))
+        p.append(m)
+        s.insert(0, p)
+    return s
+
+
+def test_duplicate_part_keeps_program():
+    s = programs_score(instrument.Violin())
+    dup = utils.duplicate_part(s.parts[0], "dup")
+    assert dup.getInstrument().midiProgram == 40
+
+
+def test_assign_programs():
+    s = programs_score(
+        instrument.Instrument("Flute"),
+        instrument.Instrument("Snare Drum"),
+        instrument.Instrument("Nothing Known"),
+        instrument.Violin(),
+    )
+    utils.assign_programs(s)
+    programs = [p.getInstrument().midiProgram for p in s.parts]
+    assert programs == [73, None, None, 40]
+    assert s.parts[1].getInstrument().midiChannel == 9
+
+
+def test_assigned_programs():
+    s = programs_score(
+        instrument.Instrument("Flute"),
+        instrument.Instrument("Snare Drum"),
+    )
+    channel = s.parts[1].getInstrument().midiChannel
+    with utils.assigned_programs(s):
+        assert s.parts[0].getInstrument().midiProgram == 73
+        assert s.parts[1].getInstrument().midiChannel == 9
+    assert s.parts[0].getInstrument().midiProgram is None
+    assert s.parts[1].getInstrument().midiChannel == channel
+
+
+def test_streams():
+    a = utils.Streams(7)
+    b = utils.Streams(7)
+    # draws of one key do not move another
+    first = [a(1, "choice").random() for _ in range(3)]
+    b(2, "choice").random()
+    assert [b(1, "choice").random() for _ in range(3)] == first
+    assert a(1, "choice") is a(1, "choice")
+    assert a.fresh(1, "choice").random() == first[0]
+    assert utils.Streams(8)(1, "choice").random() != first[0]